@@ -1,22 +1,97 @@
-from fastapi import FastAPI, HTTPException, Body, Request
-from pydantic import BaseModel
-from collections import defaultdict
-from typing import Optional
+from fastapi import FastAPI, HTTPException, Body, Request, Query
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
 import os
 from dotenv import load_dotenv
-from scripts.llm import test_case_prompt, llm_model
-from jira import JIRA
-from jira.exceptions import JIRAError
+from scripts import llm
+from scripts.engine import Feed, generation_engine
+from scripts.cache import create_result_cache
+from scripts.jira_fetch import (
+    HIERARCHY_FIELDS,
+    RELATED_FIELDS,
+    STORY_FIELDS,
+    epic_stories_jql,
+    fetch_issues,
+    field_text,
+    jql_datetime,
+    search_all,
+    search_pages,
+)
+from scripts.jira_pool import JiraError, create_session_pool
+from scripts.sync_store import create_snapshot_store, create_story_version_store
+from scripts.parser import TestCaseParser, parse_test_cases
+from scripts.metrics import (
+    METRICS_CONTENT_TYPE,
+    Gauge,
+    InFlightMiddleware,
+    client_disconnects,
+    render as render_metrics,
+    stage_seconds,
+)
+from scripts.tokens import estimate_tokens, merge_usage, sum_usage, token_usage
+from scripts.jobs import FINISHED, JobWorkers, create_job_queue
+from scripts.responses import CompressionMiddleware, conditional, not_modified
+from scripts.export import WRITERS, case_rows, stream_export
+from scripts.dedupe import deduplicate_suite
+from scripts.two_phase import generate_two_phase
+from scripts.incremental import IncrementalPlan, StoryDiff, regenerate
+from scripts.validation import (
+    hit_token_limit,
+    validate_and_repair,
+    validation_report,
+)
+from scripts.near_duplicates import (
+    adapt_content,
+    create_near_duplicate_index,
+    near_duplicate_lookups,
+    normalize_text,
+    story_text,
+)
+from scripts.webhooks import (
+    ignore_reason,
+    issue_tenant,
+    valid_signature,
+    webhook_events,
+)
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import (
+    ORJSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 import hashlib
+import json
+import orjson
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import time
 
 
 load_dotenv()
 
+
+@asynccontextmanager
+async def lifespan(app):
+    if os.getenv("LLM_WARMUP", "0").lower() in ("1", "true", "yes"):
+        # Build the model client before taking traffic instead of on the
+        # first request
+        await asyncio.to_thread(llm.warm_up)
+    job_queue.purge(older_than=JOB_RETENTION_SECONDS)
+    job_workers.start()
+    yield
+    await job_workers.stop()
+    await jira_sessions.close_all()
+    test_case_cache.flush()
+
+
 app = FastAPI(
     title="Test Case Generator API",
     description="API for generating test cases based on user stories",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 # Add CORS middleware to allow cross-origin requests
 app.add_middleware(
@@ -26,6 +101,13 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
 )
+# gzip (or brotli, when installed) for larger bodies, streams included
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MINIMUM_BYTES", "1024")),
+)
+# Track requests in flight for /metrics
+app.add_middleware(InFlightMiddleware)
 
 
 @app.get("/")
@@ -59,159 +141,1465 @@ class IssueFetchResponse(BaseModel):
     stories: list[StoryItem] = []
 
 
+class RelatedIssue(BaseModel):
+    key: str
+    summary: str = ""
+    issue_type: Optional[str] = None
+    status: Optional[str] = None
+    relation: str  # "subtask", or the link as seen from the story
+    description: Optional[str] = None  # Only fetched for criteria issues
+    acceptance_criteria: bool = False  # Part of the story's criteria
+
+
+class StoryHierarchyItem(StoryItem):
+    acceptance_criteria: Optional[str] = None
+    custom_fields: dict[str, Optional[str]] = {}
+    subtasks: list[RelatedIssue] = []
+    linked_issues: list[RelatedIssue] = []
+
+
+class HierarchyFetchRequest(IssueFetchRequest):
+    # Where acceptance criteria live; None falls back to JIRA_AC_FIELDS,
+    # JIRA_AC_SUBTASK_TYPES and JIRA_AC_LINK_TYPES
+    acceptance_criteria_fields: Optional[list[str]] = None  # customfield_...
+    subtask_types: Optional[list[str]] = None  # Empty: every subtask
+    link_types: Optional[list[str]] = None  # Link names, e.g. "is tested by"
+
+
+class HierarchyFetchResponse(IssueFetchResponse):
+    stories: list[StoryHierarchyItem] = []
+
+
+GenerationMode = Literal["single", "two_phase"]
+
+
 class TestCaseRequest(BaseModel):
     user_story: str
     jira_id: str
     acceptance_criteria: Optional[str] = None
+    # Jira site the story belongs to; with valid credentials it becomes
+    # the tenant that quota, story versions and reuse are scoped to
+    domain: Optional[str] = None
+    email: Optional[str] = None
+    jira_token: Optional[str] = None
+    # Set by the server (see client_request), never taken from the body
+    tenant: Optional[str] = None
+    priority: int = 0  # Higher priorities are sent to the model first
+    # two_phase: outline the scenarios, then generate them in parallel
+    mode: GenerationMode = "single"
+    # Reuse the suite of a story at least this similar; 1 disables reuse
+    similarity_threshold: Optional[float] = Field(None, ge=0, le=1)
+
+
+class EpicSyncRequest(IssueFetchRequest):
+    full: bool = False  # Ignore the stored snapshot and re-download everything
+
+
+class EpicSyncResponse(IssueFetchResponse):
+    synced_at: str
+    incremental: bool
+    changed: list[str] = []  # Stories added or modified since the last sync
 
 
-cached_dict = defaultdict(dict)
+class EpicTestCaseRequest(HierarchyFetchRequest):
+    concurrency: Optional[int] = None  # Stories generated in parallel
+    mode: GenerationMode = "single"
+    # Bulk-fetch subtasks, links and criteria fields into the prompts
+    hierarchy: bool = False
+    # Finish with the epic's suite, near-duplicate cases merged
+    dedupe: bool = False
+    dedupe_threshold: Optional[float] = Field(None, ge=0, le=1)
+
+
+class EpicDedupeRequest(IssueFetchRequest):
+    # Cosine similarity at which two test cases count as duplicates
+    threshold: Optional[float] = Field(None, ge=0, le=1)
+
+
+# Async Jira sessions keyed on the full credentials, evicted when idle
+jira_sessions = create_session_pool()
 
 
 @app.post("/authenticate")
 async def authenticate_jira(request: IssueFetchRequest = Body(...)):
     try:
-        jira = JIRA(
-            server=request.domain, basic_auth=(request.email, request.jira_token)
+        jira = get_jira_client(request)
+        # Verify credentials by calling myself(), reused for a short window
+        user = await jira_sessions.authenticate(jira)
+
+        return {"status": "authenticated", "username": user.get("displayName")}
+    except Exception as e:
+        raise jira_http_exception(e)
+
+
+def get_jira_client(request):
+    return jira_sessions.get(request.domain, request.email, request.jira_token)
+
+
+def story_item_from_raw(issue, epic_id):
+    fields = issue.get("fields", {})
+
+    # Extract assignee name, priority and status from their nested objects
+    assignee = (fields.get("assignee") or {}).get("displayName")
+    priority = (fields.get("priority") or {}).get("name")
+    status = (fields.get("status") or {}).get("name")
+
+    return StoryItem(
+        key=issue["key"],
+        summary=fields.get("summary") or "",
+        description=fields.get("description"),
+        priority=priority,
+        status=status,
+        assignee=assignee,
+        due_date=fields.get("duedate"),
+        epic_link=epic_id,
+        tags=fields.get("labels") or [],
+    )
+
+
+async def fetch_epic(jira, epic_id):
+    epic = await jira.issue(epic_id, fields=["summary", "description"])
+    return IssueFetchResponse(
+        epic_key=epic["key"],
+        epic_summary=epic["fields"].get("summary") or "",
+        epic_description=epic["fields"].get("description"),
+    )
+
+
+async def fetch_epic_with_stories(jira, epic_id):
+    epic = await fetch_epic(jira, epic_id)
+    issues = await search_all(jira, epic_stories_jql(epic_id), STORY_FIELDS)
+    epic.stories = [story_item_from_raw(issue, epic_id) for issue in issues]
+    return epic
+
+
+def env_list(name):
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+
+ACCEPTANCE_CRITERIA_FIELDS = env_list("JIRA_AC_FIELDS")
+ACCEPTANCE_CRITERIA_SUBTASK_TYPES = env_list("JIRA_AC_SUBTASK_TYPES")
+ACCEPTANCE_CRITERIA_LINK_TYPES = env_list("JIRA_AC_LINK_TYPES")
+
+
+def criteria_settings(request):
+    def pick(value, default):
+        return default if value is None else value
+
+    return (
+        pick(request.acceptance_criteria_fields, ACCEPTANCE_CRITERIA_FIELDS),
+        {
+            name.lower()
+            for name in pick(request.subtask_types, ACCEPTANCE_CRITERIA_SUBTASK_TYPES)
+        },
+        {
+            name.lower()
+            for name in pick(request.link_types, ACCEPTANCE_CRITERIA_LINK_TYPES)
+        },
+    )
+
+
+def related_item(raw, relation, acceptance_criteria):
+    fields = raw.get("fields") or {}
+    return RelatedIssue(
+        key=raw["key"],
+        summary=fields.get("summary") or "",
+        issue_type=(fields.get("issuetype") or {}).get("name"),
+        status=(fields.get("status") or {}).get("name"),
+        relation=relation,
+        acceptance_criteria=acceptance_criteria,
+    )
+
+
+def issue_links(fields):
+    # (link type name, relation, linked issue) of every issue link
+    for link in fields.get("issuelinks") or []:
+        link_type = link.get("type") or {}
+        name = link_type.get("name") or ""
+        for side, direction in (("outwardIssue", "outward"), ("inwardIssue", "inward")):
+            if link.get(side):
+                yield name, link_type.get(direction) or name, link[side]
+
+
+def story_hierarchy_item(issue, epic_id, criteria_fields, subtask_types, link_types):
+    fields = issue.get("fields") or {}
+    story = StoryHierarchyItem(**story_item_from_raw(issue, epic_id).model_dump())
+    story.custom_fields = {
+        name: field_text(fields.get(name)) or None for name in criteria_fields
+    }
+    for raw in fields.get("subtasks") or []:
+        issue_type = ((raw.get("fields") or {}).get("issuetype") or {}).get("name")
+        counts = not subtask_types or (issue_type or "").lower() in subtask_types
+        story.subtasks.append(related_item(raw, "subtask", counts))
+    for name, relation, raw in issue_links(fields):
+        counts = bool({name.lower(), relation.lower()} & link_types)
+        story.linked_issues.append(related_item(raw, relation, counts))
+    return story
+
+
+def acceptance_criteria_text(story, criteria_fields, details):
+    # Criteria fields first, then one bullet per criteria subtask or link
+    # with its description and criteria fields indented below
+    parts = [story.custom_fields[name] for name in criteria_fields]
+    for item in story.subtasks + story.linked_issues:
+        if not item.acceptance_criteria:
+            continue
+        fields = (details.get(item.key) or {}).get("fields") or {}
+        texts = [item.description]
+        texts += [field_text(fields.get(name)) for name in criteria_fields]
+        lines = [f"- {item.summary}"]
+        lines += [
+            f"  {line.strip()}"
+            for text in texts
+            if text
+            for line in text.splitlines()
+            if line.strip()
+        ]
+        parts.append("\n".join(lines))
+    return "\n".join(filter(None, parts)) or None
+
+
+async def fetch_epic_hierarchy(jira, request):
+    # Epic, stories with their subtasks and links, and the text of the
+    # issues that hold acceptance criteria, in one request for the epic,
+    # one per page of stories and one per JIRA_KEYS_PER_SEARCH criteria
+    # issues, run concurrently
+    criteria_fields, subtask_types, link_types = criteria_settings(request)
+    epic, issues = await asyncio.gather(
+        fetch_epic(jira, request.jira_id),
+        search_all(
+            jira,
+            epic_stories_jql(request.jira_id),
+            HIERARCHY_FIELDS + criteria_fields,
+        ),
+    )
+    stories = [
+        story_hierarchy_item(
+            issue, request.jira_id, criteria_fields, subtask_types, link_types
+        )
+        for issue in issues
+    ]
+
+    keys = sorted(
+        {
+            item.key
+            for story in stories
+            for item in story.subtasks + story.linked_issues
+            if item.acceptance_criteria
+        }
+    )
+    details = {}
+    if keys:
+        details = await fetch_issues(jira, keys, RELATED_FIELDS + criteria_fields)
+    for story in stories:
+        for item in story.subtasks + story.linked_issues:
+            fields = (details.get(item.key) or {}).get("fields") or {}
+            item.description = field_text(fields.get("description")) or None
+        story.acceptance_criteria = acceptance_criteria_text(
+            story, criteria_fields, details
         )
-        # Verify credentials by calling myself()
-        user = jira.myself()
 
-        # Store the authenticated JIRA client in cache for later use
-        cache_key = f"{request.domain}:{request.email}"
-        cached_dict[cache_key] = jira
+    return HierarchyFetchResponse(
+        **epic.model_dump(exclude={"stories"}), stories=stories
+    )
 
-        return {"status": "authenticated", "username": user.get("displayName")}
-    except JIRAError as e:
+
+async def stream_epic_stories(jira, epic):
+    try:
+        pages = search_pages(jira, epic_stories_jql(epic.epic_key), STORY_FIELDS)
+        async for start_at, total, issues in pages:
+            if start_at == 0:
+                header = epic.model_dump(exclude={"stories"})
+                yield ndjson_line({"type": "epic", "total": total, **header})
+            for issue in issues:
+                story = story_item_from_raw(issue, epic.epic_key)
+                yield ndjson_line({"type": "story", **story.model_dump()})
+    except Exception as e:
+        yield ndjson_line({"type": "error", "detail": jira_http_exception(e).detail})
+
+
+# Last synced story snapshot per epic, shared by all worker processes
+epic_snapshots = create_snapshot_store()
+
+
+async def sync_epic_stories(jira, request):
+    # Taken before querying so edits made during the sync show up next time
+    started_at = time.time()
+    epic = await fetch_epic(jira, request.jira_id)
+
+    # Per user, since what a sync returns depends on what they can see
+    credentials = jira_sessions.credentials_key(
+        request.domain, request.email, request.jira_token
+    )
+    snapshot = None
+    if not request.full:
+        snapshot = epic_snapshots.load(credentials, request.jira_id)
+    if snapshot is None:
+        issues = await search_all(jira, epic_stories_jql(request.jira_id), STORY_FIELDS)
+        previous, merged = {}, {}
+    else:
+        last_sync, _, stories = snapshot
+        user = await jira_sessions.authenticate(jira)
+        since = jql_datetime(last_sync, user.get("timeZone") or "UTC")
+        jql = epic_stories_jql(request.jira_id, updated_since=since)
+        previous = {story["key"]: story for story in stories}
+        # The changes, and the keys of every story still in the epic so
+        # deleted or moved ones drop out of the snapshot
+        issues, current = await asyncio.gather(
+            search_all(jira, jql, STORY_FIELDS),
+            search_all(jira, epic_stories_jql(request.jira_id), []),
+        )
+        current = {issue["key"] for issue in current}
+        merged = {key: story for key, story in previous.items() if key in current}
+
+    changed = []
+    for issue in issues:
+        story = story_item_from_raw(issue, request.jira_id).model_dump()
+        if previous.get(story["key"]) != story:
+            changed.append(story["key"])
+        merged[story["key"]] = story
+
+    stories = [merged[key] for key in sorted(merged, key=issue_key_order)]
+    epic_snapshots.save(
+        credentials,
+        request.jira_id,
+        started_at,
+        epic.model_dump(exclude={"stories"}),
+        stories,
+    )
+
+    return EpicSyncResponse(
+        **epic.model_dump(exclude={"stories"}),
+        stories=stories,
+        synced_at=datetime.fromtimestamp(started_at, timezone.utc).isoformat(),
+        incremental=snapshot is not None,
+        changed=sorted(changed, key=issue_key_order),
+    )
+
+
+def issue_key_order(key):
+    # PROJ-9 sorts before PROJ-10, the same way Jira orders by key
+    project, _, number = key.rpartition("-")
+    return (project, int(number) if number.isdigit() else 0)
+
+
+def jira_http_exception(e):
+    if isinstance(e, JiraError):
         if e.status_code == 401:
-            raise HTTPException(
+            return HTTPException(
                 status_code=401, detail="Authentication failed: Invalid credentials"
             )
-        raise HTTPException(
+        return HTTPException(
             status_code=e.status_code or 500, detail=f"JIRA Error: {str(e)}"
         )
+    return HTTPException(
+        status_code=500, detail=f"Error connecting with JIRA: {str(e)}"
+    )
+
+
+@app.post("/sync-stories")
+async def sync_stories(request: EpicSyncRequest = Body(...)):
+    try:
+        jira = get_jira_client(request)
+        return await sync_epic_stories(jira, request)
     except Exception as e:
-        raise HTTPException(
-            status_code=500, detail=f"Error connecting with JIRA: {str(e)}"
-        )
+        raise jira_http_exception(e)
 
 
 @app.post("/fetch-stories")
-async def fetch_epic_stories(request: IssueFetchRequest = Body(...)):
+async def fetch_epic_stories(
+    http_request: Request, request: IssueFetchRequest = Body(...), stream: bool = False
+):
     try:
-        # Get cached JIRA client or create new one if not cached
-        cache_key = f"{request.domain}:{request.email}"
-        jira = cached_dict.get(cache_key)
+        jira = get_jira_client(request)
+        if not stream:
+            epic = await fetch_epic_with_stories(jira, request.jira_id)
+            return conditional(http_request, json_response(epic.model_dump()))
 
-        if not jira:
-            jira = JIRA(
-                server=request.domain, basic_auth=(request.email, request.jira_token)
+        # Stream stories as NDJSON while the pages arrive from Jira
+        epic = await fetch_epic(jira, request.jira_id)
+        return StreamingResponse(
+            stream_epic_stories(jira, epic), media_type="application/x-ndjson"
+        )
+    except Exception as e:
+        raise jira_http_exception(e)
+
+
+@app.post("/fetch-story-hierarchy")
+async def fetch_story_hierarchy(
+    http_request: Request, request: HierarchyFetchRequest = Body(...)
+):
+    # Stories with subtasks, linked issues and acceptance criteria in the
+    # form TestCaseRequest.acceptance_criteria takes
+    try:
+        jira = get_jira_client(request)
+        epic = await fetch_epic_hierarchy(jira, request)
+        return conditional(http_request, json_response(epic.model_dump()))
+    except Exception as e:
+        raise jira_http_exception(e)
+
+
+# Highest priority a client may ask for; batch and prewarm work run below 0
+MAX_CLIENT_PRIORITY = int(os.getenv("MAX_CLIENT_PRIORITY", "0"))
+CREDENTIAL_FIELDS = {"email", "jira_token"}
+
+
+async def client_request(http_request, request):
+    # The request with a tenant the server vouches for: the Jira site of
+    # credentials that authenticate, otherwise the client's address. The
+    # priority is clamped so no caller can jump ahead of everyone else.
+    if request.domain and request.email and request.jira_token:
+        try:
+            jira = jira_sessions.get(
+                request.domain, request.email, request.jira_token
             )
-            cached_dict[cache_key] = jira
+            await jira_sessions.authenticate(jira)
+        except Exception as e:
+            raise jira_http_exception(e)
+        tenant = jira.domain
+    else:
+        host = http_request.client.host if http_request.client else "unknown"
+        tenant = f"client:{host}"
+    priority = min(max(request.priority, PREWARM_PRIORITY), MAX_CLIENT_PRIORITY)
+    return request.model_copy(update={"tenant": tenant, "priority": priority})
+
+
+def create_cache_key(user_story, jira_id, acceptance_criteria):
+    combined = f"{user_story}|{jira_id}|{acceptance_criteria}"
+    return hashlib.md5(combined.encode()).hexdigest()
+
+
+# Completion size assumed when reserving tokens-per-minute quota; settled
+# against the real usage once the call finishes
+EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "8000"))
+
+# Batch work yields to interactive requests in the LLM queue
+BATCH_PRIORITY = -1
+
+# Generated test cases, shared by all worker processes on this host
+test_case_cache = create_result_cache()
+
+
+def request_cache_key(request):
+    # Whitespace, casing and Jira wiki markup do not change the key
+    cache_key = create_cache_key(
+        normalize_text(request.user_story),
+        request.jira_id,
+        normalize_text(request.acceptance_criteria),
+    )
+    if request.mode != "single":
+        # Same story, differently generated document
+        cache_key = f"{request.mode}:{cache_key}"
+    return cache_key
+
+
+def format_test_case_prompt(request):
+    with stage_seconds.time(stage="prompt_format"):
+        return llm.test_case_prompt.format(
+            user_story=request.user_story,
+            jira_id=request.jira_id,
+            acceptance_criteria=request.acceptance_criteria or "",
+        )
+
+
+def build_result(content, usage, scenarios=None):
+    # Parsed scenarios ship alongside the markdown so clients do not have
+    # to re-parse it themselves
+    if scenarios is None:
+        scenarios = parse_test_cases(content)
+    return {
+        "content": content,
+        # Kept for existing clients, now the completion token count
+        "token_count": usage["completion_tokens"],
+        **usage,
+        "scenarios": [scenario.to_dict() for scenario in scenarios],
+    }
+
+
+# Inputs each story's latest suite was generated from, the base that
+# /regenerate-test-cases diffs an edited story against
+story_versions = create_story_version_store()
+
+
+# Shingle signatures of cached suites' inputs, for reuse by clones
+near_duplicates = create_near_duplicate_index()
+
+
+def store_result(cache_key, request, result):
+    test_case_cache.set(cache_key, result)
+    story_versions.save(
+        request.tenant,
+        request.jira_id,
+        cache_key,
+        request.user_story,
+        request.acceptance_criteria,
+    )
+    near_duplicates.add(
+        cache_key,
+        request.tenant,
+        request.mode,
+        request.jira_id,
+        story_text(request.user_story, request.acceptance_criteria),
+    )
+
+
+def cached_result(cache_key):
+    result = test_case_cache.get(cache_key)
+    if result is None or ("scenarios" in result and "validation" in result):
+        return result
+    if "scenarios" not in result:
+        # Entries cached before results carried parsed scenarios
+        scenarios = parse_test_cases(result["content"])
+        result["scenarios"] = [scenario.to_dict() for scenario in scenarios]
+    if "validation" not in result:
+        # Entries cached before results were validated, or by a path that
+        # skipped it; they are checked but not repaired
+        result["validation"] = validation_report(result["content"])
+    test_case_cache.set(cache_key, result)
+    return result
+
+
+def find_near_duplicate(request):
+    # (cached suite, explanation) for the most similar of the tenant's
+    # other indexed stories at or above the similarity threshold; the suite
+    # is None on a miss
+    threshold = request.similarity_threshold
+    if threshold is None:
+        threshold = near_duplicates.threshold
+    explanation = {"match": "miss", "threshold": threshold}
+    if threshold >= 1:
+        return None, {**explanation, "reason": "near-duplicate reuse disabled"}
+
+    text = story_text(request.user_story, request.acceptance_criteria)
+    candidates = near_duplicates.candidates(
+        request.tenant, request.mode, request.jira_id, text
+    )
+    explanation["candidates"] = len(candidates)
+    for candidate in candidates:
+        if candidate["adapted_similarity"] < threshold:
+            break
+        if candidate["meaning_changes"]:
+            continue
+        source = test_case_cache.get(candidate["cache_key"])
+        if source is None:
+            # Evicted from the result cache since it was indexed
+            near_duplicates.remove(candidate["cache_key"])
+            continue
+        return source, {
+            **explanation,
+            "match": "near",
+            **similarity_report(candidate),
+            "source_cache_key": candidate["cache_key"],
+            "substitutions": [
+                {"before": before, "after": after}
+                for before, after in candidate["substitutions"]
+            ],
+            "differences_not_adapted": candidate["differences"],
+        }
+
+    if candidates and candidates[0]["meaning_changes"]:
+        return None, {
+            **explanation,
+            "reason": "most similar story differs in numbers or negations",
+            **similarity_report(candidates[0]),
+            "differences_not_adapted": candidates[0]["meaning_changes"],
+        }
+    if candidates and candidates[0]["adapted_similarity"] < threshold:
+        return None, {
+            **explanation,
+            "reason": "most similar story is below the threshold",
+            **similarity_report(candidates[0]),
+        }
+    return None, {**explanation, "reason": "no similar story cached"}
+
 
-        epic = jira.issue(request.jira_id)
+def similarity_report(candidate):
+    return {
+        "similarity": round(candidate["adapted_similarity"], 4),
+        "raw_similarity": round(candidate["similarity"], 4),
+        "estimated_similarity": round(candidate["estimate"], 4),
+        "source_jira_id": candidate["jira_id"],
+    }
 
-        jql_query = (
-            f'"Epic Link" = {request.jira_id} AND issuetype = Story ORDER BY key ASC'
+
+def near_duplicate_result(cache_key, request):
+    # A clone's suite adapted to this story and cached under its key
+    source, explanation = find_near_duplicate(request)
+    near_duplicate_lookups.inc(outcome="hit" if source is not None else "miss")
+    if source is None:
+        return None
+
+    pairs = [(item["before"], item["after"]) for item in explanation["substitutions"]]
+    content = adapt_content(
+        source["content"], pairs, explanation["source_jira_id"], request.jira_id
+    )
+    usage = {
+        name: source.get(name, 0)
+        for name in ("prompt_tokens", "completion_tokens", "total_tokens")
+    }
+    usage["token_source"] = source.get("token_source", "estimate")
+    result = build_result(content, usage)
+    if "validation" in source:
+        # Adapting swaps phrases, the document keeps its structure
+        result["validation"] = source["validation"]
+    result["reused_from"] = explanation
+    store_result(cache_key, request, result)
+    return result
+
+
+async def run_llm_generation(cache_key, request, formatted_prompt):
+    async def invoke():
+        with stage_seconds.time(stage="llm_call"):
+            response = await llm.llm_model.ainvoke(formatted_prompt)
+        usage = token_usage(
+            formatted_prompt,
+            response.content,
+            getattr(response, "usage_metadata", None),
         )
-        stories = jira.search_issues(jql_query, maxResults=100)
+        metadata = getattr(response, "response_metadata", None)
+        return {
+            "content": response.content,
+            "truncated": hit_token_limit(metadata),
+            **usage,
+        }
 
-        story_items = []
-        for story in stories:
-            # Extract labels/tags
-            tags = story.fields.labels if hasattr(story.fields, "labels") else []
+    # Admitted on its own, so repair calls do not wait for its slot
+    usage = await generation_engine.call(
+        invoke, **admission(request, formatted_prompt)
+    )
+    content = usage.pop("content")
+    truncated = usage.pop("truncated")
+    result = await checked_result(request, content, usage, truncated)
 
-            # Extract assignee name
-            assignee = (
-                story.fields.assignee.displayName if story.fields.assignee else None
-            )
+    # Cache the response
+    store_result(cache_key, request, result)
 
-            # Extract priority, status, due date
-            priority = (
-                story.fields.priority.name
-                if hasattr(story.fields.priority, "name")
-                else None
-            )
-            status = story.fields.status.name if hasattr(story.fields, "name") else None
-            due_date = (
-                story.fields.duedate if hasattr(story.fields, "duedate") else None
-            )
+    return result
+
+
+async def checked_result(request, content, usage, truncated=False, scenarios=None):
+    # A document that breaks the test_case_prompt format gets only its
+    # broken or missing sections generated again and spliced in; the
+    # outcome is kept with the result under "validation"
+    inputs = prompt_inputs(request)
+    repaired, usages, report = await validate_and_repair(
+        content,
+        scheduled_call(request),
+        lambda validation: llm.format_repair_prompt.format(
+            **validation.prompt_fields(), **inputs
+        ),
+        truncated,
+    )
+    if repaired != content:
+        scenarios = None
+    result = build_result(repaired, sum_usage([usage] + usages), scenarios)
+    result["validation"] = report
+    return result
 
-            story_items.append(
-                StoryItem(
-                    key=story.key,
-                    summary=story.fields.summary,
-                    description=story.fields.description,
-                    priority=priority,
-                    status=status,
-                    assignee=assignee,
-                    due_date=due_date,
-                    epic_link=request.jira_id,
-                    tags=tags,
-                )
+
+def admission(request, formatted_prompt, completion_tokens=EXPECTED_COMPLETION_TOKENS):
+    # Tenant, priority and estimated token spend for the LLM scheduler
+    return {
+        "tenant": request.tenant or "default",
+        "priority": request.priority,
+        "tokens": estimate_tokens(formatted_prompt) + completion_tokens,
+    }
+
+
+def prompt_inputs(request):
+    return {
+        "user_story": request.user_story,
+        "jira_id": request.jira_id,
+        "acceptance_criteria": request.acceptance_criteria or "",
+    }
+
+
+def scheduled_call(request):
+    # call(prompt, completion_tokens) -> (content, usage) for documents
+    # built from several model calls
+    async def call(prompt, completion_tokens):
+        # Every call is admitted by the scheduler on its own
+        async def invoke():
+            with stage_seconds.time(stage="llm_call"):
+                response = await llm.llm_model.ainvoke(prompt)
+            usage = token_usage(
+                prompt, response.content, getattr(response, "usage_metadata", None)
             )
+            return {"content": response.content, **usage}
 
-        return IssueFetchResponse(
-            epic_key=epic.key,
-            epic_summary=epic.fields.summary,
-            epic_description=epic.fields.description,
-            stories=story_items,
+        result = await generation_engine.call(
+            invoke, **admission(request, prompt, completion_tokens)
         )
-    except JIRAError as e:
-        if e.status_code == 401:
-            raise HTTPException(
-                status_code=401, detail="Authentication failed: Invalid credentials"
+        return result.pop("content"), result
+
+    return call
+
+
+async def run_two_phase_generation(cache_key, request):
+    inputs = prompt_inputs(request)
+    with stage_seconds.time(stage="prompt_format"):
+        outline_prompt = llm.scenario_outline_prompt.format(**inputs)
+    content, usages = await generate_two_phase(
+        scheduled_call(request),
+        outline_prompt,
+        lambda title: llm.scenario_test_cases_prompt.format(
+            scenario=title, **inputs
+        ),
+    )
+
+    result = await checked_result(request, content, sum_usage(usages))
+    store_result(cache_key, request, result)
+    return result
+
+
+async def generate_result(cache_key, request):
+    reused = near_duplicate_result(cache_key, request)
+    if reused is not None:
+        return reused
+
+    if request.mode == "two_phase":
+        return await generation_engine.coalesce(
+            cache_key, lambda: run_two_phase_generation(cache_key, request)
+        )
+
+    formatted_prompt = format_test_case_prompt(request)
+
+    # Identical concurrent requests share one upstream LLM call
+    return await generation_engine.coalesce(
+        cache_key, lambda: run_llm_generation(cache_key, request, formatted_prompt)
+    )
+
+
+def json_response(result):
+    with stage_seconds.time(stage="serialization"):
+        return ORJSONResponse(result)
+
+
+def result_etag(cache_key, result):
+    # Cache key plus a digest of the document, so a regenerated document
+    # for the same inputs gets a new tag
+    digest = hashlib.blake2b(result["content"].encode(), digest_size=8).hexdigest()
+    return f'"{cache_key}.{digest}"'
+
+
+def result_response(http_request, cache_key, result, cache_status):
+    # The tag is known up front, so a 304 skips serialization entirely
+    etag = result_etag(cache_key, result)
+    unchanged = not_modified(http_request, etag)
+    if unchanged is not None:
+        return unchanged
+    response = json_response(result)
+    response.headers["ETag"] = etag
+    # hit, near (adapted from a similar story, see reused_from) or miss
+    response.headers["X-Cache"] = cache_status
+    return response
+
+
+# Non-standard status for a request its client abandoned; nobody reads it
+CLIENT_CLOSED_REQUEST = 499
+
+
+async def client_disconnect(http_request):
+    # Returns once the client has gone away. The body has already been
+    # read, so the next message the server sends is the disconnect.
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+def count_disconnect(endpoint, cache_key=None):
+    # Before the request's own waiter is cancelled: the generation goes
+    # on if other requests are coalesced on it as well
+    shared = cache_key is not None and generation_engine.waiters(cache_key) > 1
+    client_disconnects.inc(
+        endpoint=endpoint, outcome="shared" if shared else "cancelled"
+    )
+
+
+async def unless_disconnected(http_request, awaitable, endpoint, cache_key=None):
+    # Result of awaitable, or None when the client disconnects first; the
+    # work is then cancelled (see GenerationEngine for coalesced waiters)
+    work = asyncio.ensure_future(awaitable)
+    disconnect = asyncio.ensure_future(client_disconnect(http_request))
+    try:
+        await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if work.done():
+            return work.result()
+        count_disconnect(endpoint, cache_key)
+        work.cancel()
+        await asyncio.gather(work, return_exceptions=True)
+        return None
+    finally:
+        disconnect.cancel()
+        work.cancel()
+
+
+def watches_disconnect(http_request):
+    # Before ASGI spec 2.4 Starlette's StreamingResponse listens for the
+    # disconnect itself and cancels the body iterator
+    spec = http_request.scope.get("asgi", {}).get("spec_version", "2.0")
+    return tuple(map(int, spec.split("."))) < (2, 4)
+
+
+async def relay_until_disconnected(http_request, events, endpoint, cache_key=None):
+    # Relays a streamed response until the client disconnects, cancelling
+    # the generator wherever it waits: on the model's stream, a coalesced
+    # generation or the stories of an epic. Where the server does not
+    # report the disconnect, it is watched for here; writing to a closed
+    # connection would only notice at the next event.
+    if watches_disconnect(http_request):
+        disconnect = None
+    else:
+        disconnect = asyncio.ensure_future(client_disconnect(http_request))
+    step = None
+    finished = False
+    try:
+        while True:
+            step = asyncio.ensure_future(anext(events))
+            await asyncio.wait(
+                {step, disconnect} - {None}, return_when=asyncio.FIRST_COMPLETED
             )
-        raise HTTPException(
-            status_code=e.status_code or 500, detail=f"JIRA Error: {str(e)}"
+            if not step.done():
+                return
+            try:
+                event = step.result()
+            except StopAsyncIteration:
+                finished = True
+                return
+            yield event
+    except Exception:
+        finished = True
+        raise
+    finally:
+        if not finished:
+            count_disconnect(endpoint, cache_key)
+        if disconnect is not None:
+            disconnect.cancel()
+        if step is not None and not step.done():
+            # The generator must be idle before it can be closed
+            step.cancel()
+            await asyncio.gather(step, return_exceptions=True)
+        await events.aclose()
+
+
+@app.post("/generate-test-cases")
+async def generate_test_cases(
+    http_request: Request, request: TestCaseRequest = Body(...)
+):
+    request = await client_request(http_request, request)
+    try:
+        # Create a cache key based on input parameters
+        cache_key = request_cache_key(request)
+
+        # Check if we have a cached response
+        cached = cached_result(cache_key)
+        if cached is not None:
+            return result_response(http_request, cache_key, cached, "hit")
+
+        result = await unless_disconnected(
+            http_request,
+            generate_result(cache_key, request),
+            "generate-test-cases",
+            cache_key,
         )
+        if result is None:
+            return Response(status_code=CLIENT_CLOSED_REQUEST)
+        cache_status = "near" if "reused_from" in result else "miss"
+        return result_response(http_request, cache_key, result, cache_status)
+
     except Exception as e:
         raise HTTPException(
-            status_code=500, detail=f"Error connecting with JIRA: {str(e)}"
+            status_code=500, detail=f"Error generating test cases: {str(e)}"
         )
 
 
-def create_cache_key(user_story, jira_id, acceptance_criteria):
-    combined = f"{user_story}|{jira_id}|{acceptance_criteria}"
-    return hashlib.md5(combined.encode()).hexdigest()
+async def run_regeneration(cache_key, request):
+    # The suite for the edited story, revising the latest suite of the
+    # same story where the edit is small enough; returns (result, changes)
+    cached = cached_result(cache_key)
+    if cached is not None:
+        return cached, {"strategy": "cached", "reason": "inputs already generated"}
 
+    previous = story_versions.load(request.tenant, request.jira_id)
+    base = cached_result(previous["cache_key"]) if previous else None
+    if base is None:
+        result = await generate_result(cache_key, request)
+        return result, {"strategy": "full", "reason": "no earlier suite to revise"}
 
-test_case_cache = {}
+    diff = StoryDiff(
+        previous["user_story"],
+        previous["acceptance_criteria"],
+        request.user_story,
+        request.acceptance_criteria,
+    )
+    plan = IncrementalPlan(diff, base["content"])
+    changes = {"base_cache_key": previous["cache_key"], "story_diff": diff.report()}
+    if plan.full_reason is not None:
+        result = await generate_result(cache_key, request)
+        return result, {"strategy": "full", "reason": plan.full_reason, **changes}
 
+    inputs = prompt_inputs(request)
+    content, usages, report = await regenerate(
+        plan,
+        scheduled_call(request),
+        lambda summary, scenario: llm.scenario_revision_prompt.format(
+            changes=summary, scenario=scenario, **inputs
+        ),
+        lambda summary, existing: llm.added_scenarios_prompt.format(
+            changes=summary, existing=existing, **inputs
+        ),
+    )
+    # Validated and repaired like every other generated document
+    result = await checked_result(request, content, sum_usage(usages))
+    store_result(cache_key, request, result)
+    reason = "whitespace only" if diff.unchanged else "story edited"
+    changes.update(report, llm_calls=len(usages))
+    return result, {"strategy": "incremental", "reason": reason, **changes}
 
-@app.post("/generate-test-cases")
-async def generate_test_cases(request: TestCaseRequest = Body(...)):
+
+@app.post("/regenerate-test-cases")
+async def regenerate_test_cases(
+    http_request: Request, request: TestCaseRequest = Body(...)
+):
+    # Like /generate-test-cases, but an edited story only has the
+    # scenarios its edit touches regenerated; unchanged scenarios keep
+    # their TS_/TC_ ids. The response adds a report of what changed.
+    request = await client_request(http_request, request)
     try:
-        # Create a cache key based on input parameters
-        cache_key = create_cache_key(
-            request.user_story, request.jira_id, request.acceptance_criteria or ""
+        cache_key = request_cache_key(request)
+        result, changes = await generation_engine.coalesce(
+            f"regenerate:{cache_key}", lambda: run_regeneration(cache_key, request)
+        )
+        return json_response({**result, "changes": changes})
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error regenerating test cases: {str(e)}"
         )
 
-        # Check if we have a cached response
-        if cache_key in test_case_cache:
-            return test_case_cache[cache_key]
 
-        formatted_prompt = test_case_prompt.format(
-            user_story=request.user_story,
-            jira_id=request.jira_id,
-            acceptance_criteria=request.acceptance_criteria or "",
+def sse_event(event, data):
+    return b"event: %s\ndata: %s\n\n" % (event.encode(), orjson.dumps(data))
+
+
+async def stream_completion(cache_key, request, feed):
+    # One streamed generation, its events published to feed as they are
+    # decoded; returns the result once it is cached
+    formatted_prompt = format_test_case_prompt(request)
+    try:
+        parts = []
+        usage = None
+        metadata = {}
+        parser = TestCaseParser()
+        spent = {}
+
+        def settle():
+            # Usage of the completed stream, settled with the scheduler
+            spent.update(token_usage(formatted_prompt, "".join(parts), usage))
+            return spent["total_tokens"]
+
+        chunks = generation_engine.stream(
+            lambda: llm.llm_model.astream(formatted_prompt),
+            usage=settle,
+            **admission(request, formatted_prompt),
         )
+        with stage_seconds.time(stage="llm_call"):
+            async for chunk in chunks:
+                usage = merge_usage(usage, getattr(chunk, "usage_metadata", None))
+                metadata.update(getattr(chunk, "response_metadata", None) or {})
+                if not chunk.content:
+                    continue
+                parts.append(chunk.content)
+                feed.publish(sse_event("chunk", {"content": chunk.content}))
 
-        response = llm_model.invoke(formatted_prompt)
-        content = response.content
-        token_count = len(content.split())
+                # Each scenario is sent as soon as the next one starts
+                for scenario in parser.feed(chunk.content):
+                    feed.publish(sse_event("scenario", scenario.to_dict()))
 
-        # Cache the response
-        result = {"content": content, "token_count": token_count}
-        test_case_cache[cache_key] = result
+        for scenario in parser.close():
+            feed.publish(sse_event("scenario", scenario.to_dict()))
 
+        # Only a completed stream is cached. Sections repaired after the
+        # stream ended only reach the client with the final document.
+        content = "".join(parts)
+        result = await checked_result(
+            request, content, spent, hit_token_limit(metadata), parser.scenarios
+        )
+        store_result(cache_key, request, result)
         return result
+    finally:
+        feed.close()
+
+
+async def stream_llm_generation(cache_key, request):
+    try:
+        # Cached or reusable: send the finished document as a single chunk
+        # instead of paying twice
+        result = cached_result(cache_key)
+        if result is None and generation_engine.pending(cache_key) is None:
+            result = near_duplicate_result(cache_key, request)
+            if result is None and request.mode == "two_phase":
+                # Scenarios are generated in parallel, there is no single
+                # completion to relay as it is decoded
+                result = await generate_result(cache_key, request)
+        if result is not None:
+            yield sse_event("chunk", {"content": result["content"]})
+            yield sse_event("done", result)
+            return
+
+        # Streamed as a flight: duplicate streams follow its feed and
+        # /generate-test-cases waits for its result. A generation already
+        # in flight without a feed is sent once it is done.
+        feed = Feed()
+        flight = generation_engine.start(
+            cache_key,
+            lambda: stream_completion(cache_key, request, feed),
+            kind="stream",
+            feed=feed,
+        )
+        waiter = asyncio.ensure_future(generation_engine.wait(cache_key, flight))
+        try:
+            if flight.feed is not None:
+                events = flight.feed.follow()
+                while (event := await events.get()) is not None:
+                    yield event
+            result = await waiter
+        finally:
+            # The generation is cancelled with its last waiter
+            waiter.cancel()
+        if flight.feed is None:
+            yield sse_event("chunk", {"content": result["content"]})
+        yield sse_event("done", result)
+
+    except Exception as e:
+        yield sse_event(
+            "error", {"detail": f"Error generating test cases: {str(e)}"}
+        )
+
+
+@app.post("/generate-test-cases/stream")
+async def generate_test_cases_stream(
+    http_request: Request, request: TestCaseRequest = Body(...)
+):
+    request = await client_request(http_request, request)
+    cache_key = request_cache_key(request)
+    return StreamingResponse(
+        relay_until_disconnected(
+            http_request,
+            stream_llm_generation(cache_key, request),
+            "generate-test-cases/stream",
+            cache_key,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def story_test_case_request(
+    story, tenant=None, mode="single", priority=BATCH_PRIORITY
+):
+    user_story = f"{story.summary}\n\n{story.description or ''}".strip()
+    return TestCaseRequest(
+        user_story=user_story,
+        jira_id=story.key,
+        # Set on stories from the hierarchical fetch
+        acceptance_criteria=getattr(story, "acceptance_criteria", None),
+        tenant=tenant,
+        priority=priority,
+        mode=mode,
+    )
+
+
+def ndjson_line(data):
+    return orjson.dumps(data) + b"\n"
+
 
+async def generate_story_test_cases(story, tenant, mode, semaphore):
+    story_request = story_test_case_request(story, tenant, mode)
+    cache_key = request_cache_key(story_request)
+
+    # Stories that were generated before are not sent to the model again
+    cached = cached_result(cache_key)
+    if cached is not None:
+        return {"type": "story", "key": story.key, "cached": True, **cached}
+
+    try:
+        async with semaphore:
+            result = await generate_result(cache_key, story_request)
+        return {"type": "story", "key": story.key, "cached": False, **result}
+    except Exception as e:
+        return {
+            "type": "error",
+            "key": story.key,
+            "detail": f"Error generating test cases: {str(e)}",
+        }
+
+
+# Test cases at least this similar are merged by epic deduplication
+DEDUPE_THRESHOLD = float(os.getenv("DEDUPE_THRESHOLD", "0.85"))
+
+
+async def deduplicate(stories, threshold=None):
+    # CPU bound; tens of thousands of cases take seconds, off the loop
+    if threshold is None:
+        threshold = DEDUPE_THRESHOLD
+    with stage_seconds.time(stage="dedupe"):
+        return await asyncio.to_thread(deduplicate_suite, stories, threshold)
+
+
+async def stream_epic_generation(
+    epic, tenant, mode, concurrency, dedupe=False, dedupe_threshold=None
+):
+    yield ndjson_line(
+        {
+            "type": "epic",
+            "epic_key": epic.epic_key,
+            "epic_summary": epic.epic_summary,
+            "total": len(epic.stories),
+        }
+    )
+
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [
+        asyncio.ensure_future(generate_story_test_cases(story, tenant, mode, semaphore))
+        for story in epic.stories
+    ]
+    counts = {"story": 0, "cached": 0, "error": 0}
+    results = {}
+    try:
+        # Results are sent in completion order, not story order
+        for next_done in asyncio.as_completed(tasks):
+            item = await next_done
+            counts["cached" if item.get("cached") else item["type"]] += 1
+            if item["type"] == "story":
+                results[item["key"]] = item
+            yield ndjson_line(item)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    yield ndjson_line(
+        {
+            "type": "summary",
+            "generated": counts["story"],
+            "cached": counts["cached"],
+            "failed": counts["error"],
+        }
+    )
+
+    if dedupe:
+        # Deduplicated in story order, so the output does not depend on
+        # which story finished first
+        stories = [
+            (story.key, results[story.key])
+            for story in epic.stories
+            if story.key in results
+        ]
+        report = await deduplicate(stories, dedupe_threshold)
+        yield ndjson_line({"type": "deduplicated", **report})
+
+
+@app.post("/generate-epic-test-cases")
+async def generate_epic_test_cases(
+    http_request: Request, request: EpicTestCaseRequest = Body(...)
+):
+    try:
+        jira = get_jira_client(request)
+        if request.hierarchy:
+            epic = await fetch_epic_hierarchy(jira, request)
+        else:
+            epic = await fetch_epic_with_stories(jira, request.jira_id)
+    except Exception as e:
+        raise jira_http_exception(e)
+
+    concurrency = request.concurrency or int(os.getenv("EPIC_BATCH_CONCURRENCY", "4"))
+    return StreamingResponse(
+        relay_until_disconnected(
+            http_request,
+            stream_epic_generation(
+                epic,
+                jira.domain,
+                request.mode,
+                max(1, concurrency),
+                request.dedupe,
+                request.dedupe_threshold,
+            ),
+            "generate-epic-test-cases",
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+ExportFormat = Literal["csv", "xlsx", "testrail", "xray"]
+
+
+def export_response(rows, export_format, name):
+    writer = WRITERS[export_format]()
+    return StreamingResponse(
+        stream_export(writer, rows),
+        media_type=writer.media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{name}.{writer.extension}"'
+        },
+    )
+
+
+async def story_export_rows(story_key, result):
+    for row in case_rows(story_key, result):
+        yield row
+
+
+def cached_story_result(story, tenant):
+    for mode in ("single", "two_phase"):
+        story_request = story_test_case_request(story, tenant, mode=mode)
+        result = cached_result(request_cache_key(story_request))
+        if result is not None:
+            return result
+    # Generated with inputs this story listing does not have, such as
+    # acceptance criteria from the hierarchical fetch. Only the site's own
+    # latest suite counts, and only while the story itself is unchanged.
+    latest = story_versions.load(tenant, story.key)
+    if latest is None:
+        return None
+    if normalize_text(latest["user_story"]) != normalize_text(story_request.user_story):
+        return None
+    return cached_result(latest["cache_key"])
+
+
+async def cached_story_results(jira, epic_key, missing=None):
+    # (story key, cached result) of the epic's stories that have generated
+    # test cases, read page by page; the other keys are added to missing
+    pages = search_pages(jira, epic_stories_jql(epic_key), STORY_FIELDS)
+    async for _, _, issues in pages:
+        for issue in issues:
+            story = story_item_from_raw(issue, epic_key)
+            result = cached_story_result(story, jira.domain)
+            if result is not None:
+                yield story.key, result
+            elif missing is not None:
+                missing.append(story.key)
+
+
+async def epic_export_rows(jira, epic_key):
+    # Only stories with generated test cases are exported; run
+    # /generate-epic-test-cases or /jobs first for the rest. Stories are
+    # read page by page, so the epic is never held in memory.
+    async for story_key, result in cached_story_results(jira, epic_key):
+        for row in case_rows(story_key, result):
+            yield row
+
+
+@app.post("/export/test-cases")
+async def export_test_cases(
+    http_request: Request,
+    request: TestCaseRequest = Body(...),
+    export_format: ExportFormat = Query("csv", alias="format"),
+):
+    request = await client_request(http_request, request)
+    try:
+        cache_key = request_cache_key(request)
+        result = cached_result(cache_key)
+        if result is None:
+            result = await generate_result(cache_key, request)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error generating test cases: {str(e)}"
         )
 
+    rows = story_export_rows(request.jira_id, result)
+    return export_response(rows, export_format, f"{request.jira_id}-test-cases")
+
+
+@app.post("/export/epic-test-cases")
+async def export_epic_test_cases(
+    request: IssueFetchRequest = Body(...),
+    export_format: ExportFormat = Query("csv", alias="format"),
+):
+    try:
+        jira = get_jira_client(request)
+        epic = await fetch_epic(jira, request.jira_id)
+    except Exception as e:
+        raise jira_http_exception(e)
+
+    rows = epic_export_rows(jira, epic.epic_key)
+    return export_response(rows, export_format, f"{epic.epic_key}-test-cases")
+
+
+@app.post("/dedupe/epic-test-cases")
+async def dedupe_epic_test_cases(request: EpicDedupeRequest = Body(...)):
+    # The epic's generated test cases with near duplicates merged; each
+    # kept case lists the stories and cases it stands for. Stories without
+    # generated test cases are reported as missing.
+    try:
+        jira = get_jira_client(request)
+        epic = await fetch_epic(jira, request.jira_id)
+        missing = []
+        stories = [
+            item async for item in cached_story_results(jira, epic.epic_key, missing)
+        ]
+    except Exception as e:
+        raise jira_http_exception(e)
+
+    report = await deduplicate(stories, request.threshold)
+    return json_response(
+        {
+            "epic_key": epic.epic_key,
+            "stories": len(stories),
+            "missing_stories": missing,
+            **report,
+        }
+    )
+
+
+async def run_generation_job(payload):
+    request = TestCaseRequest(**payload)
+    cache_key = request_cache_key(request)
+    cached = cached_result(cache_key)
+    if cached is not None:
+        return cached
+    return await generate_result(cache_key, request)
+
+
+# Generation jobs survive restarts and can be worked on by any process
+# sharing the queue database; JOB_WORKERS=0 makes a process API-only
+job_queue = create_job_queue()
+job_workers = JobWorkers(
+    job_queue,
+    {"generate_test_cases": run_generation_job},
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+)
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "86400"))
+
+
+@app.post("/jobs", status_code=202)
+async def submit_generation_job(
+    http_request: Request, request: TestCaseRequest = Body(...)
+):
+    request = await client_request(http_request, request)
+    # Credentials are not persisted; the tenant is already resolved
+    job_id = job_queue.submit(
+        "generate_test_cases",
+        request.model_dump(exclude=CREDENTIAL_FIELDS),
+        priority=request.priority,
+    )
+    job_workers.notify()
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_generation_job(job_id: str, wait: float = Query(0, ge=0, le=60)):
+    # With wait > 0 this long-polls until the job finishes or wait runs out
+    deadline = time.monotonic() + wait
+    while True:
+        job = job_queue.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] in FINISHED or time.monotonic() >= deadline:
+            return job
+        await asyncio.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
+
+
+# Quiet period after the last edit of a story before it is generated
+WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", "30"))
+WEBHOOK_ISSUE_TYPES = {
+    name.strip().lower()
+    for name in os.getenv("WEBHOOK_ISSUE_TYPES", "Story").split(",")
+    if name.strip()
+}
+# Speculative generation yields to every request somebody is waiting on
+PREWARM_PRIORITY = -2
+# Tenant of events accepted without a signature (JIRA_WEBHOOK_ALLOW_UNSIGNED)
+UNSIGNED_WEBHOOK_TENANT = "webhook:unsigned"
+
+
+@app.post("/webhooks/jira", status_code=202)
+async def jira_webhook(request: Request):
+    body = await request.body()
+    secret = os.getenv("JIRA_WEBHOOK_SECRET")
+    if not secret and os.getenv("JIRA_WEBHOOK_ALLOW_UNSIGNED") != "1":
+        # Unsigned events would let anybody queue generations
+        webhook_events.inc(outcome="unauthorized")
+        raise HTTPException(
+            status_code=403, detail="Webhooks need JIRA_WEBHOOK_SECRET to be set"
+        )
+    if secret and not valid_signature(
+        secret, body, request.headers.get("x-hub-signature")
+    ):
+        webhook_events.inc(outcome="unauthorized")
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+    try:
+        event = json.loads(body)
+    except ValueError:
+        webhook_events.inc(outcome="invalid")
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+
+    reason = ignore_reason(event, WEBHOOK_ISSUE_TYPES)
+    if reason is not None:
+        webhook_events.inc(outcome="ignored")
+        return {"status": "ignored", "reason": reason}
+
+    # Same prompt inputs, and so the same cache key, as the epic batch
+    issue = event["issue"]
+    # The site named in an unsigned payload is not to be trusted; those
+    # events share one tenant of their own
+    tenant = issue_tenant(issue) if secret else UNSIGNED_WEBHOOK_TENANT
+    story = story_item_from_raw(issue, None)
+    story_request = story_test_case_request(story, tenant, priority=PREWARM_PRIORITY)
+
+    # Rapid edits of one story collapse into a single queued job that
+    # starts once the story has been quiet for the debounce period
+    job_id, debounced = job_queue.schedule(
+        "generate_test_cases",
+        story_request.model_dump(),
+        dedupe_key=f"webhook:{tenant}:{story.key}",
+        delay=WEBHOOK_DEBOUNCE_SECONDS,
+        priority=PREWARM_PRIORITY,
+    )
+    webhook_events.inc(outcome="debounced" if debounced else "scheduled")
+    return {
+        "status": "scheduled",
+        "job_id": job_id,
+        "debounced": debounced,
+        "status_url": f"/jobs/{job_id}",
+    }
+
+
+result_cache_hit_ratio = Gauge(
+    "result_cache_hit_ratio",
+    "Share of test case lookups answered from the result cache",
+    callback=lambda: test_case_cache.stats()["hit_ratio"],
+)
+
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.post("/cache/explain")
+async def explain_cache_lookup(
+    http_request: Request, request: TestCaseRequest = Body(...)
+):
+    # How a request would be answered from the cache, without generating
+    request = await client_request(http_request, request)
+    cache_key = request_cache_key(request)
+    if test_case_cache.get(cache_key) is not None:
+        return {"cache_key": cache_key, "match": "exact"}
+    _, explanation = find_near_duplicate(request)
+    return {"cache_key": cache_key, **explanation}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "test_cases": test_case_cache.stats(),
+        "near_duplicates": near_duplicates.stats(),
+        "jira_sessions": jira_sessions.stats(),
+        "generation": generation_engine.stats(),
+        "jobs": job_queue.stats(),
+    }
+
 
 if __name__ == "__main__":
     uvicorn.run("app:app", host="0.0.0.0", port=8000)
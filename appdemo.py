@@ -1,5 +1,5 @@
 from fastapi import FastAPI, HTTPException, Body, Request
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import Optional
@@ -7,25 +7,24 @@ import os
 import os.path
 from dotenv import load_dotenv
 from langchain.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI 
+from scripts.artifacts import create_artifact_store, parse_range
+from scripts.llm import get_llm as get_shared_llm
+from scripts.metrics import METRICS_CONTENT_TYPE, InFlightMiddleware, render as render_metrics, stage_seconds
+from scripts.tokens import token_usage
 
 # Initialize FastAPI app
 app = FastAPI(title="Test Case Generator API", 
               description="API for generating test cases based on user stories")
 
+# Track requests in flight for /metrics
+app.add_middleware(InFlightMiddleware)
+
 # Load environment variables
 load_dotenv()
 
-# Initialize Google Generative AI model
+# Google Generative AI model, built on first use and reused by every request
 def get_llm():
-    return ChatGoogleGenerativeAI(
-        api_key=os.getenv("gemini_api_key_2"),
-        model="gemini-1.5-pro",
-        temperature=0.7,
-        max_tokens=None,
-        timeout=None,
-        max_retries=2,
-    )
+    return get_shared_llm(model="gemini-1.5-pro")
 
 # Define the template for the test case generation prompt
 test_case_prompt = PromptTemplate(
@@ -123,24 +122,18 @@ class TestCaseResponse(BaseModel):
     file_name: str
     content: str
     token_count: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    token_source: str
 
-# Function to find the next available ID for the output file
-def find_next_id(jira_id):
-    os.makedirs("outputs", exist_ok=True)
-    files = [f for f in os.listdir("outputs") if f.startswith(f"{jira_id}_output")]
-    
-    if not files:
-        return 1
-        
-    max_id = -1
-    for file in files:
-        try:
-            file_id = int(file.split("output")[1].split(".")[0])
-            max_id = max(max_id, file_id)
-        except (ValueError, IndexError):
-            continue
-            
-    return max_id + 1
+# Generated files are kept in an indexed, compressed store under outputs/
+artifacts = create_artifact_store()
+
+# Every output file starts with the prompt template; the store keeps it once
+output_header = ("\n User Prompt :" + "  " + test_case_prompt.template + "\n"
+                 + "-------------------"
+                 + "------------------------- LLM output -------------------------------------------------- \n\n ")
 
 # HTML for the landing page
 landing_page_html = """<!DOCTYPE html>
@@ -465,52 +458,80 @@ async def generate_test_cases(request: TestCaseRequest = Body(...)):
         llm = get_llm()
         
         # Format the prompt
-        formatted_prompt = test_case_prompt.format(
-            user_story=request.user_story,
-            jira_id=request.jira_id,
-            acceptance_criteria=request.acceptance_criteria or ""
-        )
+        with stage_seconds.time(stage="prompt_format"):
+            formatted_prompt = test_case_prompt.format(
+                user_story=request.user_story,
+                jira_id=request.jira_id,
+                acceptance_criteria=request.acceptance_criteria or ""
+            )
         
         # Invoke the LLM to generate test cases
-        response = llm.invoke(formatted_prompt)
+        with stage_seconds.time(stage="llm_call"):
+            response = llm.invoke(formatted_prompt)
         content = response.content
         
-        # Calculate token count (approximation using word count)
-        token_count = len(content.split())
-        
-        # Find the next file ID and save the output
-        file_id = find_next_id(request.jira_id)
-        file_name = f"{request.jira_id}_output{file_id}.md"
+        # Token counts from the provider's usage metadata, estimated if missing
+        usage = token_usage(formatted_prompt, content, getattr(response, "usage_metadata", None))
+        token_count = usage["completion_tokens"]
         
-        with open(f"outputs/{file_name}", "w") as file:
-            file.write("\n User Prompt :" + "  " + test_case_prompt.template + "\n")
-            file.write("-------------------")
-            file.write("------------------------- LLM output -------------------------------------------------- \n\n ")
-            file.write(content + "\n")
-            file.write(f"Tokens Outputed: {token_count}\n")
-            file.write("\n")
-            file.write("End of Iteration" + "\n")
-            file.write("---------------------------------------------------------------------------")
-            file.write("\n")
+        # Save the output under the next version for this JIRA ID
+        file_name = artifacts.save(request.jira_id, output_header,
+            content + "\n"
+            + f"Tokens Outputed: {token_count}\n"
+            + "\n"
+            + "End of Iteration" + "\n"
+            + "---------------------------------------------------------------------------"
+            + "\n")
         
         # Return the response
-        return TestCaseResponse(
-            jira_id=request.jira_id,
-            file_name=file_name,
-            content=content,
-            token_count=token_count
-        )
+        with stage_seconds.time(stage="serialization"):
+            return JSONResponse(TestCaseResponse(
+                jira_id=request.jira_id,
+                file_name=file_name,
+                content=content,
+                token_count=token_count,
+                **usage
+            ).model_dump())
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating test cases: {str(e)}")
 
 # Define a download endpoint
 @app.get("/download/{file_name}")
-async def download_file(file_name: str):
-    file_path = f"outputs/{file_name}"
-    if not os.path.isfile(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(path=file_path, filename=file_name, media_type="text/markdown")
+async def download_file(file_name: str, request: Request):
+    artifact = artifacts.find(file_name)
+    if artifact is None:
+        # Files written before the artifact store existed
+        file_path = os.path.join("outputs", os.path.basename(file_name))
+        if not os.path.isfile(file_path):
+            raise HTTPException(status_code=404, detail="File not found")
+        return FileResponse(path=file_path, filename=file_name, media_type="text/markdown")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{artifact["etag"]}"',
+        "Content-Disposition": f'attachment; filename="{file_name}"',
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    size = artifact["size"]
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return Response(artifacts.read(artifact), media_type="text/markdown", headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    return Response(artifacts.read(artifact, start, end), status_code=206,
+                    media_type="text/markdown", headers=headers)
+
+# Define the Prometheus metrics endpoint
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
 # Define a health check endpoint
 @app.get("/health")
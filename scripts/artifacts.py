@@ -0,0 +1,224 @@
+import hashlib
+import os
+import re
+import threading
+import time
+import zlib
+
+from scripts.cache import open_database
+
+# Indexed store for generated output files. An artifact is a header
+# (the prompt template, identical for every file) followed by a body;
+# both are kept as content-addressed, zlib-compressed blobs under
+# objects/, so the header is stored once however many files use it.
+# File names and per-Jira-ID version counters live in SQLite, which
+# makes numbering atomic across concurrent requests and processes.
+
+LEGACY_NAME = re.compile(r"^(?P<jira_id>.+)_output(?P<version>\d+)\.md$")
+
+
+class ArtifactStore:
+    def __init__(self, root="outputs", compression_level=6, cache_blobs=32):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.compression_level = compression_level
+        self.cache_blobs = cache_blobs
+        self._lock = threading.Lock()
+        # Recently read blobs, decompressed; the shared header is always hot
+        self._blobs = {}
+        os.makedirs(self.objects, exist_ok=True)
+
+        self._conn = open_database(os.path.join(root, "index.sqlite3"))
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS counters (
+                jira_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS artifacts (
+                file_name TEXT PRIMARY KEY,
+                jira_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                header TEXT NOT NULL,
+                body TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                stored_size INTEGER NOT NULL
+            );
+            """
+        )
+
+    def _legacy_version(self, jira_id):
+        # Highest version among files written before the index existed.
+        # Only runs the first time a Jira ID is seen.
+        highest = 0
+        for name in os.listdir(self.root):
+            match = LEGACY_NAME.match(name)
+            if match and match.group("jira_id") == jira_id:
+                highest = max(highest, int(match.group("version")))
+        return highest
+
+    def next_version(self, jira_id):
+        # The upsert is a single statement, so two requests can never get
+        # the same number, even from different processes
+        seed = None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM counters WHERE jira_id = ?", (jira_id,)
+            ).fetchone()
+        if row is None:
+            seed = self._legacy_version(jira_id) + 1
+
+        with self._lock:
+            (version,) = self._conn.execute(
+                "INSERT INTO counters (jira_id, version) VALUES (?, ?) "
+                "ON CONFLICT (jira_id) DO UPDATE SET version = version + 1 "
+                "RETURNING version",
+                (jira_id, seed or 1),
+            ).fetchone()
+        return version
+
+    def _blob_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest[2:] + ".z")
+
+    def _put_blob(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            compressed = zlib.compress(data, self.compression_level)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so readers never see a partial blob
+            temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp, "wb") as file:
+                file.write(compressed)
+            os.replace(temp, path)
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO blobs (digest, size, stored_size) "
+                    "VALUES (?, ?, ?)",
+                    (digest, len(data), len(compressed)),
+                )
+        return digest
+
+    def _get_blob(self, digest):
+        with self._lock:
+            data = self._blobs.get(digest)
+        if data is not None:
+            return data
+
+        with open(self._blob_path(digest), "rb") as file:
+            data = zlib.decompress(file.read())
+        with self._lock:
+            if len(self._blobs) >= self.cache_blobs:
+                self._blobs.pop(next(iter(self._blobs)))
+            self._blobs[digest] = data
+        return data
+
+    def save(self, jira_id, header, body):
+        # Returns the new file name, e.g. PROJ-123_output4.md
+        header = header.encode("utf-8")
+        body = body.encode("utf-8")
+        header_digest = self._put_blob(header)
+        body_digest = self._put_blob(body)
+
+        version = self.next_version(jira_id)
+        file_name = f"{jira_id}_output{version}.md"
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO artifacts (file_name, jira_id, version, "
+                "header, body, size, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    file_name,
+                    jira_id,
+                    version,
+                    header_digest,
+                    body_digest,
+                    len(header) + len(body),
+                    time.time(),
+                ),
+            )
+        return file_name
+
+    def find(self, file_name):
+        # Index entry for file_name, or None if the store doesn't have it
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT header, body, size, created_at FROM artifacts "
+                "WHERE file_name = ?",
+                (file_name,),
+            ).fetchone()
+        if row is None:
+            return None
+        header, body, size, created_at = row
+        return {
+            "file_name": file_name,
+            "header": header,
+            "body": body,
+            "size": size,
+            "created_at": created_at,
+            "etag": hashlib.sha256(f"{header}:{body}".encode()).hexdigest()[:32],
+        }
+
+    def read(self, artifact, start=0, end=None):
+        # Bytes [start, end) of the artifact; only the blobs the range
+        # touches are loaded
+        end = artifact["size"] if end is None else end
+        chunks = []
+        offset = 0
+        for digest in (artifact["header"], artifact["body"]):
+            data = self._get_blob(digest)
+            if start < offset + len(data) and end > offset:
+                chunks.append(data[max(0, start - offset) : end - offset])
+            offset += len(data)
+        return b"".join(chunks)
+
+    def stats(self):
+        with self._lock:
+            artifacts, logical = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts"
+            ).fetchone()
+            blobs, stored = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(stored_size), 0) FROM blobs"
+            ).fetchone()
+        return {
+            "artifacts": artifacts,
+            "blobs": blobs,
+            "logical_bytes": logical,
+            "stored_bytes": stored,
+        }
+
+
+def parse_range(header, size):
+    # Single "bytes=a-b", "bytes=a-" or "bytes=-n" range -> (start, end)
+    # with end exclusive. None means serve the whole file; ValueError
+    # means the range cannot be satisfied.
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if not first:
+            length = int(last)
+        else:
+            start = int(first)
+            end = int(last) + 1 if last else size
+    except ValueError:
+        # Malformed, so ignored like any unknown range unit
+        return None
+    if not first:
+        if length <= 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size
+    if start >= size or end <= start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size)
+
+
+def create_artifact_store():
+    return ArtifactStore(
+        os.getenv("ARTIFACT_ROOT", "outputs"),
+        compression_level=int(os.getenv("ARTIFACT_COMPRESSION_LEVEL", "6")),
+    )
@@ -0,0 +1,157 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+import httpx
+
+# Replays requests.jsonl against /generate-test-cases and reports
+# throughput, latency percentiles and cache effectiveness.
+#
+#   LLM_PROVIDER=fake python -m scripts.benchmark --in-process --concurrency 16
+#   python -m scripts.benchmark --url http://localhost:8000 --repeat 3
+#
+# Each backlog line ({"request_id", "title", "body"}) becomes one
+# TestCaseRequest: the title and body are the user story and the
+# request_id is the JIRA ID.
+
+
+def load_requests(path):
+    payloads = []
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            payloads.append(
+                {
+                    "user_story": f"{record['title']}\n\n{record['body']}",
+                    "jira_id": record["request_id"],
+                    "acceptance_criteria": record.get("acceptance_criteria"),
+                }
+            )
+    return payloads
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies):
+    return {
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "max": max(latencies, default=0.0),
+    }
+
+
+def create_client(url, in_process, timeout):
+    if in_process:
+        # Drive the ASGI app directly, no server or network involved
+        from app import app
+
+        transport = httpx.ASGITransport(app=app)
+        return httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", timeout=timeout
+        )
+    return httpx.AsyncClient(base_url=url, timeout=timeout)
+
+
+async def cache_counters(client):
+    try:
+        response = await client.get("/cache/stats")
+        stats = response.json()["test_cases"]
+        return stats["hits"], stats["misses"]
+    except Exception:
+        return None
+
+
+async def replay(client, payloads, endpoint, concurrency):
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    latencies = []
+    errors = []
+
+    async def worker():
+        while not queue.empty():
+            payload = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.post(endpoint, json=payload)
+                response.raise_for_status()
+                await response.aread()
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(f"{payload['jira_id']}: {e}")
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+async def run(args):
+    payloads = load_requests(args.requests) * args.repeat
+    async with create_client(args.url, args.in_process, args.timeout) as client:
+        before = await cache_counters(client)
+        start = time.perf_counter()
+        latencies, errors = await replay(
+            client, payloads, args.endpoint, args.concurrency
+        )
+        elapsed = time.perf_counter() - start
+        after = await cache_counters(client)
+
+    report = {
+        "requests": len(payloads),
+        "concurrency": args.concurrency,
+        "succeeded": len(latencies),
+        "failed": len(errors),
+        "wall_seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_seconds": latency_summary(latencies),
+    }
+    if before and after:
+        hits, misses = after[0] - before[0], after[1] - before[1]
+        report["cache"] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        }
+    if errors:
+        report["errors"] = errors[:10]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay requests.jsonl against /generate-test-cases"
+    )
+    parser.add_argument("--requests", default="requests.jsonl")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/generate-test-cases")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="run against app.app in this process instead of --url",
+    )
+    args = parser.parse_args()
+
+    if args.in_process:
+        os.environ.setdefault("LLM_PROVIDER", "fake")
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
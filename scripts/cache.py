@@ -0,0 +1,307 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import orjson
+
+
+def open_database(path):
+    # One autocommit connection per process; WAL lets every worker process
+    # read while another one writes
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    conn = sqlite3.connect(
+        path, timeout=30, isolation_level=None, check_same_thread=False
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ResultCache:
+    # SQLite-backed result cache shared by every worker process on the host.
+    # - LRU eviction once max_entries or max_bytes is exceeded
+    # - entries older than ttl seconds are treated as misses and purged
+    # - hit/miss/eviction counters live in the database so the numbers
+    #   cover all workers, not just the one answering /cache/stats; each
+    #   process counts in memory and adds its counts every flush_interval
+    #   seconds (or with the next write), so a lookup doesn't write them
+    # - accessed_at is only refreshed once it is access_resolution seconds
+    #   old, which is fine grained enough for LRU order and keeps repeated
+    #   hits read-only
+
+    def __init__(
+        self,
+        path,
+        max_entries=5000,
+        max_bytes=512 * 1024 * 1024,
+        ttl=None,
+        flush_interval=10.0,
+        access_resolution=60.0,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.access_resolution = access_resolution
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flushed_at = time.monotonic()
+
+        self._conn = open_database(path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+
+    def _bump(self, name, amount=1):
+        self._pending[name] = self._pending.get(name, 0) + amount
+
+    def _flush(self):
+        # Callers hold the lock
+        pending, self._pending = self._pending, {}
+        self._flushed_at = time.monotonic()
+        if pending:
+            self._conn.executemany(
+                "INSERT INTO stats (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                pending.items(),
+            )
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at, accessed_at FROM entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+            if row is None:
+                self._bump("misses")
+                self._maybe_flush()
+                return None
+
+            value, created_at, accessed_at = row
+            if self._expired(created_at, now):
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._bump("expirations")
+                self._bump("misses")
+                self._maybe_flush()
+                return None
+
+            if now - accessed_at >= self.access_resolution:
+                self._conn.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+            self._bump("hits")
+            self._maybe_flush()
+
+        return orjson.loads(value)
+
+    def set(self, key, value):
+        payload = orjson.dumps(value).decode()
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO entries (key, value, size, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                    "value = excluded.value, size = excluded.size, "
+                    "created_at = excluded.created_at, "
+                    "accessed_at = excluded.accessed_at",
+                    (key, payload, len(payload), now, now),
+                )
+                self._evict(now)
+                self._flush()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _evict(self, now):
+        if self.ttl is not None:
+            expired = self._conn.execute(
+                "DELETE FROM entries WHERE created_at < ?", (now - self.ttl,)
+            ).rowcount
+            if expired:
+                self._bump("expirations", expired)
+
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        # Walk from the least recently used entry until both limits hold
+        evicted = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+        ).fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            count -= 1
+            total -= size
+
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self._bump("evictions", len(evicted))
+
+    def stats(self):
+        with self._lock:
+            self._flush()
+            counters = dict(self._conn.execute("SELECT name, value FROM stats"))
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "backend": "sqlite",
+            "entries": count,
+            "bytes": total,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "expirations": counters.get("expirations", 0),
+        }
+
+
+class MemoryLRUCache:
+    # In-process LRU for values that cannot be shared between processes
+    # (e.g. live HTTP sessions). Entries expire after ttl seconds without
+    # being read; on_evict is called for every entry dropped by the cache.
+
+    def __init__(self, max_entries=256, ttl=None, on_evict=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _drop(self, values):
+        if self.on_evict:
+            for value in values:
+                self.on_evict(value)
+
+    def get(self, key):
+        now = time.monotonic()
+        expired = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, last_used = entry
+            if self.ttl is not None and now - last_used > self.ttl:
+                del self._entries[key]
+                self.misses += 1
+                self.evictions += 1
+                expired = value
+            else:
+                self._entries[key] = (value, now)
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        if expired is not None:
+            self._drop([expired])
+            return None
+        return value
+
+    def set(self, key, value):
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None and previous[0] is not value:
+                evicted.append(previous[0])
+            self._entries[key] = (value, now)
+
+            # Idle entries go first, then the least recently used ones
+            if self.ttl is not None:
+                for stale_key, (stale, last_used) in list(self._entries.items()):
+                    if now - last_used <= self.ttl:
+                        break
+                    del self._entries[stale_key]
+                    evicted.append(stale)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[1][0])
+
+            self.evictions += len(evicted)
+
+        self._drop(evicted)
+
+    def clear(self):
+        with self._lock:
+            values = [value for value, _ in self._entries.values()]
+            self._entries.clear()
+        self._drop(values)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+def _optional_float(value):
+    return float(value) if value else None
+
+
+def create_result_cache():
+    return ResultCache(
+        path=os.getenv("CACHE_DB_PATH", ".cache/test_cases.sqlite3"),
+        max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "5000")),
+        max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+        ttl=_optional_float(os.getenv("CACHE_TTL_SECONDS", "604800")),
+        flush_interval=float(os.getenv("CACHE_STATS_FLUSH_SECONDS", "10")),
+    )
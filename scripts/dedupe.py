@@ -0,0 +1,251 @@
+import math
+import re
+import time
+import zlib
+
+import numpy as np
+
+# Epic level deduplication of generated test cases. Login, permission and
+# validation cases come back for nearly every story of an epic; near
+# duplicates are clustered and each cluster is kept once, with references
+# to every story it came from.
+#
+# Cases become IDF weighted sets of word unigrams and bigrams, as signed
+# feature-hashed vectors (no vocabulary sized matrix). Filler words that
+# rewordings add ("successfully", "again") are dropped first: with their
+# IDF they would outweigh the words a case is made of. Random hyperplane
+# signatures split into bands put similar vectors into a shared bucket, so
+# cosine similarities are only computed within buckets instead of for all
+# pairs; identical texts are folded before any of that. The number of bands
+# and bits per band follow from the threshold, so that a pair at the
+# threshold shares a bucket with TARGET_RECALL probability.
+#
+# Connected components chain A~B~C even when A and C are far apart, so a
+# component is split into clusters whose members are all similar enough to
+# the representative.
+
+WORD = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it of on or the then this to "
+    "with whether validate".split()
+)
+FILLERS = frozenset(
+    "accurately again also appropriately correctly expected immediately just "
+    "now once more properly quickly still successfully".split()
+)
+IGNORED = STOPWORDS | FILLERS
+
+DIMENSIONS = 512
+TARGET_RECALL = 0.95
+# Hyperplanes over all bands together
+MAX_SIGNATURE_BITS = 256
+# Rows per block when comparing within one (possibly large) bucket
+BLOCK_ROWS = 1024
+SEED = 7
+
+
+def case_text(case):
+    parts = [case.get("title"), case.get("preconditions")]
+    parts += case.get("steps") or []
+    parts.append(case.get("expected_outcome"))
+    return " ".join(" ".join(part.split()) for part in parts if part).lower()
+
+
+def tokens(text):
+    words = [word for word in WORD.findall(text) if word not in IGNORED]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def tfidf_vectors(texts, dimensions=DIMENSIONS):
+    # L2-normalised rows of each text's token set, IDF weighted; a token's
+    # column and sign come from its CRC32
+    vocabulary = {}
+    token_ids = []
+    lengths = []
+    for text in texts:
+        found = dict.fromkeys(tokens(text))
+        lengths.append(len(found))
+        token_ids += [vocabulary.setdefault(token, len(vocabulary)) for token in found]
+
+    count = len(texts)
+    size = len(vocabulary)
+    if not size:
+        return np.zeros((count, dimensions), dtype=np.float32)
+    rows = np.repeat(np.arange(count, dtype=np.int64), lengths)
+    token_ids = np.asarray(token_ids, dtype=np.int64)
+
+    df = np.bincount(token_ids, minlength=size)
+    idf = np.log((1 + count) / (1 + df)) + 1
+    hashes = np.fromiter(
+        (zlib.crc32(token.encode()) for token in vocabulary),
+        dtype=np.int64,
+        count=size,
+    )
+    columns = hashes % dimensions
+    signs = np.where(hashes & 0x80000000, 1.0, -1.0)
+
+    weights = idf[token_ids] * signs[token_ids]
+    vectors = np.zeros((count, dimensions), dtype=np.float32)
+    np.add.at(vectors, (rows, columns[token_ids]), weights.astype(np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def banding(threshold):
+    # (bands, bits per band) meeting TARGET_RECALL at the threshold with
+    # the fewest unrelated (orthogonal) pairs per bucket. A hyperplane
+    # separates two vectors with probability angle / pi.
+    agreement = 1 - math.acos(min(max(threshold, -1.0), 1.0)) / math.pi
+    best = None
+    for bits in range(1, 63):
+        collision = agreement**bits
+        if collision >= 1:
+            bands = 1
+        elif collision <= 0:
+            break
+        else:
+            bands = math.ceil(math.log(1 - TARGET_RECALL) / math.log1p(-collision))
+        if bands * bits > MAX_SIGNATURE_BITS:
+            continue
+        cost = bands / 2**bits
+        if best is None or cost < best[0]:
+            best = (cost, bands, bits)
+    return best[1:]
+
+
+def band_keys(vectors, bands, bits):
+    planes = np.random.default_rng(SEED).standard_normal(
+        (vectors.shape[1], bands * bits), dtype=np.float32
+    )
+    signature = (vectors @ planes > 0).reshape(len(vectors), bands, bits)
+    return signature @ (1 << np.arange(bits, dtype=np.int64))
+
+
+def similar_pairs(vectors, threshold):
+    # (first, second) index arrays of bucketed pairs at or above threshold
+    bands, bits = banding(threshold)
+    keys = band_keys(vectors, bands, bits)
+    firsts = []
+    seconds = []
+    for band in range(bands):
+        order = np.argsort(keys[:, band], kind="stable")
+        boundaries = np.flatnonzero(np.diff(keys[order, band])) + 1
+        for group in np.split(order, boundaries):
+            if len(group) < 2:
+                continue
+            members = vectors[group]
+            for start in range(0, len(group), BLOCK_ROWS):
+                scores = members[start : start + BLOCK_ROWS] @ members.T
+                row, column = np.nonzero(scores >= threshold)
+                upper = column > row + start
+                firsts.append(group[row[upper] + start])
+                seconds.append(group[column[upper]])
+    if not firsts:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty
+    return np.concatenate(firsts), np.concatenate(seconds)
+
+
+def components(count, firsts, seconds):
+    # Connected components by label propagation with pointer jumping;
+    # every item is labelled with the smallest index in its component
+    labels = np.arange(count)
+    while True:
+        smaller = np.minimum(labels[firsts], labels[seconds])
+        updated = labels.copy()
+        np.minimum.at(updated, firsts, smaller)
+        np.minimum.at(updated, seconds, smaller)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def split_component(indices, lengths, vectors, threshold):
+    # (representative, members, similarities) of the clusters of one
+    # component: the longest text represents the members at or above the
+    # threshold to it, the rest are split again
+    remaining = np.asarray(indices)
+    while len(remaining):
+        representative = remaining[np.argmax(lengths[remaining])]
+        similarity = vectors[remaining] @ vectors[representative]
+        close = (similarity >= threshold) | (remaining == representative)
+        yield int(representative), remaining[close].tolist(), similarity[close]
+        remaining = remaining[~close]
+
+
+def cluster_texts(texts, threshold, dimensions=DIMENSIONS):
+    # Cluster label and vector of every text; identical texts share a row
+    unique = {}
+    inverse = np.fromiter(
+        (unique.setdefault(text, len(unique)) for text in texts),
+        dtype=np.int64,
+        count=len(texts),
+    )
+    vectors = tfidf_vectors(list(unique), dimensions)
+    firsts, seconds = similar_pairs(vectors, threshold)
+    labels = components(len(unique), firsts, seconds)
+    return labels[inverse], vectors[inverse]
+
+
+def deduplicate_suite(stories, threshold=0.85, dimensions=DIMENSIONS):
+    # stories: (story_key, result) pairs with parsed scenarios. Returns
+    # the suite with one case per cluster, in first-seen order; the most
+    # detailed member represents it and the others, each at or above the
+    # threshold to it, are listed as duplicates with their similarity.
+    start = time.perf_counter()
+    cases = [
+        (story_key, scenario, case)
+        for story_key, result in stories
+        for scenario in result.get("scenarios") or []
+        for case in scenario["test_cases"]
+    ]
+    texts = [case_text(case) for _, _, case in cases]
+    suite = []
+    clusters = 0
+    if cases:
+        labels, vectors = cluster_texts(texts, threshold, dimensions)
+        members = {}
+        for index, label in enumerate(labels.tolist()):
+            members.setdefault(label, []).append(index)
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+
+        clustered = (
+            cluster
+            for indices in members.values()
+            for cluster in split_component(indices, lengths, vectors, threshold)
+        )
+        for representative, indices, similarity in clustered:
+            story_key, scenario, case = cases[representative]
+            duplicates = [
+                {
+                    "story_key": cases[index][0],
+                    "scenario_id": cases[index][1]["id"],
+                    "test_case_id": cases[index][2]["id"],
+                    "similarity": round(float(score), 4),
+                }
+                for index, score in zip(indices, similarity)
+                if index != representative
+            ]
+            clusters += bool(duplicates)
+            suite.append(
+                {
+                    "story_key": story_key,
+                    "scenario_id": scenario["id"],
+                    "scenario": scenario["title"],
+                    "test_case": case,
+                    "stories": sorted({cases[index][0] for index in indices}),
+                    "duplicates": duplicates,
+                }
+            )
+
+    return {
+        "threshold": threshold,
+        "test_cases": len(cases),
+        "unique_test_cases": len(suite),
+        "duplicates_removed": len(cases) - len(suite),
+        "clusters": clusters,
+        "seconds": round(time.perf_counter() - start, 4),
+        "suite": suite,
+    }
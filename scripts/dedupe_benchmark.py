@@ -0,0 +1,194 @@
+import argparse
+import json
+import random
+
+import numpy as np
+
+from scripts.dedupe import DIMENSIONS, deduplicate_suite, similar_pairs
+
+# Times deduplicate_suite() on a synthetic epic the size of a large real
+# one. Every story gets the shared login/permission/validation cases,
+# reworded with a filler word or two, plus cases of its own; each shared
+# case must collapse into one cluster through the similarity search (the
+# rewordings are not identical texts) and the story specific ones stay.
+#
+# Recall is checked apart from that on random vector pairs just above the
+# threshold (--recall-margin), the pairs LSH banding is most likely to
+# miss.
+#
+#   python -m scripts.dedupe_benchmark --stories 500 --cases-per-story 40
+#   python -m scripts.dedupe_benchmark --max-seconds 5   # CI guard
+
+SHARED_CASES = [
+    (
+        "validate whether a registered user can log in with valid credentials",
+        ["Open the login page", "Enter a valid username and password", "Submit"],
+        "The user is signed in and lands on the dashboard",
+    ),
+    (
+        "validate whether login fails with an incorrect password",
+        ["Open the login page", "Enter a valid username and a wrong password"],
+        "An invalid credentials error is shown and the user stays signed out",
+    ),
+    (
+        "validate whether a user without the required role is denied access",
+        ["Sign in as a user without the role", "Open the protected page"],
+        "Access is denied with a permission error",
+    ),
+    (
+        "validate whether mandatory fields are validated before saving",
+        ["Open the form", "Leave the mandatory fields empty", "Click save"],
+        "Validation messages are shown next to each empty mandatory field",
+    ),
+    (
+        "validate whether the session expires after the idle timeout",
+        ["Sign in", "Stay idle past the session timeout", "Click any link"],
+        "The user is redirected to the login page",
+    ),
+]
+FILLERS = ["successfully", "again", "correctly", "as expected", "properly", "now"]
+SUBJECTS = [
+    "invoice",
+    "report",
+    "payment",
+    "profile",
+    "notification",
+    "export",
+    "schedule",
+    "dashboard",
+    "timezone",
+    "webhook",
+]
+ACTIONS = ["create", "edit", "delete", "archive", "share", "approve", "filter"]
+
+
+def synthetic_case(number, title, steps, outcome):
+    return {
+        "id": f"TC_{number:02d}",
+        "title": title,
+        "preconditions": None,
+        "test_data": None,
+        "steps": steps,
+        "expected_outcome": outcome,
+        "pass_criteria": None,
+        "fail_criteria": None,
+        "priority": "Medium",
+        "references": None,
+    }
+
+
+def reworded(rng, text):
+    # text with one or two filler words slipped in
+    words = text.split()
+    for _ in range(rng.randint(1, 2)):
+        words.insert(rng.randrange(1, len(words) + 1), rng.choice(FILLERS))
+    return " ".join(words)
+
+
+def synthetic_story(rng, story, cases_per_story):
+    cases = []
+    for title, steps, outcome in SHARED_CASES:
+        if rng.random() < 0.5:
+            outcome = reworded(rng, outcome)
+        cases.append(
+            synthetic_case(len(cases) + 1, reworded(rng, title), steps, outcome)
+        )
+    while len(cases) < cases_per_story:
+        subject = rng.choice(SUBJECTS)
+        action = rng.choice(ACTIONS)
+        detail = rng.randrange(10**6)
+        cases.append(
+            synthetic_case(
+                len(cases) + 1,
+                f"validate whether the user can {action} a {subject} with "
+                f"reference {detail} in story {story}",
+                [
+                    f"Open the {subject} page of story {story}",
+                    f"Choose {subject} {detail}",
+                    f"Click {action}",
+                ],
+                f"The {subject} {detail} is {action}d and the change is audited",
+            )
+        )
+    scenario = {"id": "TS_01", "title": f"story {story}", "test_cases": cases}
+    return f"BENCH-{story}", {"scenarios": [scenario]}
+
+
+def unit_rows(matrix):
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def near_threshold_recall(threshold, pairs, margin, seed):
+    # Share of vector pairs at cosine threshold + margin similar_pairs finds
+    rng = np.random.default_rng(seed)
+    cosine = min(threshold + margin, 1.0)
+    first = unit_rows(rng.standard_normal((pairs, DIMENSIONS)))
+    noise = rng.standard_normal((pairs, DIMENSIONS))
+    noise = unit_rows(noise - (noise * first).sum(axis=1, keepdims=True) * first)
+    second = cosine * first + np.sqrt(1 - cosine**2) * noise
+    vectors = np.vstack([first, second]).astype(np.float32)
+    firsts, seconds = similar_pairs(vectors, threshold)
+    found = set(
+        zip(np.minimum(firsts, seconds).tolist(), np.maximum(firsts, seconds).tolist())
+    )
+    return sum((index, index + pairs) in found for index in range(pairs)) / pairs
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    stories = [
+        synthetic_story(rng, story, args.cases_per_story)
+        for story in range(1, args.stories + 1)
+    ]
+    report = deduplicate_suite(stories, threshold=args.threshold)
+    report.pop("suite")
+    expected = args.stories * (args.cases_per_story - len(SHARED_CASES)) + len(
+        SHARED_CASES
+    )
+    report["expected_unique_test_cases"] = expected
+    report["expected_clusters"] = len(SHARED_CASES)
+    recall = near_threshold_recall(
+        args.threshold, args.recall_pairs, args.recall_margin, args.seed
+    )
+    report["near_threshold_recall"] = round(recall, 4)
+    failures = []
+    if report["clusters"] != len(SHARED_CASES):
+        failures.append(
+            f"{report['clusters']} clusters, expected one per shared case "
+            f"({len(SHARED_CASES)})"
+        )
+    if report["unique_test_cases"] != expected:
+        failures.append(
+            f"{report['unique_test_cases']} unique test cases, expected {expected}"
+        )
+    if args.max_seconds and report["seconds"] > args.max_seconds:
+        failures.append(f"took {report['seconds']}s, over {args.max_seconds}s")
+    if recall < args.min_recall:
+        failures.append(
+            f"found {recall:.1%} of pairs at cosine "
+            f"{args.threshold + args.recall_margin:.2f}, under {args.min_recall:.0%}"
+        )
+    report["failures"] = failures
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark epic deduplication")
+    parser.add_argument("--stories", type=int, default=500)
+    parser.add_argument("--cases-per-story", type=int, default=40)
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-seconds", type=float)
+    parser.add_argument("--recall-pairs", type=int, default=2000)
+    parser.add_argument("--recall-margin", type=float, default=0.02)
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if report["failures"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
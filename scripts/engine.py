@@ -0,0 +1,122 @@
+import asyncio
+
+from scripts.metrics import generation_cancellations
+from scripts.scheduler import llm_scheduler
+
+
+class Flight:
+    __slots__ = ("task", "waiters", "kind", "feed")
+
+    def __init__(self, task, kind="coalesced", feed=None):
+        self.task = task
+        self.waiters = 0
+        self.kind = kind  # generation_cancellations label
+        self.feed = feed  # Feed of a streamed generation
+
+
+class Feed:
+    # Events of a streamed generation as they are produced, replayed to
+    # followers that join late; None marks the end
+
+    def __init__(self):
+        self.events = []
+        self._followers = []
+
+    def publish(self, event):
+        self.events.append(event)
+        for queue in self._followers:
+            queue.put_nowait(event)
+
+    def close(self):
+        self.publish(None)
+
+    def follow(self):
+        queue = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        self._followers.append(queue)
+        return queue
+
+
+class GenerationEngine:
+    # Runs LLM generations on the event loop without blocking it.
+    # - the scheduler admits upstream calls within the concurrency cap and
+    #   the provider's RPM/TPM quotas, fairly across tenants
+    # - calls sharing a cache key are coalesced into a single upstream call
+    #   ("single-flight"), every waiter receives the same result
+    # - a call is cancelled when its last waiter is, e.g. because the
+    #   client disconnected; it keeps running while anyone still waits
+    # - a streamed generation is a flight as well, with a Feed its
+    #   duplicates follow as the completion is decoded
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self._inflight = {}
+
+    async def run(self, key, factory, tenant="default", priority=0, tokens=0):
+        return await self.coalesce(
+            key, lambda: self.call(factory, tenant, priority, tokens)
+        )
+
+    async def coalesce(self, key, factory):
+        # Single-flight only; factory does its own admission, e.g. when a
+        # result takes several model calls
+        return await self.wait(key, self.start(key, factory))
+
+    def start(self, key, factory, kind="coalesced", feed=None):
+        # The flight for key, started with factory unless one is in flight
+        # already; the caller only counts as a waiter once it awaits wait()
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = Flight(asyncio.ensure_future(factory()), kind, feed)
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+        return flight
+
+    async def wait(self, key, flight):
+        flight.waiters += 1
+        try:
+            # Shielded, so one waiter going away does not cancel the call
+            # for everybody else coalesced on the same key
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Nobody is left waiting; later requests start afresh
+                self._land(key, flight)
+                flight.task.cancel()
+                generation_cancellations.inc(kind=flight.kind)
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _land(self, key, flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    def call(self, factory, tenant="default", priority=0, tokens=0):
+        # One admitted model call; factory's result reports total_tokens
+        return self.scheduler.run(
+            factory,
+            tenant=tenant,
+            priority=priority,
+            tokens=tokens,
+            usage=lambda result: result.get("total_tokens"),
+        )
+
+    def waiters(self, key):
+        flight = self._inflight.get(key)
+        return flight.waiters if flight else 0
+
+    def pending(self, key):
+        flight = self._inflight.get(key)
+        return flight.task if flight else None
+
+    def stream(self, factory, tenant="default", priority=0, tokens=0, usage=None):
+        # One admitted streaming call, see LLMScheduler.stream
+        return self.scheduler.stream(factory, tenant, priority, tokens, usage)
+
+    def stats(self):
+        return {"coalesced_keys": len(self._inflight), **self.scheduler.stats()}
+
+
+generation_engine = GenerationEngine(llm_scheduler)
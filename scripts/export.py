@@ -0,0 +1,287 @@
+import csv
+import io
+import json
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+# Converts generated test cases into formats test management tools
+# import: CSV, XLSX, TestRail and Xray JSON. Every writer works row by
+# row (header(), row(), close() each return the bytes to send next), so
+# an epic export is streamed without holding the whole file in memory.
+# Rows come from the scenarios parsed out of the test_case_prompt format.
+
+COLUMNS = (
+    ("story", "Story"),
+    ("scenario_id", "Test Scenario ID"),
+    ("scenario", "Test Scenario"),
+    ("id", "Test Case ID"),
+    ("title", "Test Case"),
+    ("preconditions", "Preconditions"),
+    ("test_data", "Test Data"),
+    ("steps", "Test Execution Steps"),
+    ("expected_outcome", "Expected Outcome"),
+    ("pass_criteria", "Pass Criteria"),
+    ("fail_criteria", "Fail Criteria"),
+    ("priority", "Priority"),
+    ("references", "References"),
+)
+
+# TestRail's default priorities
+TESTRAIL_PRIORITIES = {"low": 1, "medium": 2, "high": 3, "critical": 4}
+
+# Characters XML 1.0 does not allow, even escaped
+XML_ILLEGAL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+XLSX_MAX_CELL = 32767
+
+
+def case_rows(story_key, result):
+    # One row per test case of a generation result
+    for scenario in result.get("scenarios") or []:
+        for case in scenario["test_cases"]:
+            yield {
+                "story": story_key,
+                "scenario_id": scenario["id"],
+                "scenario": scenario["title"],
+                **case,
+            }
+
+
+def numbered_steps(steps):
+    return "\n".join(f"{number}. {step}" for number, step in enumerate(steps, 1))
+
+
+def cell_text(row, name):
+    value = row.get(name)
+    if name == "steps":
+        return numbered_steps(value or [])
+    return "" if value is None else str(value)
+
+
+class CsvWriter:
+    media_type = "text/csv"
+    extension = "csv"
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _line(self, values):
+        self._writer.writerow(values)
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data.encode("utf-8")
+
+    def header(self):
+        # The BOM makes Excel open the file as UTF-8
+        return b"\xef\xbb\xbf" + self._line([title for _, title in COLUMNS])
+
+    def row(self, row):
+        return self._line([cell_text(row, name) for name, _ in COLUMNS])
+
+    def close(self):
+        return b""
+
+
+class _Sink:
+    # Write-only file object: zipfile falls back to data descriptors when
+    # it cannot seek, so the archive can be sent while it is being written
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" '
+        'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+        'relationships"><Relationship Id="rId1" Type="http://schemas.'
+        'openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/></Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/'
+        'main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/'
+        'relationships"><sheets><sheet name="Test Cases" sheetId="1" '
+        'r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+        'relationships"><Relationship Id="rId1" Type="http://schemas.'
+        'openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/></Relationships>'
+    ),
+}
+
+
+def xlsx_cell(text):
+    text = XML_ILLEGAL.sub("", text)[:XLSX_MAX_CELL]
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+class XlsxWriter:
+    # Single-sheet workbook with inline strings, so no shared string table
+    # has to be collected before the sheet can be written
+    media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    extension = "xlsx"
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", zipfile.ZIP_DEFLATED)
+        self._sheet = None
+
+    def _write_row(self, values):
+        cells = "".join(xlsx_cell(value) for value in values)
+        self._sheet.write(f"<row>{cells}</row>".encode("utf-8"))
+        return self._sink.drain()
+
+    def header(self):
+        for name, content in XLSX_PARTS.items():
+            self._zip.writestr(name, content)
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", "w")
+        self._sheet.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/'
+            b'2006/main"><sheetData>'
+        )
+        return self._write_row([title for _, title in COLUMNS])
+
+    def row(self, row):
+        return self._write_row([cell_text(row, name) for name, _ in COLUMNS])
+
+    def close(self):
+        self._sheet.write(b"</sheetData></worksheet>")
+        self._sheet.close()
+        self._zip.close()
+        return self._sink.drain()
+
+
+class JsonArrayWriter:
+    # Streams a JSON array one element at a time
+    media_type = "application/json"
+    extension = "json"
+
+    def __init__(self):
+        self._first = True
+
+    def header(self):
+        return b"["
+
+    def row(self, row):
+        separator = "" if self._first else ","
+        self._first = False
+        return (separator + json.dumps(self.item(row))).encode("utf-8")
+
+    def close(self):
+        return b"]"
+
+    def item(self, row):
+        raise NotImplementedError
+
+
+class TestRailWriter(JsonArrayWriter):
+    # Cases in the shape of TestRail's add_case API, steps separated
+    def item(self, row):
+        steps = [{"content": step, "expected": ""} for step in row["steps"]]
+        if steps and row.get("expected_outcome"):
+            steps[-1]["expected"] = row["expected_outcome"]
+        return {
+            "title": row.get("title") or row["id"],
+            "section": f"{row['scenario_id']}: {row.get('scenario') or ''}".strip(),
+            "refs": row.get("references") or row["story"],
+            "priority_id": TESTRAIL_PRIORITIES.get(
+                (row.get("priority") or "").lower(), 2
+            ),
+            "custom_preconds": row.get("preconditions") or "",
+            "custom_steps_separated": steps,
+            "custom_expected": row.get("expected_outcome") or "",
+        }
+
+
+class XrayWriter(JsonArrayWriter):
+    # Manual tests in Xray's bulk test import format, linked to the story
+    def item(self, row):
+        project = row["story"].rsplit("-", 1)[0]
+        steps = [
+            {"action": step, "data": row.get("test_data") or "", "result": ""}
+            for step in row["steps"]
+        ]
+        if steps:
+            steps[-1]["result"] = row.get("expected_outcome") or ""
+        description = "\n\n".join(
+            f"*{label}:* {row[name]}"
+            for name, label in (
+                ("preconditions", "Preconditions"),
+                ("pass_criteria", "Pass"),
+                ("fail_criteria", "Fail"),
+            )
+            if row.get(name)
+        )
+        fields = {
+            "project": {"key": project},
+            "summary": row.get("title") or row["id"],
+            "description": description,
+            "labels": [row["scenario_id"]],
+        }
+        if row.get("priority"):
+            fields["priority"] = {"name": row["priority"]}
+        return {
+            "testtype": "Manual",
+            "fields": fields,
+            "update": {
+                "issuelinks": [
+                    {
+                        "add": {
+                            "type": {"name": "Test"},
+                            "outwardIssue": {"key": row["story"]},
+                        }
+                    }
+                ]
+            },
+            "steps": steps,
+        }
+
+
+WRITERS = {
+    "csv": CsvWriter,
+    "xlsx": XlsxWriter,
+    "testrail": TestRailWriter,
+    "xray": XrayWriter,
+}
+
+
+async def stream_export(writer, rows):
+    # rows is an async iterable of case_rows() dicts
+    yield writer.header()
+    async for row in rows:
+        data = writer.row(row)
+        if data:
+            yield data
+    yield writer.close()
@@ -0,0 +1,341 @@
+import asyncio
+import base64
+import os
+import random
+import re
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request
+
+# Local stand-in for the Jira REST API v2 calls this project makes
+# (serverInfo, myself, issue, search), serving synthetic epics.
+#
+#   uvicorn scripts.fake_jira:app --port 8080
+#
+# Any key is an epic with FAKE_JIRA_EPIC_SIZE stories (10 to 5,000);
+# FAKE_JIRA_EPIC_SIZES="DEMO-1=10,DEMO-2=5000" sets sizes per epic.
+# Stories of epic DEMO-7 are keyed DEMO7-1, DEMO7-2, ...
+# Every story has two acceptance criteria subtasks (DEMO7ST-11, DEMO7ST-12
+# for DEMO7-1), every third one is linked to a test (DEMO7QA-3) and even
+# stories carry criteria in customfield_10100. "key in (...)" searches
+# return any of these issues. Every fifth story also links an issue in a
+# restricted project (DEMO7SEC-5); like Jira, a key search naming it is a
+# 400 unless validateQuery is "warn".
+# The token "invalid" is rejected with 401 to exercise auth failures.
+# GET /_fake/stats counts the API requests served, per path.
+
+MIN_EPIC_SIZE = 10
+MAX_EPIC_SIZE = 5000
+MAX_RESULTS = 100
+
+LATENCY = float(os.getenv("FAKE_JIRA_LATENCY_SECONDS", "0.05"))
+JITTER = float(os.getenv("FAKE_JIRA_JITTER_SECONDS", "0.02"))
+DEFAULT_EPIC_SIZE = int(os.getenv("FAKE_JIRA_EPIC_SIZE", "100"))
+EPIC_SIZES = dict(
+    item.split("=", 1)
+    for item in os.getenv("FAKE_JIRA_EPIC_SIZES", "").split(",")
+    if "=" in item
+)
+
+# Stories were last updated a day before the server started, unless touched
+BASE_UPDATED = time.time() - 86400
+
+EPIC_LINK = re.compile(r'"Epic Link"\s*=\s*"?([A-Za-z0-9]+-\d+)"?', re.IGNORECASE)
+KEY_IN = re.compile(r"\bkey\s+in\s*\(([^)]*)\)", re.IGNORECASE)
+RELATED_KEY = re.compile(r"^([A-Za-z]+)(\d+)(ST|QA)-(\d+)$")
+CRITERIA_FIELD = "customfield_10100"
+UPDATED_SINCE = re.compile(r'updated\s*>=\s*"([^"]+)"', re.IGNORECASE)
+
+app = FastAPI(title="Fake Jira")
+
+# Stories edited through /_fake/touch: key -> (updated timestamp, revision)
+touched = {}
+
+# API requests served, per path
+request_counts = {}
+
+
+@app.middleware("http")
+async def count_requests(request, call_next):
+    if request.url.path.startswith("/rest/"):
+        path = request.url.path
+        request_counts[path] = request_counts.get(path, 0) + 1
+    return await call_next(request)
+
+
+def epic_size(epic_key):
+    size = int(EPIC_SIZES.get(epic_key, DEFAULT_EPIC_SIZE))
+    return max(MIN_EPIC_SIZE, min(MAX_EPIC_SIZE, size))
+
+
+def story_prefix(epic_key):
+    project, _, number = epic_key.partition("-")
+    return f"{project}{number}"
+
+
+def issue_ref(key, summary, issue_type):
+    # How Jira embeds another issue in subtasks and issuelinks
+    return {
+        "key": key,
+        "fields": {
+            "summary": summary,
+            "status": {"name": "To Do"},
+            "issuetype": {"name": issue_type},
+        },
+    }
+
+
+def subtask_summary(story_number, index):
+    return f"AC {index}: capability {story_number} handles case {index}"
+
+
+def related_issue(key):
+    # Full subtask (ST) or linked test (QA) issue for a key in a search
+    match = RELATED_KEY.match(key)
+    if match is None:
+        return None
+    project, epic_number, kind, number = match.groups()
+    number = int(number)
+    if kind == "ST":
+        story_number, index = divmod(number, 10)
+        summary = subtask_summary(story_number, index)
+        description = f"Given capability {story_number}, when case {index} runs, "
+        description += "then the user sees a confirmation."
+        issue_type = "Sub-task"
+        parent = f"{project}{epic_number}-{story_number}"
+    else:
+        summary = f"Regression test for capability {number}"
+        description = f"The existing flows keep working with capability {number}."
+        issue_type = "Test"
+        parent = None
+    fields = {
+        "summary": summary,
+        "description": description,
+        "status": {"name": "To Do"},
+        "issuetype": {"name": issue_type},
+    }
+    if parent:
+        fields["parent"] = {"key": parent}
+    return {"key": key, "fields": fields}
+
+
+def jira_timestamp(timestamp):
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.000+0000")
+
+
+@lru_cache(maxsize=64)
+def epic_stories(epic_key):
+    prefix = story_prefix(epic_key)
+    rng = random.Random(epic_key)
+    stories = []
+    for number in range(1, epic_size(epic_key) + 1):
+        fields = {
+            "summary": f"Story {number} of {epic_key}",
+            "description": (
+                f"As a user I want capability {number} of {epic_key} "
+                "so that I can complete my work."
+            ),
+            "priority": {"name": rng.choice(["Low", "Medium", "High"])},
+            "status": {"name": rng.choice(["To Do", "In Progress", "Done"])},
+            "assignee": {"displayName": f"User {rng.randint(1, 20)}"},
+            "duedate": None,
+            "labels": rng.sample(["ui", "api", "auth", "billing"], 2),
+            "issuetype": {"name": "Story"},
+            "subtasks": [
+                issue_ref(
+                    f"{prefix}ST-{number * 10 + index}",
+                    subtask_summary(number, index),
+                    "Sub-task",
+                )
+                for index in (1, 2)
+            ],
+            "issuelinks": [],
+            CRITERIA_FIELD: (
+                f"Capability {number} is available to every signed in user."
+                if number % 2 == 0
+                else None
+            ),
+        }
+        if number % 5 == 0:
+            restricted = issue_ref(
+                f"{prefix}SEC-{number}", "Restricted security review", "Test"
+            )
+            fields["issuelinks"].append(
+                {
+                    "type": {"name": "Tests", "inward": "is tested by"},
+                    "inwardIssue": restricted,
+                }
+            )
+        if number % 3 == 0:
+            test = issue_ref(
+                f"{prefix}QA-{number}",
+                f"Regression test for capability {number}",
+                "Test",
+            )
+            fields["issuelinks"].append(
+                {
+                    "type": {
+                        "name": "Tests",
+                        "inward": "is tested by",
+                        "outward": "tests",
+                    },
+                    "inwardIssue": test,
+                }
+            )
+        stories.append({"key": f"{prefix}-{number}", "fields": fields})
+    return stories
+
+
+def story_snapshot(story):
+    updated, revision = touched.get(story["key"], (BASE_UPDATED, 0))
+    fields = dict(story["fields"], updated=jira_timestamp(updated))
+    if revision:
+        fields["summary"] = f"{fields['summary']} (rev {revision})"
+    return {"key": story["key"], "fields": fields}, updated
+
+
+def project_fields(issue, fields):
+    # No fields asked for is every field, an empty list keys only
+    if fields is None or "*all" in fields:
+        return issue
+    wanted = {name: issue["fields"].get(name) for name in fields}
+    return {"key": issue["key"], "fields": wanted}
+
+
+def parse_jql_time(value):
+    # JQL dates are read as UTC, the time zone /myself reports
+    moment = datetime.strptime(value, "%Y/%m/%d %H:%M")
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+def check_auth(request):
+    header = request.headers.get("authorization", "")
+    if not header.startswith("Basic "):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    _, _, token = base64.b64decode(header[6:]).decode().partition(":")
+    if token == "invalid":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+async def simulate_latency():
+    await asyncio.sleep(max(0.0, LATENCY + random.uniform(-JITTER, JITTER)))
+
+
+@app.get("/rest/api/2/serverInfo")
+async def server_info():
+    return {
+        "baseUrl": "http://localhost",
+        "version": "9.0.0",
+        "deploymentType": "Server",
+    }
+
+
+@app.get("/rest/api/2/myself")
+async def myself(request: Request):
+    check_auth(request)
+    await simulate_latency()
+    return {"displayName": "Load Test User", "timeZone": "UTC", "active": True}
+
+
+@app.get("/rest/api/2/issue/{key}")
+async def issue(key: str, request: Request, fields: str = ""):
+    check_auth(request)
+    await simulate_latency()
+    epic = {
+        "key": key,
+        "fields": {
+            "summary": f"Synthetic epic {key}",
+            "description": f"Epic with {epic_size(key)} stories",
+            "issuetype": {"name": "Epic"},
+        },
+    }
+    return project_fields(epic, [name for name in fields.split(",") if name])
+
+
+async def run_search(request, jql, start_at, max_results, fields, validate=None):
+    check_auth(request)
+    await simulate_latency()
+
+    match = EPIC_LINK.search(jql or "")
+    keys = KEY_IN.search(jql or "")
+    warnings = []
+    if keys:
+        wanted = [key.strip().strip('"') for key in keys.group(1).split(",")]
+        issues = [issue for issue in map(related_issue, wanted) if issue]
+        found = {issue["key"] for issue in issues}
+        warnings = [
+            f"The issue key '{key}' for field 'key' is invalid."
+            for key in wanted
+            if key not in found
+        ]
+        if warnings and str(validate).lower() != "warn":
+            raise HTTPException(status_code=400, detail={"errorMessages": warnings})
+    elif not match:
+        return {"startAt": start_at, "maxResults": 0, "total": 0, "issues": []}
+    else:
+        since = UPDATED_SINCE.search(jql)
+        since = parse_jql_time(since.group(1)) if since else None
+
+        issues = []
+        for story in epic_stories(match.group(1)):
+            snapshot, updated = story_snapshot(story)
+            if since is None or updated >= since:
+                issues.append(snapshot)
+
+    max_results = min(max_results, MAX_RESULTS)
+    page = issues[start_at : start_at + max_results]
+    result = {
+        "startAt": start_at,
+        "maxResults": max_results,
+        "total": len(issues),
+        "issues": [project_fields(issue, fields) for issue in page],
+    }
+    if warnings:
+        result["warningMessages"] = warnings
+    return result
+
+
+@app.get("/rest/api/2/search")
+async def search_get(
+    request: Request,
+    jql: str = "",
+    startAt: int = 0,
+    maxResults: int = 50,
+    fields: Optional[str] = None,
+    validateQuery: str = "strict",
+):
+    if fields is not None:
+        fields = [name for name in fields.split(",") if name]
+    return await run_search(
+        request, jql, startAt, maxResults, fields, validateQuery
+    )
+
+
+@app.post("/rest/api/2/search")
+async def search_post(request: Request):
+    body = await request.json()
+    return await run_search(
+        request,
+        body.get("jql", ""),
+        body.get("startAt", 0),
+        body.get("maxResults", 50),
+        body.get("fields"),
+        body.get("validateQuery"),
+    )
+
+
+@app.get("/_fake/stats")
+async def stats():
+    return {"requests": request_counts, "total": sum(request_counts.values())}
+
+
+@app.post("/_fake/touch/{key}")
+async def touch(key: str):
+    # Simulates an edit: bumps the story's updated time and summary
+    _, revision = touched.get(key, (BASE_UPDATED, 0))
+    touched[key] = (time.time(), revision + 1)
+    return {"key": key, "revision": revision + 1}
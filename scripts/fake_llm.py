@@ -0,0 +1,291 @@
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from scripts.tokens import estimate_tokens
+
+# Deterministic offline stand-in for the Gemini chat model, selected with
+# LLM_PROVIDER=fake. The same prompt always produces the same document in
+# the test_case_prompt format; latency, jitter, chunking and failures are
+# configurable so the server's own overhead can be measured without quota.
+# The two-phase prompts get an outline or a single scenario's test cases,
+# the incremental prompts a revised scenario or scenarios without header.
+# FAKE_LLM_DEFECT breaks full documents the way real completions break:
+# "truncate" (cut off at the token limit), "missing_fields" (every fourth
+# test case lacks Pass/Fail criteria) or "few_scenarios" (four short);
+# the format repair prompt gets exactly the sections it lists.
+
+JIRA_ID = re.compile(r"\*\*JIRA Issue ID:\*\*\s*(\S+)")
+USER_STORY = re.compile(r"\*\*User Story:\*\*\s*(.+?)\s*\*\*JIRA Issue ID", re.DOTALL)
+OUTLINE_TASK = "### Task: AI Test Scenario Outline"
+SCENARIO_TASK = "### Task: AI Test Cases for One Scenario"
+REVISION_TASK = "### Task: AI Test Scenario Revision"
+ADDED_TASK = "### Task: AI Test Scenarios for New Requirements"
+REPAIR_TASK = "### Task: AI Test Case Format Repair"
+CASE_PROBLEM = re.compile(r"^- (TS_\d+) / (TC_\d+):", re.MULTILINE)
+MORE_CASES = re.compile(r"^- (TS_\d+): \d+ test cases, add at least (\d+)", re.M)
+MORE_SCENARIOS = re.compile(r"^- Document: .*, add at least (\d+)", re.MULTILINE)
+NEXT_CASE = re.compile(r"numbering new test cases from TC_(\d+)")
+NEXT_SCENARIO = re.compile(r"numbered from TS_(\d+)")
+TRUNCATE_RATIO = 0.9
+
+
+class FakeLLMError(Exception):
+    # Mirrors the provider's quota error so retry paths get exercised
+    status_code = 429
+
+
+class FakeChatModel:
+    def __init__(
+        self,
+        latency=2.0,
+        jitter=0.5,
+        failure_rate=0.0,
+        chunk_chars=200,
+        scenarios=12,
+        cases_per_scenario=3,
+        seed=0,
+        tokens_per_second=0.0,
+        defect="",
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.chunk_chars = chunk_chars
+        self.scenarios = scenarios
+        self.cases_per_scenario = cases_per_scenario
+        # Decoding speed; when set, longer completions take longer
+        self.tokens_per_second = tokens_per_second
+        self.defect = defect
+        self._random = random.Random(seed)
+
+    def _delay(self, content=""):
+        delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        if self.tokens_per_second:
+            delay += estimate_tokens(content) / self.tokens_per_second
+        return max(0.0, delay)
+
+    def _maybe_fail(self):
+        if self._random.random() < self.failure_rate:
+            raise FakeLLMError("429 Resource has been exhausted (fake provider)")
+
+    def _prompt_text(self, prompt):
+        return prompt if isinstance(prompt, str) else str(prompt)
+
+    def _full_document(self, prompt):
+        prompt = self._prompt_text(prompt)
+        tasks = (OUTLINE_TASK, SCENARIO_TASK, REVISION_TASK, ADDED_TASK, REPAIR_TASK)
+        return not any(task in prompt for task in tasks)
+
+    def _finish_reason(self, prompt):
+        if self.defect == "truncate" and self._full_document(prompt):
+            return "MAX_TOKENS"
+        return "STOP"
+
+    def _case_lines(self, case_id, topic, priority, jira_id, complete=True):
+        number = int(case_id.rsplit("_", 1)[-1])
+        lines = [
+            f"##### **Test Case ID: {case_id}**  ",
+            f"- **Test Case:** validate whether {topic} handles case {number}  ",
+            f"- **Preconditions:** {topic} is configured  ",
+            "- **Test Data:** The test data is just for guidance and the "
+            "actual test data is to be determined by the user.  ",
+            "- **Test Execution Steps:**  ",
+            f"  1. Open the {topic} page  ",
+            f"  2. Perform action {number}  ",
+            "  3. Observe the result  ",
+            f"- **Expected Outcome:** {topic} responds correctly  ",
+        ]
+        if complete:
+            lines += [
+                "- **Pass/Fail Criteria:**  ",
+                "  - **Pass:** The expected outcome is observed  ",
+                "  - **Fail:** The expected outcome is not observed  ",
+            ]
+        return lines + [
+            f"- **Priority:** {priority}  ",
+            f"- **References:** {jira_id}",
+            "",
+        ]
+
+    def render_repair(self, prompt, rng, topics, jira_id):
+        # The listed test cases in full, the requested extra test cases and
+        # scenarios, nothing else
+        requested = {}
+        for scenario_id, case_id in CASE_PROBLEM.findall(prompt):
+            requested.setdefault(scenario_id, []).append(case_id)
+        next_case = NEXT_CASE.search(prompt)
+        next_case = int(next_case.group(1)) if next_case else 1
+        for scenario_id, count in MORE_CASES.findall(prompt):
+            extra = [f"TC_{next_case + i:02d}" for i in range(int(count))]
+            requested.setdefault(scenario_id, []).extend(extra)
+            next_case += int(count)
+        more = MORE_SCENARIOS.search(prompt)
+        next_scenario = NEXT_SCENARIO.search(prompt)
+        next_scenario = int(next_scenario.group(1)) if next_scenario else 1
+        for number in range(int(more.group(1)) if more else 0):
+            scenario_id = f"TS_{next_scenario + number:02d}"
+            extra = [f"TC_{next_case + i:02d}" for i in range(self.cases_per_scenario)]
+            requested[scenario_id] = extra
+            next_case += self.cases_per_scenario
+
+        lines = []
+        for scenario_id, case_ids in requested.items():
+            topic = rng.choice(topics)
+            lines += [
+                f"#### **Test Scenario ID: {scenario_id}**  ",
+                f"**Test Scenario:** validate whether {topic} behaves as "
+                "expected (repaired)  ",
+                "",
+            ]
+            for case_id in case_ids:
+                priority = rng.choice(["Low", "Medium", "High"])
+                lines += self._case_lines(case_id, topic, priority, jira_id)
+            lines.append("---")
+        return "\n".join(lines) + "\n"
+
+    def render(self, prompt):
+        prompt = self._prompt_text(prompt)
+        ids = JIRA_ID.findall(prompt)
+        jira_id = ids[-1] if ids else "FAKE-1"
+        story = USER_STORY.search(prompt)
+        title = story.group(1).splitlines()[0][:80] if story else "Generated story"
+        words = re.findall(r"[a-zA-Z]{4,}", story.group(1) if story else title)
+
+        # Seed from the prompt so identical inputs give identical output
+        digest = hashlib.sha256(prompt.encode()).digest()
+        rng = random.Random(digest)
+        topics = words or ["feature"]
+        if REPAIR_TASK in prompt:
+            return self.render_repair(prompt, rng, topics, jira_id)
+        defect = self.defect if self._full_document(prompt) else ""
+
+        outline = OUTLINE_TASK in prompt
+        revision = REVISION_TASK in prompt
+        added = ADDED_TASK in prompt
+        single_scenario = SCENARIO_TASK in prompt or revision
+        scenarios = 1 if single_scenario else self.scenarios
+        if added:
+            scenarios = max(1, self.scenarios // 6)
+        if defect == "few_scenarios":
+            scenarios = max(1, scenarios - 4)
+        cases_per_scenario = 0 if outline else self.cases_per_scenario
+
+        lines = []
+        if not (single_scenario or added):
+            lines += [
+                "### **User Story**  ",
+                f"**Story Title:** {title}  ",
+                f"**Description:** {title}  ",
+                f"**JIRA Issue ID:** {jira_id}  ",
+                "",
+                "---",
+                "### **Test Scenarios & Test Cases**  ",
+                "",
+            ]
+        case_number = 0
+        for scenario in range(1, scenarios + 1):
+            topic = rng.choice(topics)
+            if revision:
+                lines += [
+                    f"**Test Scenario:** validate whether {topic} behaves as "
+                    "expected after the edit  ",
+                    "",
+                ]
+            elif not single_scenario:
+                lines += [
+                    f"#### **Test Scenario ID: TS_{scenario:02d}**  ",
+                    f"**Test Scenario:** validate whether {topic} behaves as "
+                    f"expected (scenario {scenario})  ",
+                    "",
+                ]
+            for _ in range(cases_per_scenario):
+                case_number += 1
+                priority = rng.choice(["Low", "Medium", "High"])
+                complete = not (defect == "missing_fields" and case_number % 4 == 0)
+                lines += self._case_lines(
+                    f"TC_{case_number:02d}", topic, priority, jira_id, complete
+                )
+            lines.append("---")
+        content = "\n".join(lines) + "\n"
+        if defect == "truncate":
+            content = content[: int(len(content) * TRUNCATE_RATIO)]
+        return content
+
+    def _usage(self, prompt, content):
+        input_tokens = estimate_tokens(self._prompt_text(prompt))
+        output_tokens = estimate_tokens(content)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def _chunks(self, content):
+        size = max(1, self.chunk_chars)
+        return [content[i : i + size] for i in range(0, len(content), size)]
+
+    def invoke(self, prompt, *args, **kwargs):
+        content = self.render(prompt)
+        time.sleep(self._delay(content))
+        self._maybe_fail()
+        return self._message(prompt, content)
+
+    def _message(self, prompt, content):
+        return AIMessage(
+            content=content,
+            usage_metadata=self._usage(prompt, content),
+            response_metadata={"finish_reason": self._finish_reason(prompt)},
+        )
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        content = self.render(prompt)
+        await asyncio.sleep(self._delay(content))
+        self._maybe_fail()
+        return self._message(prompt, content)
+
+    def _last_chunk(self, prompt, content):
+        return AIMessageChunk(
+            content="",
+            usage_metadata=self._usage(prompt, content),
+            response_metadata={"finish_reason": self._finish_reason(prompt)},
+        )
+
+    def stream(self, prompt, *args, **kwargs):
+        content = self.render(prompt)
+        chunks = self._chunks(content)
+        pause = self._delay(content) / len(chunks)
+        self._maybe_fail()
+        for chunk in chunks:
+            time.sleep(pause)
+            yield AIMessageChunk(content=chunk)
+        yield self._last_chunk(prompt, content)
+
+    async def astream(self, prompt, *args, **kwargs):
+        content = self.render(prompt)
+        chunks = self._chunks(content)
+        pause = self._delay(content) / len(chunks)
+        self._maybe_fail()
+        for chunk in chunks:
+            await asyncio.sleep(pause)
+            yield AIMessageChunk(content=chunk)
+        yield self._last_chunk(prompt, content)
+
+
+def create_fake_llm():
+    return FakeChatModel(
+        latency=float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "2.0")),
+        jitter=float(os.getenv("FAKE_LLM_JITTER_SECONDS", "0.5")),
+        failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
+        chunk_chars=int(os.getenv("FAKE_LLM_CHUNK_CHARS", "200")),
+        scenarios=int(os.getenv("FAKE_LLM_SCENARIOS", "12")),
+        cases_per_scenario=int(os.getenv("FAKE_LLM_CASES_PER_SCENARIO", "3")),
+        seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+        tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0")),
+        defect=os.getenv("FAKE_LLM_DEFECT", ""),
+    )
@@ -0,0 +1,362 @@
+import asyncio
+import difflib
+import re
+from collections import Counter
+
+from scripts import two_phase
+from scripts.parser import CASE_ID, clean_line, parse_test_cases
+
+# Incremental regeneration of an edited story. The new story and
+# acceptance criteria are diffed sentence by sentence against the version
+# the cached suite was generated from; only scenarios that mention what
+# changed are sent back to the model, and requirements no scenario covers
+# get new scenarios. Untouched scenarios are kept verbatim, so their
+# TS_/TC_ ids stay stable across edits:
+#
+# - a revised scenario keeps its TS id and reuses its TC ids in order;
+#   extra cases get ids after the highest TC id in the suite, ids it no
+#   longer needs are retired and never handed out again
+# - new scenarios are numbered after the highest TS and TC ids
+
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n+")
+WORD = re.compile(r"[a-z0-9]+")
+TITLE = re.compile(r"^test scenario\s*:\s*(.+)$", re.IGNORECASE)
+NUMBER = re.compile(r"\d+")
+CRITERIA_SECTION = re.compile(
+    r"(acceptance criteria[^\n]*\n)(.*?)(?=\n[ \t]*(?:-{3,}|#)|\Z)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can for from has have i in is it its not of on "
+    "or so that the their them they this to was we when which will with "
+    "should must user users validate whether".split()
+)
+REMOVED = "SCENARIO REMOVED"
+
+# An edited sentence at least this similar to a removed one is an edit
+# of it rather than a new requirement
+EDIT_SIMILARITY = 0.5
+
+# Completion sizes assumed when reserving tokens-per-minute quota
+SCENARIO_COMPLETION_TOKENS = two_phase.SCENARIO_COMPLETION_TOKENS
+ADDED_COMPLETION_TOKENS = 2 * two_phase.SCENARIO_COMPLETION_TOKENS
+
+# Above this share of changed sentences, or of scenarios to revise, one
+# full regeneration is cheaper than revising piecemeal
+MAX_CHANGE_RATIO = 0.5
+
+
+def sentences(text):
+    return [
+        " ".join(sentence.split())
+        for sentence in SENTENCE_BREAK.split(text or "")
+        if sentence.strip()
+    ]
+
+
+def terms(text):
+    return {
+        word
+        for word in WORD.findall(text.lower())
+        if word not in STOPWORDS and (len(word) > 2 or word.isdigit())
+    }
+
+
+class StoryDiff:
+    # Sentence level diff of two versions of a story and its criteria:
+    # edits (old, new), new requirements and dropped requirements
+
+    def __init__(self, old_story, old_criteria, new_story, new_criteria):
+        old = sentences(old_story) + sentences(old_criteria)
+        new = sentences(new_story) + sentences(new_criteria)
+        matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+        self.change_ratio = 1 - matcher.ratio() if old or new else 0.0
+        self.acceptance_criteria = (new_criteria or "").strip()
+        self.criteria_changed = (old_criteria or "").strip() != self.acceptance_criteria
+
+        self.edits = []
+        self.added = []
+        self.removed = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != "equal":
+                self._pair(old[i1:i2], new[j1:j2])
+
+    def _pair(self, removed, added):
+        # Each added sentence is an edit of the most similar removed one,
+        # if any is similar enough
+        removed = list(removed)
+        for sentence in added:
+            scored = [
+                (difflib.SequenceMatcher(None, old, sentence).ratio(), old)
+                for old in removed
+            ]
+            similarity, old = max(scored, default=(0.0, None))
+            if similarity >= EDIT_SIMILARITY:
+                removed.remove(old)
+                self.edits.append((old, sentence))
+            else:
+                self.added.append(sentence)
+        self.removed += removed
+
+    @property
+    def unchanged(self):
+        return not (self.edits or self.added or self.removed)
+
+    def changed_terms(self):
+        # Words that appear or disappear with the edit
+        old = Counter()
+        new = Counter()
+        for before, after in self.edits:
+            old.update(terms(before))
+            new.update(terms(after))
+        for sentence in self.removed:
+            old.update(terms(sentence))
+        for sentence in self.added:
+            new.update(terms(sentence))
+        return sorted(set(old - new) | set(new - old))
+
+    def summary(self):
+        lines = []
+        for before, after in self.edits:
+            lines.append(f'- Changed: "{before}" -> "{after}"')
+        for sentence in self.added:
+            lines.append(f'- Added: "{sentence}"')
+        for sentence in self.removed:
+            lines.append(f'- Removed: "{sentence}"')
+        return "\n".join(lines)
+
+    def report(self):
+        return {
+            "change_ratio": round(self.change_ratio, 3),
+            "edited": [{"before": b, "after": a} for b, a in self.edits],
+            "added": self.added,
+            "removed": self.removed,
+            "changed_terms": self.changed_terms(),
+        }
+
+
+class ScenarioBlock:
+    __slots__ = ("id", "title", "case_ids", "text")
+
+    def __init__(self, id, title, case_ids, text):
+        self.id = id
+        self.title = title
+        self.case_ids = case_ids
+        self.text = text
+
+
+def split_scenarios(content):
+    # (preamble, blocks), every block one scenario's markdown verbatim
+    headings = two_phase.SCENARIO_HEADING.finditer(content)
+    starts = [heading.start() for heading in headings]
+    blocks = []
+    for start, end in zip(starts, starts[1:] + [len(content)]):
+        text = content[start:end]
+        scenarios = parse_test_cases(text)
+        if not scenarios:
+            continue
+        blocks.append(
+            ScenarioBlock(
+                scenarios[0].id, scenarios[0].title, CASE_ID.findall(text), text
+            )
+        )
+    return content[: starts[0]] if starts else content, blocks
+
+
+def id_number(item_id):
+    match = NUMBER.search(item_id or "")
+    return int(match.group()) if match else 0
+
+
+def scenario_title(text):
+    for line in text.splitlines():
+        match = TITLE.match(clean_line(line))
+        if match:
+            return match.group(1).strip()
+    return None
+
+
+def scenario_block(scenario_id, title, section):
+    lines = [
+        f"#### **Test Scenario ID: {scenario_id}**  ",
+        f"**Test Scenario:** {title}  ",
+        "",
+        section,
+        "",
+        "---",
+        "",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def verbatim(block):
+    return block.text if block.text.endswith("\n") else block.text + "\n"
+
+
+def assign_case_ids(section, ids, next_case):
+    # Gives the cases of a section the ids in ids, in order, and fresh
+    # ones from next_case on to any extra cases. Returns (section,
+    # assigned ids, next free number).
+    assigned = []
+
+    def replace(match):
+        nonlocal next_case
+        if len(assigned) < len(ids):
+            case_id = ids[len(assigned)]
+        else:
+            case_id = f"TC_{next_case:02d}"
+            next_case += 1
+        assigned.append(case_id)
+        return f"{match.group(1)}{case_id}"
+
+    return two_phase.CASE_ID.sub(replace, section), assigned, next_case
+
+
+def replace_criteria(preamble, acceptance_criteria):
+    # The document header repeats the acceptance criteria it was given
+    if not acceptance_criteria:
+        return preamble
+    return CRITERIA_SECTION.sub(
+        lambda match: f"{match.group(1)}{acceptance_criteria.strip()}\n",
+        preamble,
+        count=1,
+    )
+
+
+def affected_scenarios(diff, blocks):
+    # Scenarios sharing a distinctive word with an edited or removed
+    # sentence. Words most scenarios contain (the story's subject) say
+    # nothing about which scenario a sentence belongs to and are ignored.
+    block_terms = [terms(block.text) for block in blocks]
+    frequency = Counter(term for found in block_terms for term in found)
+    generic = {term for term, found in frequency.items() if found > len(blocks) / 2}
+
+    affected = set()
+    uncovered = []
+    for before, after in diff.edits:
+        key_terms = (terms(before) | terms(after)) - generic
+        matched = {i for i, found in enumerate(block_terms) if key_terms & found}
+        if matched:
+            affected |= matched
+        else:
+            # Nothing covered the old wording, so cover the new one
+            uncovered.append(after)
+    for sentence in diff.removed:
+        key_terms = terms(sentence) - generic
+        affected |= {i for i, found in enumerate(block_terms) if key_terms & found}
+    return sorted(affected), uncovered + diff.added
+
+
+class IncrementalPlan:
+    # What an edit needs: which scenarios to revise and which new
+    # requirements need scenarios, or the reason to regenerate everything
+
+    def __init__(self, diff, content):
+        self.diff = diff
+        self.preamble, self.blocks = split_scenarios(content)
+        self.affected = []
+        self.new_requirements = []
+        self.full_reason = None
+
+        if not self.blocks:
+            self.full_reason = "previous suite has no scenarios"
+            return
+        if diff.change_ratio > MAX_CHANGE_RATIO:
+            self.full_reason = (
+                f"{diff.change_ratio:.0%} of the story changed, "
+                f"above {MAX_CHANGE_RATIO:.0%}"
+            )
+            return
+        self.affected, self.new_requirements = affected_scenarios(diff, self.blocks)
+        if len(self.affected) > MAX_CHANGE_RATIO * len(self.blocks):
+            self.full_reason = (
+                f"{len(self.affected)} of {len(self.blocks)} scenarios affected"
+            )
+
+
+async def regenerate(plan, call, revision_prompt, added_prompt):
+    # call(prompt, expected_tokens) -> (content, usage) runs one model
+    # call. revision_prompt(changes, scenario) and added_prompt(changes,
+    # existing titles) build the prompts. Returns (content, usages,
+    # report) for the merged suite.
+    diff = plan.diff
+    changes = diff.summary()
+    blocks = plan.blocks
+
+    revisions = [
+        call(revision_prompt(changes, blocks[i].text), SCENARIO_COMPLETION_TOKENS)
+        for i in plan.affected
+    ]
+    if plan.new_requirements:
+        existing = "\n".join(f"- {block.title}" for block in blocks)
+        requirements = "\n".join(f"- {line}" for line in plan.new_requirements)
+        revisions.append(
+            call(added_prompt(requirements, existing), ADDED_COMPLETION_TOKENS)
+        )
+    results = await asyncio.gather(*revisions)
+    revised = dict(zip(plan.affected, results))
+    added_text = results[-1][0] if plan.new_requirements else ""
+
+    next_case = 1 + max(
+        (id_number(case_id) for block in blocks for case_id in block.case_ids),
+        default=0,
+    )
+    report = {
+        "scenarios": {"unchanged": [], "revised": [], "added": [], "removed": []},
+        "test_cases": {"kept": [], "revised": [], "added": [], "retired": []},
+    }
+    scenarios = report["scenarios"]
+    cases = report["test_cases"]
+
+    preamble = plan.preamble
+    if diff.criteria_changed:
+        preamble = replace_criteria(preamble, diff.acceptance_criteria)
+    parts = [preamble]
+    for index, block in enumerate(blocks):
+        if index not in revised:
+            parts.append(verbatim(block))
+            scenarios["unchanged"].append(block.id)
+            cases["kept"] += block.case_ids
+            continue
+
+        text = revised[index][0]
+        section = two_phase.case_section(text)
+        if REMOVED in text.upper() and not section:
+            scenarios["removed"].append(block.id)
+            cases["retired"] += block.case_ids
+            continue
+        if not section:
+            # Nothing usable came back; the old scenario is kept as is
+            parts.append(verbatim(block))
+            scenarios["unchanged"].append(block.id)
+            cases["kept"] += block.case_ids
+            continue
+
+        section, assigned, next_case = assign_case_ids(
+            section, block.case_ids, next_case
+        )
+        parts.append(
+            scenario_block(block.id, scenario_title(text) or block.title, section)
+        )
+        scenarios["revised"].append(block.id)
+        reused = [case_id for case_id in block.case_ids if case_id in assigned]
+        cases["revised"] += reused
+        cases["added"] += [case_id for case_id in assigned if case_id not in reused]
+        cases["retired"] += [
+            case_id for case_id in block.case_ids if case_id not in assigned
+        ]
+
+    next_scenario = 1 + max((id_number(block.id) for block in blocks), default=0)
+    for block in split_scenarios(added_text)[1]:
+        section = two_phase.case_section(block.text)
+        if not section:
+            continue
+        section, assigned, next_case = assign_case_ids(section, [], next_case)
+        scenario_id = f"TS_{next_scenario:02d}"
+        next_scenario += 1
+        parts.append(scenario_block(scenario_id, block.title or scenario_id, section))
+        scenarios["added"].append(scenario_id)
+        cases["added"] += assigned
+
+    return "".join(parts), [usage for _, usage in results], report
@@ -0,0 +1,156 @@
+import asyncio
+import os
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# Only the fields StoryItem is built from are requested from Jira
+STORY_FIELDS = [
+    "summary",
+    "description",
+    "priority",
+    "status",
+    "assignee",
+    "duedate",
+    "labels",
+]
+
+# The hierarchical fetch adds the subtasks and issue links Jira embeds in
+# every story (key, summary, status, type only). Issues whose text goes
+# into the acceptance criteria are then fetched in bulk, by key.
+HIERARCHY_FIELDS = STORY_FIELDS + ["issuetype", "subtasks", "issuelinks"]
+RELATED_FIELDS = ["summary", "description", "issuetype", "status"]
+
+PAGE_SIZE = int(os.getenv("JIRA_PAGE_SIZE", "100"))
+PAGE_CONCURRENCY = int(os.getenv("JIRA_PAGE_CONCURRENCY", "4"))
+# Keys per "key in (...)" search, well below Jira's JQL length limits
+KEYS_PER_SEARCH = int(os.getenv("JIRA_KEYS_PER_SEARCH", "100"))
+
+# Block-level nodes of Atlassian document format text, one line each
+ADF_BLOCKS = {"doc", "bulletList", "orderedList", "listItem", "table", "tableRow"}
+
+
+# JQL dates only have minute precision, so deltas overlap by this much
+SYNC_OVERLAP_SECONDS = 60
+
+
+def epic_stories_jql(epic_id, updated_since=None):
+    updated = f' AND updated >= "{updated_since}"' if updated_since else ""
+    return f'"Epic Link" = {epic_id} AND issuetype = Story{updated} ORDER BY key ASC'
+
+
+def keys_jql(keys):
+    return f"key in ({', '.join(keys)}) ORDER BY key ASC"
+
+
+def jql_datetime(timestamp, time_zone):
+    # Jira evaluates JQL dates in the searching user's own time zone
+    moment = datetime.fromtimestamp(
+        timestamp - SYNC_OVERLAP_SECONDS, ZoneInfo(time_zone)
+    )
+    return moment.strftime("%Y/%m/%d %H:%M")
+
+
+async def search_pages(
+    jira,
+    jql,
+    fields,
+    page_size=PAGE_SIZE,
+    concurrency=PAGE_CONCURRENCY,
+    validate_query=None,
+):
+    # Yields (start_at, total, raw_issues) for every page of the result set.
+    # The first page tells us the total, the remaining pages are then
+    # requested concurrently and yielded as soon as each one arrives.
+    options = {"validate_query": validate_query} if validate_query else {}
+    first = await jira.search(jql, 0, page_size, fields, **options)
+    total = first.get("total", 0)
+    yield 0, total, first.get("issues", [])
+
+    # Jira may cap maxResults below what we asked for
+    step = len(first.get("issues", [])) or page_size
+    if step >= total:
+        return
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(start_at):
+        async with semaphore:
+            page = await jira.search(jql, start_at, step, fields, **options)
+        return start_at, page.get("issues", [])
+
+    tasks = [asyncio.ensure_future(fetch(start)) for start in range(step, total, step)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            start_at, issues = await next_done
+            yield start_at, total, issues
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def search_all(jira, jql, fields, **kwargs):
+    # All issues of the result set, in the order the JQL sorts them
+    pages = []
+    async for start_at, _, issues in search_pages(jira, jql, fields, **kwargs):
+        pages.append((start_at, issues))
+
+    pages.sort(key=lambda page: page[0])
+    return [issue for _, issues in pages for issue in issues]
+
+
+async def fetch_issues(
+    jira, keys, fields, chunk_size=KEYS_PER_SEARCH, concurrency=PAGE_CONCURRENCY
+):
+    # Issues by key, chunk_size keys per search and the searches run
+    # concurrently: one request per chunk instead of one per issue. Keys
+    # that do not exist or the user cannot see are left out.
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(chunk):
+        # Paged like any search in case Jira caps maxResults lower
+        try:
+            async with semaphore:
+                return await search_all(
+                    jira,
+                    keys_jql(chunk),
+                    fields,
+                    page_size=len(chunk),
+                    validate_query="warn",
+                )
+        except Exception as e:
+            if getattr(e, "status_code", None) != 400:
+                raise
+        # Jira versions that still reject the query: halve the chunk
+        # until the offending keys are isolated
+        if len(chunk) == 1:
+            return []
+        middle = len(chunk) // 2
+        halves = await asyncio.gather(fetch(chunk[:middle]), fetch(chunk[middle:]))
+        return halves[0] + halves[1]
+
+    chunks = [keys[i : i + chunk_size] for i in range(0, len(keys), chunk_size)]
+    results = await asyncio.gather(*(fetch(chunk) for chunk in chunks))
+    return {issue["key"]: issue for issues in results for issue in issues}
+
+
+def field_text(value):
+    # Plain text of a Jira field value: text, select options, users, lists
+    # of those, or an Atlassian document (rich text fields on Cloud)
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, list):
+        return "\n".join(filter(None, (field_text(item) for item in value)))
+    if isinstance(value, dict):
+        if value.get("type") == "text":
+            return value.get("text") or ""
+        if "content" in value:
+            separator = "\n" if value.get("type") in ADF_BLOCKS else ""
+            parts = (field_text(node) for node in value["content"] or [])
+            return separator.join(filter(None, parts)).strip()
+        for name in ("value", "name", "displayName", "key"):
+            if value.get(name):
+                return str(value[name]).strip()
+        return ""
+    return str(value)
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import httpx
+
+from scripts.cache import MemoryLRUCache
+from scripts.metrics import stage_seconds
+
+
+class JiraError(Exception):
+    # Error response from Jira. Mirrors the jira package's JIRAError
+    # (status_code, text, url) without importing that package.
+
+    def __init__(self, text=None, status_code=None, url=None):
+        super().__init__(text)
+        self.text = text
+        self.status_code = status_code
+        self.url = url
+
+    def __str__(self):
+        return f"JiraError HTTP {self.status_code} url: {self.url}\n\ttext: {self.text}"
+
+
+class JiraSession:
+    # Async client for the handful of Jira REST calls the API makes.
+    # Each session keeps its own keep-alive connection pool, so repeated
+    # calls for the same credentials reuse open connections.
+
+    def __init__(self, domain, email, token):
+        self.domain = domain.rstrip("/")
+        self.user = None
+        self.validated_at = None
+        self.client = httpx.AsyncClient(
+            base_url=f"{self.domain}/rest/api/2/",
+            auth=(email, token),
+            headers={"Accept": "application/json"},
+            timeout=httpx.Timeout(float(os.getenv("JIRA_TIMEOUT_SECONDS", "30"))),
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("JIRA_MAX_CONNECTIONS", "10")),
+                max_keepalive_connections=int(os.getenv("JIRA_MAX_KEEPALIVE", "10")),
+                keepalive_expiry=60,
+            ),
+        )
+
+    async def _request(self, method, path, **kwargs):
+        with stage_seconds.time(stage="jira_fetch"):
+            response = await self.client.request(method, path, **kwargs)
+        if response.status_code >= 400:
+            raise JiraError(
+                text=response.text,
+                status_code=response.status_code,
+                url=str(response.url),
+            )
+        return response.json()
+
+    async def myself(self):
+        return await self._request("GET", "myself")
+
+    async def issue(self, key, fields=None):
+        params = {"fields": ",".join(fields)} if fields else None
+        return await self._request("GET", f"issue/{key}", params=params)
+
+    async def search(
+        self, jql, start_at=0, max_results=100, fields=None, validate_query=None
+    ):
+        body = {"jql": jql, "startAt": start_at, "maxResults": max_results}
+        if fields is not None:
+            # An empty list asks for keys only
+            body["fields"] = list(fields)
+        if validate_query:
+            # "warn": unknown or hidden keys in the JQL become warnings
+            # instead of failing the whole query with a 400
+            body["validateQuery"] = validate_query
+        return await self._request("POST", "search", json=body)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class JiraSessionPool:
+    # Sessions keyed on a hash of the full credentials (the token included),
+    # evicted after idle_ttl seconds or once max_sessions is exceeded.
+    # /authenticate results are reused for auth_ttl seconds.
+
+    def __init__(self, max_sessions=256, idle_ttl=900, auth_ttl=300):
+        self.auth_ttl = auth_ttl
+        self._sessions = MemoryLRUCache(
+            max_entries=max_sessions, ttl=idle_ttl, on_evict=self._close
+        )
+        self._closing = set()
+
+    @staticmethod
+    def credentials_key(domain, email, token):
+        combined = f"{domain.rstrip('/')}\0{email}\0{token}"
+        return hashlib.sha256(combined.encode()).hexdigest()
+
+    def get(self, domain, email, token):
+        key = self.credentials_key(domain, email, token)
+        session = self._sessions.get(key)
+        if session is None:
+            session = JiraSession(domain, email, token)
+            self._sessions.set(key, session)
+        return session
+
+    async def authenticate(self, session):
+        now = time.monotonic()
+        if session.user is not None and now - session.validated_at <= self.auth_ttl:
+            return session.user
+
+        session.user = await session.myself()
+        session.validated_at = now
+        return session.user
+
+    def _close(self, session):
+        try:
+            task = asyncio.get_running_loop().create_task(session.aclose())
+        except RuntimeError:
+            return
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def close_all(self):
+        self._sessions.clear()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+    def stats(self):
+        return {**self._sessions.stats(), "auth_ttl": self.auth_ttl}
+
+
+def create_session_pool():
+    return JiraSessionPool(
+        max_sessions=int(os.getenv("JIRA_SESSION_POOL_SIZE", "256")),
+        idle_ttl=float(os.getenv("JIRA_SESSION_IDLE_TTL_SECONDS", "900")),
+        auth_ttl=float(os.getenv("JIRA_AUTH_CACHE_TTL_SECONDS", "300")),
+    )
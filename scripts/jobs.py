@@ -0,0 +1,310 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from scripts.cache import open_database
+
+# Persistent generation queue. Jobs live in SQLite, so they survive a
+# restart and any process with workers (JOB_WORKERS > 0) can run them;
+# API processes can set JOB_WORKERS=0 and leave the work to others.
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class JobQueue:
+    def __init__(self, path, lease_seconds=900, max_attempts=3):
+        self.path = path
+        # A running job whose lease expired is assumed to belong to a dead
+        # worker and is handed out again
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = open_database(path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                lease_until REAL,
+                not_before REAL NOT NULL DEFAULT 0,
+                dedupe_key TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_ready
+                ON jobs (status, priority DESC, created_at);
+            """
+        )
+        self._migrate()
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key, status)"
+        )
+
+    def _migrate(self):
+        # Queue databases created before delayed, deduplicated jobs
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        added = (
+            ("not_before", "REAL NOT NULL DEFAULT 0"),
+            ("dedupe_key", "TEXT"),
+        )
+        for name, definition in added:
+            if name not in columns:
+                try:
+                    self._conn.execute(
+                        f"ALTER TABLE jobs ADD COLUMN {name} {definition}"
+                    )
+                except sqlite3.OperationalError:
+                    # Another process added it first
+                    pass
+
+    def submit(self, kind, payload, priority=0, job_id=None):
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, priority, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), QUEUED, priority, now, now),
+            )
+        return job_id
+
+    def schedule(self, kind, payload, dedupe_key, delay, priority=0):
+        # Debounced submit: while a job with the same dedupe_key is still
+        # queued, it gets the new payload and its start moves to delay
+        # seconds from now. Returns (job_id, merged into a queued job).
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status = ? "
+                    "LIMIT 1",
+                    (dedupe_key, QUEUED),
+                ).fetchone()
+                if row is not None:
+                    job_id = row[0]
+                    self._conn.execute(
+                        "UPDATE jobs SET payload = ?, priority = ?, "
+                        "not_before = ?, updated_at = ? WHERE id = ?",
+                        (json.dumps(payload), priority, now + delay, now, job_id),
+                    )
+                else:
+                    job_id = uuid.uuid4().hex
+                    self._conn.execute(
+                        "INSERT INTO jobs (id, kind, payload, status, priority, "
+                        "created_at, updated_at, not_before, dedupe_key) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            job_id,
+                            kind,
+                            json.dumps(payload),
+                            QUEUED,
+                            priority,
+                            now,
+                            now,
+                            now + delay,
+                            dedupe_key,
+                        ),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id, row is not None
+
+    def claim(self):
+        # Atomically moves the next ready job to running for this worker
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs "
+                    "WHERE (status = ? AND not_before <= ?) "
+                    "OR (status = ? AND lease_until < ?) "
+                    "ORDER BY priority DESC, created_at LIMIT 1",
+                    (QUEUED, now, RUNNING, now),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, "
+                        "updated_at = ?, lease_until = ? WHERE id = ?",
+                        (RUNNING, now, now + self.lease_seconds, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        job_id, kind, payload, attempts = row
+        return {
+            "id": job_id,
+            "kind": kind,
+            "payload": json.loads(payload),
+            "attempt": attempts + 1,
+        }
+
+    def renew(self, job_id):
+        # Extends the lease of a job still running; workers call this while
+        # the handler runs so a long job is not claimed a second time
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ?",
+                (time.time() + self.lease_seconds, job_id, RUNNING),
+            )
+
+    def requeue(self, job_id, error):
+        # Back to the queue without using up an attempt, e.g. on shutdown
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, attempts = "
+                "MAX(attempts - 1, 0), updated_at = ?, lease_until = NULL "
+                "WHERE id = ?",
+                (QUEUED, error, time.time(), job_id),
+            )
+
+    def complete(self, job_id, result):
+        self._finish(job_id, SUCCEEDED, result=json.dumps(result))
+
+    def fail(self, job_id, error, attempt):
+        if attempt < self.max_attempts:
+            # Back to the queue for another worker to pick up
+            self._finish(job_id, QUEUED, error=error)
+        else:
+            self._finish(job_id, FAILED, error=error)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, "
+                "updated_at = ?, lease_until = NULL WHERE id = ?",
+                (status, result, error, time.time(), job_id),
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, attempts, result, error, created_at, "
+                "updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        job_id, kind, status, attempts, result, error, created_at, updated_at = row
+        return {
+            "id": job_id,
+            "kind": kind,
+            "status": status,
+            "attempts": attempts,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def purge(self, older_than):
+        # Finished jobs are kept for polling until they are this old
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (*FINISHED, time.time() - older_than),
+            )
+
+    def stats(self):
+        with self._lock:
+            counts = dict(
+                self._conn.execute(
+                    "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+                )
+            )
+        statuses = (QUEUED, RUNNING, *FINISHED)
+        return {status: counts.get(status, 0) for status in statuses}
+
+
+class JobWorkers:
+    # Pool of asyncio workers pulling jobs from the queue. handlers maps a
+    # job kind to an async function taking the payload and returning a
+    # JSON-serialisable result.
+
+    def __init__(self, queue, handlers, workers=2, poll_interval=1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+
+    def notify(self):
+        # Wakes idle workers right away when a job is submitted locally
+        self._wakeup.set()
+
+    async def _work(self):
+        while True:
+            job = self.queue.claim()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            handler = self.handlers.get(job["kind"])
+            heartbeat = asyncio.ensure_future(self._heartbeat(job["id"]))
+            try:
+                if handler is None:
+                    raise ValueError(f"Unknown job kind: {job['kind']}")
+                result = await handler(job["payload"])
+            except asyncio.CancelledError:
+                # Shutting down: leave the job for the next worker
+                self.queue.requeue(job["id"], "worker stopped")
+                raise
+            except Exception as e:
+                self.queue.fail(job["id"], str(e), job["attempt"])
+            else:
+                self.queue.complete(job["id"], result)
+            finally:
+                heartbeat.cancel()
+
+    async def _heartbeat(self, job_id):
+        # Renews the lease well before it runs out
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            self.queue.renew(job_id)
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.ensure_future(self._work()) for _ in range(self.workers)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def create_job_queue():
+    return JobQueue(
+        os.getenv("JOB_DB_PATH", ".cache/jobs.sqlite3"),
+        lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "900")),
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+    )
@@ -1,24 +1,56 @@
-from langchain.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
 import os
+import threading
+
 from dotenv import load_dotenv
 
+# Nothing heavy happens at import: langchain and the provider SDK are
+# imported, and the model client built, the first time they are used.
+# llm_model and the prompt templates are module attributes resolved on
+# first access (see __getattr__), so `from scripts import llm` is cheap.
+
 load_dotenv()
 
+DEFAULT_MODEL = "gemma-3-27b-it"
+
+
+def create_llm(model=DEFAULT_MODEL):
+    # LLM_PROVIDER=fake swaps in the deterministic offline model
+    provider = os.getenv("LLM_PROVIDER", "gemini").lower()
+    if provider == "fake":
+        from scripts.fake_llm import create_fake_llm
+
+        return create_fake_llm()
+    if provider != "gemini":
+        raise ValueError(f"Unknown LLM_PROVIDER: {provider}")
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        api_key=os.getenv("gemini_api_key_2"),
+        model=model,
+        temperature=0.7,
+        max_tokens=None,
+        timeout=None,
+        max_retries=2,
+    )
+
 
-llm_model = ChatGoogleGenerativeAI(
-    api_key=os.getenv("gemini_api_key_2"),
-    model="gemma-3-27b-it",
-    temperature=0.7,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
+_clients = {}
+_clients_lock = threading.Lock()
 
 
-test_case_prompt = PromptTemplate(
-    input_variables=["user_story", "jira_id", "acceptance_criteria"],
-    template="""
+def get_llm(model=DEFAULT_MODEL):
+    # One client per model for the whole process, built on first use
+    client = _clients.get(model)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(model)
+            if client is None:
+                client = _clients[model] = create_llm(model)
+    return client
+
+
+TEST_CASE_TEMPLATE = """
 ### Task: AI Test Case Generator
 
 #### **Objective**  
@@ -96,5 +128,348 @@ You are an AI test case generator. Your job is to analyze JIRA user stories and
 
 
 Now generate the response.
-""",
-)
+"""
+
+
+# Two-phase generation: a short call lists the scenarios, then the test
+# cases of every scenario are generated by concurrent calls
+SCENARIO_OUTLINE_TEMPLATE = """
+### Task: AI Test Scenario Outline
+
+#### **Objective**  
+You are an AI test case generator. Your job is to analyze a JIRA user story and list the **test scenarios** needed to test it exhaustively. The test cases of each scenario are written separately, so do not write any test cases.
+
+---
+#### **Instructions**  
+1. **Extract key details** from the user story.
+2. **Most Importantly you should generate the same output for the same input which means that the output provided by you should not change or vary not even in number if I provide the same user story multiple times as input.
+3. **Derive acceptance criteria** from the provided input if not already provided.
+4. **Identify all possible test scenarios**, covering positive, negative, and edge cases, the coverage of the generated output should be atleast 95%.
+5. **The response should strictly contain minimum 11-15 test scenarios.**
+6. **Do not write test cases, preconditions, test data or steps.**
+
+---
+#### **Output Format**
+(Use this exact format in your response)
+
+---
+### **User Story**  
+**Story Title:** [Extracted from JIRA]  
+**Description:** [Extracted from JIRA]  
+**JIRA Issue ID:** {jira_id}  
+
+### **Acceptance Criteria**  
+{acceptance_criteria}
+
+---
+### **Test Scenarios & Test Cases**  
+
+#### **Test Scenario ID: TS_01**  
+**Test Scenario:** [Describe the purpose of testing this scenario and start the sentence with "validate whether"]  
+
+#### **Test Scenario ID: TS_02**  
+**Test Scenario:** [Describe the purpose of testing this scenario and start the sentence with "validate whether"]  
+
+---
+#### **Now list the test scenarios for the following user story:**
+
+**User Story:**  
+{user_story}  
+
+**JIRA Issue ID:** {jira_id}  
+
+**Expected Acceptance Criteria:**  
+{acceptance_criteria}  
+
+Now generate the response.
+"""
+
+SCENARIO_TEST_CASES_TEMPLATE = """
+### Task: AI Test Cases for One Scenario
+
+#### **Objective**  
+You are an AI test case generator. Write **detailed, structured, and exhaustive** test cases for a single test scenario of a JIRA user story.
+
+---
+#### **Test Scenario**  
+{scenario}
+
+---
+#### **Instructions**  
+1. **Generate minimum 2-3 test cases for this scenario only** (number of test cases may vary based on the type of scenario).
+2. **Most Importantly you should generate the same output for the same input.**
+3. **Number the test cases TC_01, TC_02, ...**
+4. **Output only the test cases**, no user story, acceptance criteria or scenario heading.
+5. **Avoid unnecessary explanations—output should be directly usable by QA engineers.**
+
+---
+#### **Example Output Format**
+(Use this exact format in your response)
+
+##### **Test Case ID: TC_01**  
+- **Test Case:** [Describe the purpose of this test case and start the sentence with "validate whether"]  
+- **Preconditions:** [Any necessary setup before execution]  
+- **Test Data:** [Example test data if applicable, with the disclaimer "The test data is just for guidance and the actual test data is to be determined by the user."]  
+- **Test Execution Steps:**  
+  1. Step 1  
+  2. Step 2  
+  3. Step 3  
+  4. Step 4
+  5. Provide as many steps as possible by carefully analysing the test case.
+- **Expected Outcome:** [Define the expected results]  
+- **Pass/Fail Criteria:**  
+  - **Pass:** [Conditions under which the test case passes]  
+  - **Fail:** [Conditions under which the test case fails]  
+- **Priority:** [Low | Medium | High]  
+- **References:** {jira_id}
+
+---
+#### **Now generate test cases for the scenario above, for the following user story:**
+
+**User Story:**  
+{user_story}  
+
+**JIRA Issue ID:** {jira_id}  
+
+**Expected Acceptance Criteria:**  
+{acceptance_criteria}  
+
+Now generate the response.
+"""
+
+
+# Incremental regeneration after a story edit: affected scenarios are
+# revised one by one, requirements no scenario covers get new ones
+SCENARIO_REVISION_TEMPLATE = """
+### Task: AI Test Scenario Revision
+
+#### **Objective**  
+You are an AI test case generator. A JIRA user story was edited. Update one existing test scenario and its test cases so they match the edited story.
+
+---
+#### **What Changed In The Story**  
+{changes}
+
+---
+#### **Existing Test Scenario**  
+{scenario}
+
+---
+#### **Instructions**  
+1. **Keep test cases that are still valid exactly as they are**, in the same order.
+2. **Update test cases affected by the change**, and add test cases for anything the change introduces to this scenario.
+3. **Drop test cases that no longer apply.**
+4. **Keep the Test Case IDs of existing test cases; number new ones after them.**
+5. If the whole scenario no longer applies to the edited story, respond with exactly: SCENARIO REMOVED
+6. **Output only the scenario line and its test cases**, in the format below.
+
+---
+#### **Output Format**
+(Use this exact format in your response)
+
+**Test Scenario:** [Describe the purpose of testing this scenario and start the sentence with "validate whether"]  
+
+##### **Test Case ID: TC_01**  
+- **Test Case:** [Describe the purpose of this test case and start the sentence with "validate whether"]  
+- **Preconditions:** [Any necessary setup before execution]  
+- **Test Data:** [Example test data if applicable, with the disclaimer "The test data is just for guidance and the actual test data is to be determined by the user."]  
+- **Test Execution Steps:**  
+  1. Step 1  
+  2. Step 2  
+- **Expected Outcome:** [Define the expected results]  
+- **Pass/Fail Criteria:**  
+  - **Pass:** [Conditions under which the test case passes]  
+  - **Fail:** [Conditions under which the test case fails]  
+- **Priority:** [Low | Medium | High]  
+- **References:** {jira_id}
+
+---
+#### **Edited user story:**
+
+**User Story:**  
+{user_story}  
+
+**JIRA Issue ID:** {jira_id}  
+
+**Expected Acceptance Criteria:**  
+{acceptance_criteria}  
+
+Now generate the response.
+"""
+
+ADDED_SCENARIOS_TEMPLATE = """
+### Task: AI Test Scenarios for New Requirements
+
+#### **Objective**  
+You are an AI test case generator. A JIRA user story was edited and gained requirements that no existing test scenario covers. Write test scenarios and test cases **only for these new requirements**.
+
+---
+#### **New Requirements**  
+{changes}
+
+---
+#### **Existing Test Scenarios (do not repeat these)**  
+{existing}
+
+---
+#### **Instructions**  
+1. **Cover positive, negative, and edge cases of the new requirements only.**
+2. **Generate minimum 2-3 test cases per scenario.**
+3. **Number scenarios TS_01, TS_02, ... and test cases TC_01, TC_02, ...**; they are renumbered afterwards.
+4. **Strictly follow the example format for readability and consistency.**
+
+---
+#### **Example Output Format**
+(Use this exact format in your response)
+
+#### **Test Scenario ID: TS_01**  
+**Test Scenario:** [Describe the purpose of testing this scenario and start the sentence with "validate whether"]  
+
+##### **Test Case ID: TC_01**  
+- **Test Case:** [Describe the purpose of this test case and start the sentence with "validate whether"]  
+- **Preconditions:** [Any necessary setup before execution]  
+- **Test Data:** [Example test data if applicable, with the disclaimer "The test data is just for guidance and the actual test data is to be determined by the user."]  
+- **Test Execution Steps:**  
+  1. Step 1  
+  2. Step 2  
+- **Expected Outcome:** [Define the expected results]  
+- **Pass/Fail Criteria:**  
+  - **Pass:** [Conditions under which the test case passes]  
+  - **Fail:** [Conditions under which the test case fails]  
+- **Priority:** [Low | Medium | High]  
+- **References:** {jira_id}
+
+---
+#### **Edited user story:**
+
+**User Story:**  
+{user_story}  
+
+**JIRA Issue ID:** {jira_id}  
+
+**Expected Acceptance Criteria:**  
+{acceptance_criteria}  
+
+Now generate the response.
+"""
+
+# Format repair: only the broken or missing sections of a document that
+# breaks the test_case_prompt format are requested, then spliced in
+FORMAT_REPAIR_TEMPLATE = """
+### Task: AI Test Case Format Repair
+
+#### **Objective**  
+You are an AI test case generator. A test case document you wrote for a JIRA user story has gaps: test cases with missing fields or cut off, scenarios with too few test cases, or too few scenarios. Write **only the sections needed to fix these problems**; they are merged into the existing document.
+
+---
+#### **Problems To Fix**  
+{problems}
+
+---
+#### **Affected Test Scenarios As Written**  
+{sections}
+
+---
+#### **Existing Test Scenarios (do not repeat these)**  
+{existing}
+
+---
+#### **Instructions**  
+1. **Rewrite every test case listed with a problem in full**, with every field, under its Test Scenario ID and keeping its Test Case ID.
+2. **Add the requested test cases to thin scenarios** under their Test Scenario ID, numbering new test cases from {next_case}.
+3. **Add new test scenarios only if the document needs more**, numbered from {next_scenario}, with minimum 2-3 test cases each, covering cases the existing scenarios miss.
+4. **Do not repeat test cases or scenarios that have no problem**, and do not write the user story or acceptance criteria.
+5. **Strictly follow the example format for readability and consistency.**
+
+---
+#### **Example Output Format**
+(Use this exact format in your response)
+
+#### **Test Scenario ID: TS_01**  
+**Test Scenario:** [Describe the purpose of testing this scenario and start the sentence with "validate whether"]  
+
+##### **Test Case ID: TC_01**  
+- **Test Case:** [Describe the purpose of this test case and start the sentence with "validate whether"]  
+- **Preconditions:** [Any necessary setup before execution]  
+- **Test Data:** [Example test data if applicable, with the disclaimer "The test data is just for guidance and the actual test data is to be determined by the user."]  
+- **Test Execution Steps:**  
+  1. Step 1  
+  2. Step 2  
+- **Expected Outcome:** [Define the expected results]  
+- **Pass/Fail Criteria:**  
+  - **Pass:** [Conditions under which the test case passes]  
+  - **Fail:** [Conditions under which the test case fails]  
+- **Priority:** [Low | Medium | High]  
+- **References:** {jira_id}
+
+---
+#### **User story the document was written for:**
+
+**User Story:**  
+{user_story}  
+
+**JIRA Issue ID:** {jira_id}  
+
+**Expected Acceptance Criteria:**  
+{acceptance_criteria}  
+
+Now generate the response.
+"""
+
+PROMPTS = {
+    "test_case_prompt": (
+        ["user_story", "jira_id", "acceptance_criteria"],
+        TEST_CASE_TEMPLATE,
+    ),
+    "scenario_outline_prompt": (
+        ["user_story", "jira_id", "acceptance_criteria"],
+        SCENARIO_OUTLINE_TEMPLATE,
+    ),
+    "scenario_test_cases_prompt": (
+        ["user_story", "jira_id", "acceptance_criteria", "scenario"],
+        SCENARIO_TEST_CASES_TEMPLATE,
+    ),
+    "scenario_revision_prompt": (
+        ["user_story", "jira_id", "acceptance_criteria", "changes", "scenario"],
+        SCENARIO_REVISION_TEMPLATE,
+    ),
+    "added_scenarios_prompt": (
+        ["user_story", "jira_id", "acceptance_criteria", "changes", "existing"],
+        ADDED_SCENARIOS_TEMPLATE,
+    ),
+    "format_repair_prompt": (
+        [
+            "user_story",
+            "jira_id",
+            "acceptance_criteria",
+            "problems",
+            "sections",
+            "existing",
+            "next_case",
+            "next_scenario",
+        ],
+        FORMAT_REPAIR_TEMPLATE,
+    ),
+}
+
+
+def __getattr__(name):
+    if name == "llm_model":
+        return get_llm()
+    if name in PROMPTS:
+        from langchain.prompts import PromptTemplate
+
+        input_variables, template = PROMPTS[name]
+        prompt = PromptTemplate(input_variables=input_variables, template=template)
+        # Cached as a real attribute, so this runs once per prompt
+        globals()[name] = prompt
+        return prompt
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def warm_up():
+    # Pays the import and client construction cost up front, e.g. before
+    # a worker starts taking traffic. Makes no model call.
+    get_llm()
+    for name in PROMPTS:
+        __getattr__(name)
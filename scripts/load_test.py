@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from scripts.benchmark import latency_summary
+
+# End-to-end load test of the Jira endpoints against the local Jira
+# stand-in (scripts/fake_jira.py).
+#
+#   python -m scripts.load_test --users 50 --iterations 5 --epic-size 1000
+#
+# Every simulated user authenticates, fetches its epic (plain and
+# streamed) and runs an incremental sync, each iteration. Besides
+# latency it checks the results, so truncated epics or a session pool
+# that stops reusing clients show up as failures.
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_jira(port):
+    # Runs the Jira stand-in on a real socket in a background thread
+    from scripts.fake_jira import app as fake_jira
+
+    config = uvicorn.Config(fake_jira, host="127.0.0.1", port=port, log_level="error")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def create_client(url, timeout):
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=timeout)
+
+    # Drive the ASGI app in this process
+    from app import app
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://load-test",
+        timeout=timeout,
+    )
+
+
+class Results:
+    def __init__(self):
+        self.latencies = {}
+        self.failures = []
+
+    async def timed(self, name, call):
+        start = time.perf_counter()
+        try:
+            response = await call()
+            response.raise_for_status()
+            return response
+        except Exception as e:
+            self.failures.append(f"{name}: {e}")
+            return None
+        finally:
+            self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+    def check(self, name, ok, detail):
+        if not ok:
+            self.failures.append(f"{name}: {detail}")
+
+
+async def simulate_user(client, results, user, args):
+    body = {
+        "domain": args.jira_url,
+        "email": f"user{user}@example.com",
+        "jira_id": f"LOAD-{user % args.epics + 1}",
+        "jira_token": f"token-{user}",
+    }
+
+    for _ in range(args.iterations):
+        await results.timed(
+            "authenticate", lambda: client.post("/authenticate", json=body)
+        )
+
+        response = await results.timed(
+            "fetch-stories", lambda: client.post("/fetch-stories", json=body)
+        )
+        if response is not None:
+            stories = response.json()["stories"]
+            results.check(
+                "fetch-stories",
+                len(stories) == args.epic_size,
+                f"expected {args.epic_size} stories, got {len(stories)}",
+            )
+
+        response = await results.timed(
+            "fetch-stories-stream",
+            lambda: client.post("/fetch-stories?stream=true", json=body),
+        )
+        if response is not None:
+            lines = [json.loads(line) for line in response.text.splitlines()]
+            count = sum(1 for line in lines if line["type"] == "story")
+            results.check(
+                "fetch-stories-stream",
+                count == args.epic_size,
+                f"expected {args.epic_size} streamed stories, got {count}",
+            )
+
+        await results.timed(
+            "sync-stories", lambda: client.post("/sync-stories", json=body)
+        )
+
+
+async def run(args):
+    results = Results()
+    async with create_client(args.url, args.timeout) as client:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(simulate_user(client, results, user, args) for user in range(args.users))
+        )
+        elapsed = time.perf_counter() - start
+        stats = (await client.get("/cache/stats")).json()
+
+    calls = sum(len(values) for values in results.latencies.values())
+    sessions = stats.get("jira_sessions", {})
+    results.check(
+        "session-pool",
+        args.url or sessions.get("entries", 0) <= args.users,
+        f"{sessions.get('entries')} sessions for {args.users} users",
+    )
+    return {
+        "users": args.users,
+        "iterations": args.iterations,
+        "epic_size": args.epic_size,
+        "wall_seconds": elapsed,
+        "calls": calls,
+        "throughput_rps": calls / elapsed if elapsed else 0.0,
+        "latency_seconds": {
+            name: latency_summary(values)
+            for name, values in results.latencies.items()
+        },
+        "jira_sessions": sessions,
+        "failures": len(results.failures),
+        "failure_samples": results.failures[:10],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Jira endpoints")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--epics", type=int, default=5)
+    parser.add_argument("--epic-size", type=int, default=250)
+    parser.add_argument("--url", help="API under test, defaults to app.app in-process")
+    parser.add_argument("--jira-url", help="Jira to use instead of the local stand-in")
+    parser.add_argument("--jira-latency", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    server = None
+    if not args.jira_url:
+        os.environ["FAKE_JIRA_EPIC_SIZE"] = str(args.epic_size)
+        os.environ["FAKE_JIRA_LATENCY_SECONDS"] = str(args.jira_latency)
+        port = free_port()
+        server = start_fake_jira(port)
+        args.jira_url = f"http://127.0.0.1:{port}"
+
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.should_exit = True
+
+    print(json.dumps(report, indent=2))
+    if report["failures"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
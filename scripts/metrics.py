@@ -0,0 +1,178 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal Prometheus text-format metrics. Values are per process; with
+# several uvicorn workers every worker exposes its own /metrics.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = []
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{value}"' for name, value in pairs)
+    return "{" + body + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self):
+        with self._lock:
+            return [
+                (self.name + _format_labels(self.labels, key), value)
+                for key, value in self._values.items()
+            ]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{sample} {value}" for sample, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        # A callback gauge is computed at scrape time
+        self.callback = callback
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback is not None:
+            return [(self.name, self.callback())]
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(
+                key, ([0] * len(self.buckets), 0.0, 0)
+            )
+            # Buckets are cumulative: a value counts in every bucket >= it
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [
+                (key, list(counts), total, count)
+                for key, (counts, total, count) in self._values.items()
+            ]
+
+        samples = []
+        for key, counts, total, count in items:
+            bounds = [*self.buckets, "+Inf"]
+            for bound, bucket_count in zip(bounds, [*counts, count]):
+                labels = _format_labels(self.labels, key, ("le", bound))
+                samples.append((f"{self.name}_bucket{labels}", bucket_count))
+            labels = _format_labels(self.labels, key)
+            samples.append((f"{self.name}_sum{labels}", total))
+            samples.append((f"{self.name}_count{labels}", count))
+        return samples
+
+
+def render():
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+stage_seconds = Histogram(
+    "stage_duration_seconds",
+    "Time spent per request stage",
+    labels=("stage",),
+)
+requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+)
+llm_tokens = Counter(
+    "llm_tokens_total",
+    "Tokens sent to and received from the model",
+    labels=("kind", "source"),
+)
+
+client_disconnects = Counter(
+    "client_disconnects_total",
+    "Requests whose client went away before the result, by whether the "
+    "generation was cancelled or kept for other waiters",
+    labels=("endpoint", "outcome"),
+)
+generation_cancellations = Counter(
+    "generation_cancellations_total",
+    "LLM generations cancelled because nobody was waiting for them any more",
+    labels=("kind",),
+)
+
+
+class InFlightMiddleware:
+    # Pure ASGI so streaming responses stay counted until the last byte
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            requests_in_flight.dec()
@@ -0,0 +1,361 @@
+import difflib
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+from scripts.cache import open_database
+from scripts.metrics import Counter
+
+# Many stories are templated clones ("Update X notification to use org
+# timezone") that differ in whitespace, casing, Jira wiki markup or a
+# product name. normalize_text() folds the first three into the cache key;
+# the index below finds the rest by MinHash over word shingles, so a clone
+# reuses an existing suite with the differing words swapped in. Reuse is
+# opt-in (NEAR_DUPLICATE_THRESHOLD or the request's similarity_threshold
+# below 1) and scoped to the tenant's own stories; other versions of the
+# same story are left to incremental regeneration.
+#
+# Signatures are split into bands for locality sensitive hashing: stories
+# sharing any band bucket are candidates. A candidate is reused when the
+# Jaccard similarity of the shingle sets, once its differing phrases are
+# substituted, reaches the threshold. Numbers, negations and stopwords are
+# never swapped: a story differing in a number or a negation is a
+# different requirement, not a clone.
+
+# Only Jira wiki markup is folded: operators, identifiers like user_id and
+# {placeholder} tokens change what a story asks for
+WIKI_MACRO = re.compile(r"\{(?:code|noformat|quote|panel|color)(?::[^}]*)?\}")
+WIKI_MONOSPACE = re.compile(r"\{\{(.+?)\}\}")
+WIKI_EMPHASIS = re.compile(r"(?<!\w)([*_])(?=\S)([^\n]*?\S)\1(?!\w)")
+WIKI_LINK = re.compile(r"\[([^|\]]*)\|[^\]]*\]")
+WIKI_HEADING = re.compile(r"^\s*h[1-6]\.\s", re.MULTILINE)
+WIKI_BULLET = re.compile(r"^\s*[*#-]+\s+", re.MULTILINE)
+WORD = re.compile(r"\w+")
+NEGATED = re.compile(r"n['’]t\b")
+# Lines and list markers adapt_content leaves alone
+ID_LINE = re.compile(r"(?:test (?:case|scenario)|jira issue) id\s*:", re.IGNORECASE)
+LIST_MARKER = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+
+NEGATIONS = set(
+    "cannot neither never no nobody none nor not nothing nowhere without".split()
+)
+STOPWORDS = set(
+    "a about after all an and any are as at be before being between both but by "
+    "can could do does each every for from has have if in into is it its may "
+    "might more most must of on only or other over same shall should so some "
+    "than that the their them then there these they this those to under until "
+    "up was were when where which while who will with would".split()
+)
+
+SHINGLE_WORDS = 3
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+# Largest prime below 2**32; (a * x + b) of 32-bit values fits in uint64
+PRIME = np.uint64(4294967291)
+_coefficients = np.random.default_rng(2024).integers(
+    1, int(PRIME), size=(2, NUM_PERM, 1), dtype=np.uint64
+)
+PERM_A, PERM_B = _coefficients
+
+# Longest differing phrase still adapted by substitution, in words, and
+# most phrases substituted; beyond that the stories are not clones
+MAX_SUBSTITUTION_WORDS = 3
+MAX_SUBSTITUTIONS = 3
+
+# Stories with less shingle overlap than this are not candidates at all
+MIN_SIMILARITY = 0.5
+
+near_duplicate_lookups = Counter(
+    "near_duplicate_lookups_total",
+    "Near-duplicate result cache lookups, by outcome",
+    labels=("outcome",),
+)
+
+
+def normalize_text(text):
+    # Lower case, NFKC, Jira wiki markup and whitespace removed
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = WIKI_MACRO.sub(" ", text)
+    text = WIKI_MONOSPACE.sub(r"\1", text)
+    text = WIKI_LINK.sub(r"\1", text)
+    text = WIKI_HEADING.sub("", text)
+    text = WIKI_BULLET.sub("", text)
+    text = WIKI_EMPHASIS.sub(r"\2", text)
+    return " ".join(text.split())
+
+
+def story_text(user_story, acceptance_criteria):
+    return normalize_text(f"{user_story}\n{acceptance_criteria or ''}")
+
+
+def shingles(text):
+    words = WORD.findall(text)
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {
+        " ".join(words[i : i + SHINGLE_WORDS])
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+
+
+def jaccard(first, second):
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+def shingle_hash(shingle):
+    digest = hashlib.blake2b(shingle.encode(), digest_size=4).digest()
+    return int.from_bytes(digest, "little")
+
+
+def signature(shingle_set):
+    if not shingle_set:
+        return np.full(NUM_PERM, int(PRIME), dtype=np.uint32)
+    hashes = np.fromiter(
+        (shingle_hash(shingle) for shingle in shingle_set),
+        dtype=np.uint64,
+        count=len(shingle_set),
+    )
+    # One row per permutation, minimum over all shingles
+    return ((PERM_A * hashes + PERM_B) % PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_buckets(sig):
+    return [
+        int.from_bytes(
+            hashlib.blake2b(bytes([band]) + rows.tobytes(), digest_size=8).digest(),
+            "little",
+            signed=True,
+        )
+        for band, rows in enumerate(sig.reshape(BANDS, ROWS))
+    ]
+
+
+class NearDuplicateIndex:
+    # Shingle signatures of every cached suite's inputs, shared by all
+    # worker processes on the host
+
+    def __init__(self, path, threshold=1.0):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = open_database(path)
+        self._migrate()
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS signatures (
+                cache_key TEXT PRIMARY KEY,
+                tenant TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                jira_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                bucket INTEGER NOT NULL,
+                cache_key TEXT NOT NULL,
+                PRIMARY KEY (bucket, cache_key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS buckets_cache_key ON buckets (cache_key);
+            """
+        )
+
+    def _migrate(self):
+        # Indexes from before entries were scoped to a tenant; their
+        # entries cannot be attributed, so the index starts over
+        columns = {
+            row[1] for row in self._conn.execute("PRAGMA table_info(signatures)")
+        }
+        if columns and "tenant" not in columns:
+            self._conn.executescript(
+                "DROP TABLE IF EXISTS signatures; DROP TABLE IF EXISTS buckets;"
+            )
+
+    def add(self, cache_key, tenant, mode, jira_id, text):
+        sig = signature(shingles(text))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO signatures "
+                    "(cache_key, tenant, mode, jira_id, text, signature, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        cache_key,
+                        tenant or "default",
+                        mode,
+                        jira_id,
+                        text,
+                        sig.tobytes(),
+                        time.time(),
+                    ),
+                )
+                self._conn.execute(
+                    "DELETE FROM buckets WHERE cache_key = ?", (cache_key,)
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO buckets (bucket, cache_key) VALUES (?, ?)",
+                    [(bucket, cache_key) for bucket in band_buckets(sig)],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def remove(self, cache_key):
+        with self._lock:
+            self._conn.execute("DELETE FROM buckets WHERE cache_key = ?", (cache_key,))
+            self._conn.execute(
+                "DELETE FROM signatures WHERE cache_key = ?", (cache_key,)
+            )
+
+    def candidates(self, tenant, mode, jira_id, text):
+        # Related stories of the tenant other than jira_id, most similar
+        # after substitution first, as dicts with the exact,
+        # MinHash-estimated and adapted similarity
+        shingle_set = shingles(text)
+        sig = signature(shingle_set)
+        buckets = band_buckets(sig)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT cache_key, jira_id, text, signature FROM signatures "
+                "WHERE tenant = ? AND mode = ? AND jira_id != ? "
+                "AND cache_key IN (SELECT cache_key FROM buckets "
+                f"WHERE bucket IN ({','.join('?' * len(buckets))}))",
+                (tenant or "default", mode, jira_id, *buckets),
+            ).fetchall()
+
+        found = []
+        for cache_key, jira_id, other, blob in rows:
+            similarity = jaccard(shingle_set, shingles(other))
+            if similarity < MIN_SIMILARITY:
+                continue
+            pairs, differences = substitutions(other, text)
+            adapted = adapt_content(other, pairs)
+            found.append(
+                {
+                    "cache_key": cache_key,
+                    "jira_id": jira_id,
+                    "similarity": similarity,
+                    "estimate": float(
+                        np.mean(np.frombuffer(blob, dtype=np.uint32) == sig)
+                    ),
+                    "adapted_similarity": jaccard(shingle_set, shingles(adapted)),
+                    "substitutions": pairs,
+                    "differences": differences,
+                    # Differences that rule out reuse at any similarity
+                    "meaning_changes": [
+                        difference
+                        for difference in differences
+                        if changes_meaning(difference["before"])
+                        or changes_meaning(difference["after"])
+                    ],
+                }
+            )
+        found.sort(key=lambda item: item["adapted_similarity"], reverse=True)
+        return found
+
+    def stats(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()
+        return {"entries": count, "threshold": self.threshold, "bands": BANDS}
+
+
+def changes_meaning(phrase):
+    # Numbers and negations decide what a test checks
+    return bool(NEGATED.search(phrase)) or any(
+        word in NEGATIONS or any(char.isdigit() for char in word)
+        for word in WORD.findall(phrase)
+    )
+
+
+def adaptable(phrase):
+    words = WORD.findall(phrase)
+    return (
+        bool(words)
+        and not changes_meaning(phrase)
+        and not any(word in STOPWORDS for word in words)
+    )
+
+
+def substitutions(source_text, target_text):
+    # Short phrases of source replaced in target, e.g. a product name;
+    # returns (pairs, other differences that substitution cannot cover)
+    source = source_text.split()
+    target = target_text.split()
+    matcher = difflib.SequenceMatcher(None, source, target, autojunk=False)
+    pairs = []
+    other = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        before = " ".join(source[i1:i2])
+        after = " ".join(target[j1:j2])
+        if (
+            tag == "replace"
+            and adaptable(before)
+            and adaptable(after)
+            and max(i2 - i1, j2 - j1) <= MAX_SUBSTITUTION_WORDS
+        ):
+            if (before, after) not in pairs:
+                pairs.append((before, after))
+        else:
+            other.append({"before": before, "after": after})
+    if len(pairs) > MAX_SUBSTITUTIONS:
+        other += [{"before": before, "after": after} for before, after in pairs]
+        pairs = []
+    return pairs, other
+
+
+def match_case(template, text):
+    if template.isupper() and len(template) > 1:
+        return text.upper()
+    if template[:1].isupper():
+        return text[:1].upper() + text[1:]
+    return text
+
+
+def adapt_content(content, pairs, source_jira_id=None, jira_id=None):
+    # Swaps the differing phrases (keeping the capitalisation found in the
+    # suite) and the issue key. ID lines and list markers are kept as they
+    # are.
+    patterns = [
+        (
+            re.compile(rf"(?<![\w-]){re.escape(before)}(?![\w-])", re.IGNORECASE),
+            after,
+        )
+        for before, after in pairs
+    ]
+    lines = []
+    for line in content.splitlines(keepends=True):
+        if patterns and not ID_LINE.search(line):
+            marker = LIST_MARKER.match(line)
+            start = marker.end() if marker else 0
+            text = line[start:]
+            for pattern, after in patterns:
+                text = pattern.sub(
+                    lambda match, after=after: match_case(match.group(), after), text
+                )
+            line = line[:start] + text
+        lines.append(line)
+    content = "".join(lines)
+    if source_jira_id and source_jira_id != jira_id:
+        pattern = re.compile(rf"(?<![\w-]){re.escape(source_jira_id)}(?![\w-])")
+        content = pattern.sub(jira_id, content)
+    return content
+
+
+def create_near_duplicate_index():
+    return NearDuplicateIndex(
+        os.getenv("NEAR_DUPLICATE_DB_PATH", ".cache/near_duplicates.sqlite3"),
+        # 1 turns reuse off unless a request asks for a lower threshold
+        threshold=float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "1")),
+    )
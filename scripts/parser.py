@@ -0,0 +1,185 @@
+import re
+
+# Structured view of the markdown produced with test_case_prompt.
+# The parser is line based and incremental: feed() it chunks as they are
+# streamed from the model and it hands back every scenario as soon as the
+# next one starts.
+
+SCENARIO_ID = re.compile(r"test scenario id\s*:\s*(TS[_-]?\d+)", re.IGNORECASE)
+CASE_ID = re.compile(r"test case id\s*:\s*(TC[_-]?\d+)", re.IGNORECASE)
+FIELD = re.compile(
+    r"^(test scenario|test case|preconditions|test data|test execution steps"
+    r"|expected outcome|pass/fail criteria|pass|fail|priority|references)\s*:\s*(.*)$",
+    re.IGNORECASE,
+)
+STEP = re.compile(r"^\d+[.)]\s*(.*)$")
+
+CASE_FIELDS = {
+    "test case": "title",
+    "preconditions": "preconditions",
+    "test data": "test_data",
+    "test execution steps": "steps",
+    "expected outcome": "expected_outcome",
+    "pass/fail criteria": None,
+    "pass": "pass_criteria",
+    "fail": "fail_criteria",
+    "priority": "priority",
+    "references": "references",
+}
+
+
+class TestCase:
+    __slots__ = (
+        "id",
+        "title",
+        "preconditions",
+        "test_data",
+        "steps",
+        "expected_outcome",
+        "pass_criteria",
+        "fail_criteria",
+        "priority",
+        "references",
+    )
+
+    def __init__(self, id):
+        self.id = id
+        self.title = None
+        self.preconditions = None
+        self.test_data = None
+        self.steps = []
+        self.expected_outcome = None
+        self.pass_criteria = None
+        self.fail_criteria = None
+        self.priority = None
+        self.references = None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class TestScenario:
+    __slots__ = ("id", "title", "test_cases")
+
+    def __init__(self, id):
+        self.id = id
+        self.title = None
+        self.test_cases = []
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "title": self.title,
+            "test_cases": [case.to_dict() for case in self.test_cases],
+        }
+
+
+def clean_line(line):
+    # Drop list bullets, headings and bold/italic markers
+    return line.strip().lstrip("#").strip().lstrip("-").strip().replace("*", "").strip()
+
+
+class TestCaseParser:
+    def __init__(self):
+        self.scenarios = []
+        self._buffer = ""
+        self._scenario = None
+        self._case = None
+        self._field = None
+
+    def feed(self, chunk):
+        # Returns the scenarios completed by this chunk
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        completed = []
+        for line in lines:
+            finished = self._parse_line(line)
+            if finished is not None:
+                completed.append(finished)
+        return completed
+
+    def close(self):
+        # Flushes the last line and returns the scenarios still open
+        completed = []
+        if self._buffer:
+            finished = self._parse_line(self._buffer)
+            self._buffer = ""
+            if finished is not None:
+                completed.append(finished)
+        if self._scenario is not None:
+            completed.append(self._scenario)
+            self._scenario = None
+        return completed
+
+    def _parse_line(self, raw):
+        line = clean_line(raw)
+        if not line:
+            return None
+
+        match = SCENARIO_ID.search(line)
+        if match:
+            finished = self._scenario
+            self._scenario = TestScenario(match.group(1))
+            self.scenarios.append(self._scenario)
+            self._case = None
+            self._field = None
+            return finished
+
+        if self._scenario is None:
+            return None
+
+        match = CASE_ID.search(line)
+        if match:
+            self._case = TestCase(match.group(1))
+            self._scenario.test_cases.append(self._case)
+            self._field = None
+            return None
+
+        if raw.lstrip().startswith("#") or line.strip("-") == "":
+            # A heading or separator outside the known structure ends the field
+            self._field = None
+            return None
+
+        match = FIELD.match(line)
+        if match:
+            self._set_field(match.group(1).lower(), match.group(2).strip())
+            return None
+
+        if self._field == "steps":
+            step = STEP.match(line)
+            self._case.steps.append(step.group(1) if step else line)
+        elif self._field is not None:
+            self._append(self._field, line)
+        return None
+
+    def _set_field(self, name, value):
+        if name == "test scenario":
+            if self._case is None:
+                self._scenario.title = value or None
+                self._field = "scenario_title"
+            return
+
+        if self._case is None:
+            return
+
+        self._field = CASE_FIELDS[name]
+        if self._field == "steps":
+            if value:
+                self._case.steps.append(value)
+        elif self._field is not None:
+            setattr(self._case, self._field, value or None)
+
+    def _append(self, field, text):
+        if field == "scenario_title":
+            target, name = self._scenario, "title"
+        else:
+            target, name = self._case, field
+        current = getattr(target, name)
+        setattr(target, name, f"{current} {text}" if current else text)
+
+
+def parse_test_cases(content):
+    parser = TestCaseParser()
+    parser.feed(content)
+    parser.close()
+    return parser.scenarios
@@ -0,0 +1,171 @@
+import hashlib
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is used without it
+    brotli = None
+
+# Conditional requests and response compression.
+#
+# ETags are strong validators. When a body is compressed the encoding is
+# appended to its ETag ("abc" becomes "abc-gzip"), so each representation
+# keeps a distinct tag; etag_matches() accepts either form.
+
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+# Bodies worth compressing; archives (xlsx) and media are left alone
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson")
+
+
+def body_etag(body):
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        for suffix in ENCODING_SUFFIXES:
+            if candidate.endswith(suffix + '"'):
+                candidate = candidate[: -len(suffix) - 1] + '"'
+                break
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified(request, etag):
+    # Bodyless 304 when the client already has etag, None otherwise
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+def conditional(request, response, etag=None):
+    # Tags a rendered response; 304 instead if the client has that body
+    etag = etag or body_etag(response.body)
+    response.headers["ETag"] = etag
+    return not_modified(request, etag) or response
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def encode(self, data, final):
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(
+            zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        )
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def encode(self, data, final):
+        out = self._compressor.process(data)
+        if final:
+            return out + self._compressor.finish()
+        return out + self._compressor.flush()
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    # Pure ASGI gzip/brotli compression. Unlike a buffering compressor,
+    # every streamed message is flushed through on its own, so SSE and
+    # NDJSON responses still arrive incrementally.
+
+    def __init__(self, app, minimum_size=1024, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _encoder(self, scope):
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            return lambda: BrotliEncoder(self.brotli_quality)
+        if "gzip" in accepted:
+            return lambda: GzipEncoder(self.gzip_level)
+        return None
+
+    async def __call__(self, scope, receive, send):
+        create_encoder = self._encoder(scope) if scope["type"] == "http" else None
+        if create_encoder is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder = None
+
+        async def send_compressed(message):
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                # Held back until the first body shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                if self._should_compress(start["status"], headers, body, more_body):
+                    encoder = create_encoder()
+                    self._encode_headers(headers, encoder.name)
+                    body = encoder.encode(body, final=not more_body)
+                    if not more_body:
+                        headers["Content-Length"] = str(len(body))
+                await send(start)
+                start = None
+            elif encoder is not None:
+                body = encoder.encode(body, final=not more_body)
+
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _should_compress(self, status, headers, body, more_body):
+        if status in (204, 206, 304) or "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        if not any(kind in content_type for kind in COMPRESSIBLE_TYPES):
+            return False
+        return more_body or len(body) >= self.minimum_size
+
+    def _encode_headers(self, headers, encoding):
+        headers["Content-Encoding"] = encoding
+        headers.add_vary_header("Accept-Encoding")
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        etag = headers.get("etag")
+        if etag and etag.endswith('"') and not etag.startswith("W/"):
+            headers["ETag"] = f'{etag[:-1]}-{encoding}"'
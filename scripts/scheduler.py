@@ -0,0 +1,322 @@
+import asyncio
+import itertools
+import os
+import random
+import time
+
+from scripts.metrics import Counter, Gauge, Histogram
+
+queue_wait_seconds = Histogram(
+    "llm_queue_wait_seconds",
+    "Time LLM calls waited for quota and a concurrency slot",
+    # Not by tenant: anonymous callers are tenants by address
+    labels=("priority",),
+)
+llm_retries = Counter(
+    "llm_retries_total", "LLM calls retried after a rate limit error"
+)
+
+
+class TokenBucket:
+    # Refills continuously at rate_per_minute up to capacity
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        refilled = self.tokens + (now - self.updated) * self.rate
+        self.tokens = min(self.capacity, refilled)
+        self.updated = now
+
+    def wait_time(self, amount):
+        # Seconds until amount can be taken; requests larger than the whole
+        # bucket only wait for a full one so they cannot stall forever
+        self._refill(time.monotonic())
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self._refill(time.monotonic())
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount):
+        self._refill(time.monotonic())
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self):
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0)
+
+
+class Ticket:
+    __slots__ = ("tenant", "priority", "tokens", "enqueued_at", "future")
+
+    def __init__(self, tenant, priority, tokens):
+        self.tenant = tenant
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+
+
+def priority_class(priority):
+    # Client requests run at 0 and above, batch and prewarm work below
+    return "interactive" if priority >= 0 else "background"
+
+
+def is_rate_limit_error(error):
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status == 429:
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(
+        marker in text
+        for marker in ("429", "resourceexhausted", "resource has been exhausted")
+    )
+
+
+class LLMScheduler:
+    # Admission control in front of the model:
+    # - RPM and TPM token buckets keep calls under the provider quota
+    # - higher priority tickets go first; within a priority, tenants (Jira
+    #   domains) take turns by virtual time: each grant advances the
+    #   tenant's clock, and a tenant that starts queueing joins at the
+    #   clock of the tenant served last, so past usage earns no credit
+    #   and no debt. Tenants without waiting tickets are forgotten.
+    # - rate limit errors are retried with exponential backoff and full
+    #   jitter, and drain the RPM bucket so other callers back off too
+
+    def __init__(
+        self,
+        max_concurrency=4,
+        requests_per_minute=30,
+        tokens_per_minute=1_000_000,
+        max_retries=5,
+        backoff_base=1.0,
+        backoff_max=60.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.rpm = TokenBucket(requests_per_minute)
+        self.tpm = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._queues = {}
+        self._served = {}  # tenant -> virtual time, while it has tickets
+        self._virtual = 0
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._loop = None
+        self._wakeup = None
+        self._dispatcher = None
+        self.granted = 0
+        self.retries = 0
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (e.g. a fresh asyncio.run())
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._dispatcher = None
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    def _forget(self, tenant):
+        del self._queues[tenant]
+        self._served.pop(tenant, None)
+
+    def _next_ticket(self):
+        best = None
+        for tenant, queue in list(self._queues.items()):
+            # Cancelled waiters are dropped lazily
+            while queue and queue[0][2].future.done():
+                queue.pop(0)
+            if not queue:
+                self._forget(tenant)
+                continue
+            priority, sequence, ticket = queue[0]
+            rank = (priority, self._served.get(tenant, 0), sequence)
+            if best is None or rank < best[0]:
+                best = (rank, tenant)
+        if best is None:
+            return None
+        return self._queues[best[1]][0][2]
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            ticket = None
+            if self._in_flight < self.max_concurrency:
+                ticket = self._next_ticket()
+            if ticket is None:
+                await self._wakeup.wait()
+                continue
+
+            delay = max(self.rpm.wait_time(1), self.tpm.wait_time(ticket.tokens))
+            if delay > 0:
+                # Sleep until quota refills, or until something changes
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            queue = self._queues[ticket.tenant]
+            queue.pop(0)
+            if ticket.future.done():
+                continue
+
+            self.rpm.consume(1)
+            self.tpm.consume(ticket.tokens)
+            self._in_flight += 1
+            self._virtual = self._served[ticket.tenant]
+            self._served[ticket.tenant] += 1
+            if not queue:
+                self._forget(ticket.tenant)
+            self.granted += 1
+            queue_wait_seconds.observe(
+                time.monotonic() - ticket.enqueued_at,
+                priority=priority_class(ticket.priority),
+            )
+            ticket.future.set_result(ticket)
+
+    async def acquire(self, tenant="default", priority=0, tokens=0):
+        ticket = Ticket(tenant, priority, tokens)
+        if tenant not in self._queues:
+            self._served[tenant] = self._virtual
+        queue = self._queues.setdefault(tenant, [])
+        # Lower rank is served first, so higher priorities are negated
+        queue.append((-priority, next(self._sequence), ticket))
+        queue.sort(key=lambda entry: entry[:2])
+
+        self._ensure_dispatcher()
+        self._wakeup.set()
+        try:
+            return await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Granted just as the waiter went away: give the slot back
+                self.release(ticket)
+            raise
+
+    def release(self, ticket, used_tokens=None):
+        self._in_flight -= 1
+        if used_tokens is not None and used_tokens != ticket.tokens:
+            # Settle the estimate against what the call really used
+            if used_tokens > ticket.tokens:
+                self.tpm.consume(used_tokens - ticket.tokens)
+            else:
+                self.tpm.refund(ticket.tokens - used_tokens)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _backoff(self, attempt):
+        ceiling = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return random.uniform(0, ceiling)
+
+    async def _retry_after(self, attempt):
+        self.retries += 1
+        llm_retries.inc()
+        await asyncio.sleep(self._backoff(attempt))
+
+    async def run(
+        self, factory, tenant="default", priority=0, tokens=0, usage=None
+    ):
+        # usage(result) -> total tokens actually spent, to settle the TPM bucket
+        attempt = 0
+        while True:
+            ticket = await self.acquire(tenant, priority, tokens)
+            used = None
+            try:
+                result = await factory()
+                used = usage(result) if usage else None
+                return result
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                self.rpm.drain()
+            finally:
+                self.release(ticket, used)
+
+            await self._retry_after(attempt)
+            attempt += 1
+
+    async def stream(
+        self, factory, tenant="default", priority=0, tokens=0, usage=None
+    ):
+        # Chunks of the stream factory() opens, as one admitted call. A
+        # rate limit error before the first chunk is retried as in run();
+        # once chunks were relayed it is raised. usage() -> total tokens
+        # spent, called when the stream has ended, settles the TPM bucket.
+        attempt = 0
+        while True:
+            ticket = await self.acquire(tenant, priority, tokens)
+            used = None
+            started = False
+            try:
+                async for chunk in factory():
+                    started = True
+                    yield chunk
+                used = usage() if usage else None
+                return
+            except Exception as e:
+                if (
+                    started
+                    or not is_rate_limit_error(e)
+                    or attempt >= self.max_retries
+                ):
+                    raise
+                self.rpm.drain()
+            finally:
+                self.release(ticket, used)
+
+            await self._retry_after(attempt)
+            attempt += 1
+
+    def stats(self):
+        now = time.monotonic()
+        waiting = {}
+        oldest = 0.0
+        for tenant, queue in self._queues.items():
+            live = [ticket for _, _, ticket in queue if not ticket.future.done()]
+            if live:
+                waiting[tenant] = len(live)
+                oldest = max(oldest, now - min(t.enqueued_at for t in live))
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "queue_depth": sum(waiting.values()),
+            "queue_depth_by_tenant": waiting,
+            "oldest_wait_seconds": oldest,
+            "granted": self.granted,
+            "retries": self.retries,
+            "rpm_available": self.rpm.tokens,
+            "tpm_available": self.tpm.tokens,
+        }
+
+
+def create_scheduler():
+    return LLMScheduler(
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+        requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30")),
+        tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000")),
+        max_retries=int(os.getenv("LLM_RATE_LIMIT_RETRIES", "5")),
+        backoff_base=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1")),
+        backoff_max=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60")),
+    )
+
+
+llm_scheduler = create_scheduler()
+
+queue_depth = Gauge(
+    "llm_queue_depth",
+    "LLM calls waiting for quota or a concurrency slot",
+    callback=lambda: llm_scheduler.stats()["queue_depth"],
+)
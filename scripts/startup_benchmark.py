@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Measures how long a fresh process takes to import the API and to answer
+# its first request, and which modules dominate the import.
+#
+#   python -m scripts.startup_benchmark --runs 5
+#   python -m scripts.startup_benchmark --max-import-seconds 1.5   # CI guard
+#
+# Every run is a new interpreter, as in a worker start or a cold start.
+# Fails when the median import exceeds --max-import-seconds or when one
+# of the heavy modules below is imported eagerly again.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed once a model or prompt is used, never at import
+DEFERRED_MODULES = (
+    "langchain",
+    "langchain_core",
+    "langchain_google_genai",
+    "google.generativeai",
+    "jira",
+)
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [name for name in {deferred!r} if name in sys.modules]
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+STARTUP_PROBE = """
+import json, time
+start = time.perf_counter()
+from fastapi.testclient import TestClient
+import {module}
+with TestClient({module}.app) as client:
+    client.get("/")
+    first_response = time.perf_counter() - start
+print(json.dumps({{"seconds": first_response}}))
+"""
+
+
+def run_probe(code, env, importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    completed = subprocess.run(
+        command + ["-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result, completed.stderr
+
+
+def slowest_imports(importtime_log, top):
+    # -X importtime lines: "import time: self [us] | cumulative | name",
+    # names indented two spaces per nesting level. Only the modules the
+    # probed module imports directly, so nothing is counted twice.
+    totals = {}
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if not cumulative.strip().isdigit() or depth != 1:
+            continue
+        totals[name.strip()] = int(cumulative) / 1_000_000
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    return dict(ranked[:top])
+
+
+def run(args):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    env.setdefault("LLM_PROVIDER", "fake")
+    env.setdefault("JOB_WORKERS", "0")
+
+    import_probe = IMPORT_PROBE.format(module=args.module, deferred=DEFERRED_MODULES)
+    imports = []
+    loaded = set()
+    log = ""
+    for _ in range(args.runs):
+        result, log = run_probe(import_probe, env, importtime=True)
+        imports.append(result["seconds"])
+        loaded.update(result["loaded"])
+
+    startup_probe = STARTUP_PROBE.format(module=args.module)
+    startups = [run_probe(startup_probe, env)[0]["seconds"] for _ in range(args.runs)]
+
+    failures = []
+    median_import = statistics.median(imports)
+    if args.max_import_seconds and median_import > args.max_import_seconds:
+        failures.append(
+            f"median import {median_import:.3f}s exceeds {args.max_import_seconds}s"
+        )
+    if loaded:
+        failures.append(f"imported eagerly: {', '.join(sorted(loaded))}")
+
+    return {
+        "module": args.module,
+        "runs": args.runs,
+        "import_seconds": {"median": median_import, "max": max(imports)},
+        "first_response_seconds": {
+            "median": statistics.median(startups),
+            "max": max(startups),
+        },
+        "slowest_imports_seconds": slowest_imports(log, args.top),
+        "eager_heavy_modules": sorted(loaded),
+        "failures": failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API import and startup")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-import-seconds", type=float)
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if report["failures"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
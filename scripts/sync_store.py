@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import time
+
+from scripts.cache import open_database
+
+
+def drop_unless_column(conn, table, column):
+    # Tables from before rows were keyed by column; their rows cannot be
+    # attributed, so they are dropped and rebuilt empty
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if columns and column not in columns:
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class EpicSnapshotStore:
+    # Last synced StoryItem snapshot of every epic, per Jira credentials
+    # (JiraSessionPool.credentials_key) since users of one site may not see
+    # the same stories, so an incremental sync only has to ask Jira for
+    # what changed since then.
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_database(path)
+        drop_unless_column(self._conn, "epic_snapshots", "credentials")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS epic_snapshots (
+                credentials TEXT NOT NULL,
+                epic_key TEXT NOT NULL,
+                synced_at REAL NOT NULL,
+                epic TEXT NOT NULL,
+                stories TEXT NOT NULL,
+                PRIMARY KEY (credentials, epic_key)
+            );
+            """
+        )
+
+    def load(self, credentials, epic_key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT synced_at, epic, stories FROM epic_snapshots "
+                "WHERE credentials = ? AND epic_key = ?",
+                (credentials, epic_key),
+            ).fetchone()
+
+        if row is None:
+            return None
+        synced_at, epic, stories = row
+        return synced_at, json.loads(epic), json.loads(stories)
+
+    def save(self, credentials, epic_key, synced_at, epic, stories):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO epic_snapshots "
+                "(credentials, epic_key, synced_at, epic, stories) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(credentials, epic_key) DO UPDATE SET "
+                "synced_at = excluded.synced_at, epic = excluded.epic, "
+                "stories = excluded.stories",
+                (
+                    credentials,
+                    epic_key,
+                    synced_at,
+                    json.dumps(epic),
+                    json.dumps(stories),
+                ),
+            )
+
+
+class StoryVersionStore:
+    # Inputs of the latest generated suite of every story and the result
+    # cache key it is stored under, the base an edited story is diffed
+    # against for incremental regeneration. Keyed by tenant (Jira site) as
+    # well, since issue keys repeat across sites.
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = open_database(path)
+        drop_unless_column(self._conn, "story_versions", "tenant")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS story_versions (
+                tenant TEXT NOT NULL,
+                jira_id TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                user_story TEXT NOT NULL,
+                acceptance_criteria TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (tenant, jira_id)
+            );
+            """
+        )
+
+    def load(self, tenant, jira_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cache_key, user_story, acceptance_criteria "
+                "FROM story_versions WHERE tenant = ? AND jira_id = ?",
+                (tenant or "default", jira_id),
+            ).fetchone()
+
+        if row is None:
+            return None
+        cache_key, user_story, acceptance_criteria = row
+        return {
+            "cache_key": cache_key,
+            "user_story": user_story,
+            "acceptance_criteria": acceptance_criteria,
+        }
+
+    def save(self, tenant, jira_id, cache_key, user_story, acceptance_criteria):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO story_versions (tenant, jira_id, cache_key, "
+                "user_story, acceptance_criteria, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(tenant, jira_id) DO UPDATE SET "
+                "cache_key = excluded.cache_key, user_story = excluded.user_story, "
+                "acceptance_criteria = excluded.acceptance_criteria, "
+                "updated_at = excluded.updated_at",
+                (
+                    tenant or "default",
+                    jira_id,
+                    cache_key,
+                    user_story,
+                    acceptance_criteria or "",
+                    time.time(),
+                ),
+            )
+
+
+def sync_db_path():
+    return os.getenv("EPIC_SYNC_DB_PATH", ".cache/epic_sync.sqlite3")
+
+
+def create_snapshot_store():
+    return EpicSnapshotStore(sync_db_path())
+
+
+def create_story_version_store():
+    return StoryVersionStore(sync_db_path())
@@ -0,0 +1,60 @@
+import math
+import re
+
+from scripts.metrics import llm_tokens
+
+# Words, numbers and single punctuation marks, roughly how SentencePiece
+# tokenizers split English text before merging sub-words
+PIECES = re.compile(r"\w+|[^\w\s]")
+
+# Average characters per sub-word token for Gemini/Gemma on English text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    # Local estimate for when the provider reports no usage: every
+    # punctuation mark is a token, long words split into ~4 char pieces
+    count = 0
+    for piece in PIECES.findall(text or ""):
+        count += max(1, math.ceil(len(piece) / CHARS_PER_TOKEN))
+    return count
+
+
+def merge_usage(total, usage):
+    # Adds up usage_metadata reported across streamed chunks
+    if not usage:
+        return total
+    total = dict(total or {})
+    for name in ("input_tokens", "output_tokens", "total_tokens"):
+        total[name] = total.get(name, 0) + (usage.get(name) or 0)
+    return total
+
+
+def token_usage(prompt, content, usage=None):
+    # Provider usage metadata when the model reports it, estimate otherwise
+    if usage and usage.get("output_tokens"):
+        prompt_tokens = usage.get("input_tokens") or estimate_tokens(prompt)
+        completion_tokens = usage["output_tokens"]
+        source = "provider"
+    else:
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(content)
+        source = "estimate"
+
+    llm_tokens.inc(prompt_tokens, kind="prompt", source=source)
+    llm_tokens.inc(completion_tokens, kind="completion", source=source)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "token_source": source,
+    }
+
+
+def sum_usage(usages):
+    # Totals token_usage() results of several calls for one document
+    fields = ("prompt_tokens", "completion_tokens", "total_tokens")
+    total = {name: sum(usage[name] for usage in usages) for name in fields}
+    sources = {usage["token_source"] for usage in usages}
+    total["token_source"] = "provider" if sources == {"provider"} else "estimate"
+    return total
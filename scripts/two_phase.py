@@ -0,0 +1,92 @@
+import asyncio
+import re
+
+from scripts.parser import parse_test_cases
+
+# Two-phase generation. Decoding one long completion dominates latency,
+# so a short first call lists the scenarios and the test cases of every
+# scenario are then generated concurrently. The pieces are merged back
+# into the single-call document format, numbered TS_01.. and TC_01..
+# across the whole story.
+
+HEADING_FLAGS = re.IGNORECASE | re.MULTILINE
+SCENARIO_HEADING = re.compile(r"^.*test scenario id\s*:", HEADING_FLAGS)
+CASE_HEADING = re.compile(r"^.*test case id\s*:", HEADING_FLAGS)
+CASE_ID = re.compile(r"(test case id\s*:\s*)TC[_-]?\d+", re.IGNORECASE)
+SEPARATOR = re.compile(r"(\n\s*-{3,}\s*)+$")
+
+# Completion sizes assumed when reserving tokens-per-minute quota
+OUTLINE_COMPLETION_TOKENS = 1000
+SCENARIO_COMPLETION_TOKENS = 1500
+
+
+def split_outline(content):
+    # The outline's header (user story, acceptance criteria) and the
+    # scenario titles it lists
+    heading = SCENARIO_HEADING.search(content)
+    preamble = content[: heading.start()] if heading else content
+    titles = [
+        scenario.title or scenario.id for scenario in parse_test_cases(content)
+    ]
+    return preamble.rstrip(), titles
+
+
+def case_section(content):
+    # Test cases of one scenario, without anything the model put before
+    # the first test case (e.g. a repeated scenario heading)
+    heading = CASE_HEADING.search(content)
+    if heading is None:
+        return ""
+    return SEPARATOR.sub("", content[heading.start() :].rstrip())
+
+
+def renumber_cases(section, first):
+    # Rewrites TC ids to continue from first; returns (section, count)
+    count = 0
+
+    def replace(match):
+        nonlocal count
+        count += 1
+        return f"{match.group(1)}TC_{first + count - 1:02d}"
+
+    return CASE_ID.sub(replace, section), count
+
+
+def merge_document(preamble, titles, sections):
+    lines = [preamble, ""]
+    if "test scenarios & test cases" not in preamble.lower():
+        lines += ["---", "### **Test Scenarios & Test Cases**  ", ""]
+
+    next_case = 1
+    for number, (title, section) in enumerate(zip(titles, sections), 1):
+        section, count = renumber_cases(case_section(section), next_case)
+        next_case += count
+        lines += [
+            f"#### **Test Scenario ID: TS_{number:02d}**  ",
+            f"**Test Scenario:** {title}  ",
+            "",
+            section,
+            "",
+            "---",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+async def generate_two_phase(call, outline_prompt, scenario_prompt):
+    # call(prompt, expected_tokens) -> (content, usage) runs one model
+    # call; scenario_prompt(title) builds the prompt for one scenario.
+    # Returns the merged document and the usage of every call.
+    outline, outline_usage = await call(outline_prompt, OUTLINE_COMPLETION_TOKENS)
+    preamble, titles = split_outline(outline)
+    if not titles:
+        raise ValueError("Scenario outline contained no test scenarios")
+
+    results = await asyncio.gather(
+        *(
+            call(scenario_prompt(title), SCENARIO_COMPLETION_TOKENS)
+            for title in titles
+        )
+    )
+    content = merge_document(preamble, titles, [text for text, _ in results])
+    return content, [outline_usage] + [usage for _, usage in results]
@@ -0,0 +1,303 @@
+import os
+
+from scripts import two_phase
+from scripts.incremental import (
+    assign_case_ids,
+    id_number,
+    scenario_block,
+    split_scenarios,
+    verbatim,
+)
+from scripts.metrics import Counter
+from scripts.parser import CASE_ID, parse_test_cases
+
+# Checks a generated document against the test_case_prompt output
+# contract (11+ scenarios, 2+ test cases each, every field filled in) and
+# repairs it in place. Instead of rerunning the whole generation, the
+# model is asked only for the broken test cases, the test cases a thin
+# scenario lacks and the scenarios missing altogether; what comes back is
+# spliced into the document by TS_/TC_ id:
+#
+# - a broken test case is replaced, keeping its id
+# - extra test cases are numbered after the highest TC id in the document
+# - new scenarios are numbered after the highest TS id, at the end
+
+MIN_SCENARIOS = int(os.getenv("FORMAT_MIN_SCENARIOS", "11"))
+MIN_CASES_PER_SCENARIO = 2
+# Repair calls per document; 0 only validates
+REPAIR_ATTEMPTS = int(os.getenv("FORMAT_REPAIR_ATTEMPTS", "1"))
+
+REQUIRED_FIELDS = {
+    "title": "Test Case",
+    "preconditions": "Preconditions",
+    "test_data": "Test Data",
+    "steps": "Test Execution Steps",
+    "expected_outcome": "Expected Outcome",
+    "pass_criteria": "Pass",
+    "fail_criteria": "Fail",
+    "priority": "Priority",
+    "references": "References",
+}
+PRIORITIES = {"low", "medium", "high"}
+
+# Finish reasons of a completion that hit the output token limit
+TRUNCATED = {"MAX_TOKENS", "LENGTH"}
+
+# Completion sizes assumed when reserving tokens-per-minute quota
+CASE_COMPLETION_TOKENS = 250
+SCENARIO_COMPLETION_TOKENS = two_phase.SCENARIO_COMPLETION_TOKENS
+
+format_validations = Counter(
+    "format_validations_total",
+    "Generated documents checked against the output format, by outcome",
+    labels=("outcome",),
+)
+
+
+def hit_token_limit(response_metadata):
+    # Gemini reports MAX_TOKENS (or FinishReason.MAX_TOKENS), others length
+    reason = str((response_metadata or {}).get("finish_reason") or "")
+    return reason.rsplit(".", 1)[-1].upper() in TRUNCATED
+
+
+def case_sections(text):
+    # (TC id number, markdown) of every test case in a scenario's text
+    starts = [heading.start() for heading in two_phase.CASE_HEADING.finditer(text)]
+    sections = []
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        section = two_phase.SEPARATOR.sub("", text[start:end].rstrip())
+        case_id = CASE_ID.search(section)
+        sections.append((id_number(case_id.group(1) if case_id else None), section))
+    return sections
+
+
+def missing_fields(case):
+    missing = [label for name, label in REQUIRED_FIELDS.items() if not case[name]]
+    priority = (case["priority"] or "").strip(" .").lower()
+    if priority and priority not in PRIORITIES:
+        missing.append("Priority as Low, Medium or High")
+    return missing
+
+
+class Validation:
+    # Problems of one document: broken test cases by scenario, test cases
+    # thin scenarios lack and scenarios the document lacks
+
+    def __init__(self, content, truncated=False, min_scenarios=MIN_SCENARIOS):
+        self.content = content
+        self.min_scenarios = min_scenarios
+        self.preamble, self.blocks = split_scenarios(content)
+        self.issues = []
+        self.broken = {}  # block index -> {TC number: problem}
+        self.missing_cases = {}  # block index -> test cases to add
+        self.missing_titles = set()  # block indexes
+        self.test_cases = 0
+
+        last = len(self.blocks) - 1
+        for index, block in enumerate(self.blocks):
+            cases = parse_test_cases(block.text)[0].test_cases
+            self.test_cases += len(cases)
+            if not block.title:
+                self.missing_titles.add(index)
+                self._issue(block.id, None, "missing Test Scenario title")
+            for position, case in enumerate(cases):
+                case = case.to_dict()
+                missing = missing_fields(case)
+                if missing:
+                    problem = f"missing {', '.join(missing)}"
+                elif truncated and index == last and position == len(cases) - 1:
+                    # Cut off in its last field
+                    problem = "cut off"
+                else:
+                    continue
+                self.broken.setdefault(index, {})[id_number(case["id"])] = problem
+                self._issue(block.id, case["id"], problem)
+            if len(cases) < MIN_CASES_PER_SCENARIO:
+                needed = MIN_CASES_PER_SCENARIO - len(cases)
+                self.missing_cases[index] = needed
+                self._issue(
+                    block.id,
+                    None,
+                    f"{len(cases)} test cases, add at least {needed} more",
+                )
+
+        self.missing_scenarios = max(0, min_scenarios - len(self.blocks))
+        if self.missing_scenarios:
+            self._issue(
+                None,
+                None,
+                f"{len(self.blocks)} test scenarios, "
+                f"add at least {self.missing_scenarios} more",
+            )
+
+    def _issue(self, scenario_id, case_id, problem):
+        self.issues.append(
+            {"scenario": scenario_id, "test_case": case_id, "problem": problem}
+        )
+
+    @property
+    def valid(self):
+        return not self.issues
+
+    def next_case(self):
+        return 1 + max(
+            (id_number(case_id) for block in self.blocks for case_id in block.case_ids),
+            default=0,
+        )
+
+    def next_scenario(self):
+        return 1 + max((id_number(block.id) for block in self.blocks), default=0)
+
+    def problems(self):
+        lines = []
+        for issue in self.issues:
+            where = issue["scenario"] or "Document"
+            if issue["test_case"]:
+                where = f"{where} / {issue['test_case']}"
+            lines.append(f"- {where}: {issue['problem']}")
+        return "\n".join(lines)
+
+    def prompt_fields(self):
+        # Inputs of the format repair prompt besides the story itself
+        affected = sorted(
+            set(self.broken) | set(self.missing_cases) | self.missing_titles
+        )
+        sections = "\n".join(verbatim(self.blocks[index]) for index in affected)
+        existing = "\n".join(
+            f"- {block.id}: {block.title or 'untitled'}" for block in self.blocks
+        )
+        return {
+            "problems": self.problems(),
+            "sections": sections.strip() or "None",
+            "existing": existing or "None",
+            "next_case": f"TC_{self.next_case():02d}",
+            "next_scenario": f"TS_{self.next_scenario():02d}",
+        }
+
+    def expected_tokens(self):
+        cases = sum(len(broken) for broken in self.broken.values())
+        cases += sum(self.missing_cases.values())
+        return (
+            cases * CASE_COMPLETION_TOKENS
+            + self.missing_scenarios * SCENARIO_COMPLETION_TOKENS
+        )
+
+    def report(self):
+        return {
+            "valid": self.valid,
+            "scenarios": len(self.blocks),
+            "test_cases": self.test_cases,
+            "issues": self.issues,
+        }
+
+
+def splice(validation, repair_content):
+    # The document with the repaired sections in place; returns (content,
+    # changes). Sections nobody asked for are ignored.
+    _, returned_blocks = split_scenarios(repair_content)
+    positions = {id_number(block.id): i for i, block in enumerate(validation.blocks)}
+    next_case = validation.next_case()
+    next_scenario = validation.next_scenario()
+    changes = {"test_cases_replaced": [], "test_cases_added": [], "scenarios_added": []}
+
+    revised = {}  # block index -> (title, [case markdown])
+    added = []
+    for block in returned_blocks:
+        returned = case_sections(block.text)
+        index = positions.get(id_number(block.id))
+        if index is None:
+            if not returned or len(added) >= validation.missing_scenarios:
+                continue
+            section, assigned, next_case = assign_case_ids(
+                "\n\n".join(text for _, text in returned), [], next_case
+            )
+            scenario_id = f"TS_{next_scenario:02d}"
+            next_scenario += 1
+            title = block.title or scenario_id
+            added.append(scenario_block(scenario_id, title, section))
+            changes["scenarios_added"].append(scenario_id)
+            changes["test_cases_added"] += assigned
+            continue
+
+        original = validation.blocks[index]
+        title, cases = revised.get(index) or (
+            original.title,
+            case_sections(original.text),
+        )
+        if index in validation.missing_titles and block.title:
+            title = block.title
+        broken = set(validation.broken.get(index, ()))
+        for number, text in returned:
+            current = [case_number for case_number, _ in cases]
+            if number in broken:
+                broken.discard(number)
+                cases[current.index(number)] = (number, text)
+                changes["test_cases_replaced"].append(CASE_ID.search(text).group(1))
+            elif number not in current and index in validation.missing_cases:
+                text, assigned, next_case = assign_case_ids(text, [], next_case)
+                cases.append((id_number(assigned[0]), text))
+                changes["test_cases_added"] += assigned
+            # Anything else repeats an intact test case
+        revised[index] = (title, cases)
+
+    parts = [validation.preamble]
+    for index, block in enumerate(validation.blocks):
+        if index not in revised:
+            parts.append(verbatim(block))
+            continue
+        title, cases = revised[index]
+        section = "\n\n".join(text for _, text in cases)
+        parts.append(scenario_block(block.id, title or block.id, section))
+    return "".join(parts + added), changes
+
+
+def validation_report(content):
+    # Outcome of a document checked without repairing it, e.g. one cached
+    # before results carried a validation report
+    validation = Validation(content)
+    report = validation.report()
+    report["outcome"] = "valid" if validation.valid else "invalid"
+    return report
+
+
+async def validate_and_repair(
+    content, call, repair_prompt, truncated=False, attempts=REPAIR_ATTEMPTS
+):
+    # call(prompt, expected_tokens) -> (content, usage) runs one model
+    # call; repair_prompt(validation) builds the repair prompt. Returns
+    # (content, usages of the repair calls, validation report). A failed
+    # repair call keeps the document as it was, reported as invalid with
+    # the error, so the completion already paid for is not lost.
+    initial = validation = Validation(content, truncated)
+    usages = []
+    changes = {}
+    error = None
+    while not validation.valid and len(usages) < attempts:
+        prompt = repair_prompt(validation)
+        try:
+            text, usage = await call(prompt, validation.expected_tokens())
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            break
+        usages.append(usage)
+        content, spliced = splice(validation, text)
+        for name, ids in spliced.items():
+            changes[name] = changes.get(name, []) + ids
+        validation = Validation(content, min_scenarios=validation.min_scenarios)
+
+    report = validation.report()
+    if initial.valid:
+        report["outcome"] = "valid"
+    else:
+        report["outcome"] = "repaired" if validation.valid else "invalid"
+        report["repair"] = {
+            "issues": initial.issues,
+            "llm_calls": len(usages),
+            "prompt_tokens": sum(usage["prompt_tokens"] for usage in usages),
+            "completion_tokens": sum(usage["completion_tokens"] for usage in usages),
+            **changes,
+        }
+        if error is not None:
+            report["repair"]["error"] = error
+    format_validations.inc(outcome=report["outcome"])
+    return content, usages, report
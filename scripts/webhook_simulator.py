@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import time
+from contextlib import AsyncExitStack
+
+import httpx
+
+from scripts.benchmark import latency_summary
+
+# Sends Jira issue webhooks to /webhooks/jira the way a team editing
+# stories would: every story is created, then edited in a quick burst,
+# with status changes mixed in. Checks that the bursts were debounced
+# into one job per story and that the stories are cached afterwards.
+#
+#   LLM_PROVIDER=fake python -m scripts.webhook_simulator --issues 20 --edits 5
+#   python -m scripts.webhook_simulator --url http://localhost:8000 --secret s3cr3t
+
+
+def issue_event(site, number, revision, changed_field=None):
+    key = f"SIM-{number}"
+    issue_id = str(10000 + number)
+    event = {
+        "timestamp": int(time.time() * 1000),
+        "webhookEvent": (
+            "jira:issue_updated" if changed_field else "jira:issue_created"
+        ),
+        "issue": {
+            "id": issue_id,
+            "self": f"{site}/rest/api/2/issue/{issue_id}",
+            "key": key,
+            "fields": {
+                "summary": f"Simulated story {number} (revision {revision})",
+                "description": (
+                    f"As a user I want simulated capability {number} "
+                    "so that webhooks can be tested."
+                ),
+                "issuetype": {"name": "Story"},
+                "priority": {"name": "Medium"},
+                "status": {"name": "In Progress" if revision % 2 else "To Do"},
+                "labels": ["simulated"],
+            },
+        },
+    }
+    if changed_field:
+        event["changelog"] = {"items": [{"field": changed_field}]}
+    return event
+
+
+def story_payload(event):
+    # What a user opening the story would send to /generate-test-cases
+    fields = event["issue"]["fields"]
+    user_story = f"{fields['summary']}\n\n{fields['description'] or ''}".strip()
+    return {"user_story": user_story, "jira_id": event["issue"]["key"]}
+
+
+def signed_headers(secret, body):
+    if not secret:
+        return {"content-type": "application/json"}
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return {
+        "content-type": "application/json",
+        "x-hub-signature": f"sha256={digest}",
+    }
+
+
+class Simulation:
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.latencies = []
+        self.outcomes = {}
+        self.job_ids = set()
+        self.final_events = {}
+        self.failures = []
+
+    async def send(self, event):
+        body = json.dumps(event).encode()
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(
+                "/webhooks/jira",
+                content=body,
+                headers=signed_headers(self.args.secret, body),
+            )
+            response.raise_for_status()
+            reply = response.json()
+        except Exception as e:
+            self.failures.append(f"{event['issue']['key']}: {e}")
+            return
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+        outcome = reply["status"]
+        if outcome == "scheduled":
+            outcome = "debounced" if reply["debounced"] else "scheduled"
+            self.job_ids.add(reply["job_id"])
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    async def edit_story(self, number):
+        site = self.args.site
+        event = issue_event(site, number, 0)
+        await self.send(event)
+        for revision in range(1, self.args.edits + 1):
+            await asyncio.sleep(self.args.edit_interval)
+            if revision % 3 == 0:
+                # Status changes do not touch the prompt and are ignored
+                await self.send(issue_event(site, number, revision - 1, "status"))
+            event = issue_event(site, number, revision, "summary")
+            await self.send(event)
+        self.final_events[number] = event
+
+    async def wait_for_jobs(self):
+        statuses = {}
+        deadline = time.monotonic() + self.args.timeout
+        for job_id in self.job_ids:
+            while time.monotonic() < deadline:
+                job = (await self.client.get(f"/jobs/{job_id}?wait=30")).json()
+                if job["status"] in ("succeeded", "failed"):
+                    break
+            statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+        return statuses
+
+    async def check_warm(self):
+        # Every story's latest revision should now be answered from cache
+        latencies = []
+        for number in range(1, self.args.issues + 1):
+            event = self.final_events[number]
+            start = time.perf_counter()
+            response = await self.client.post(
+                "/generate-test-cases", json=story_payload(event)
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                self.failures.append(f"SIM-{number}: {response.status_code}")
+        return latencies
+
+
+async def run(args):
+    async with AsyncExitStack() as stack:
+        if args.url:
+            client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        else:
+            # In-process: run the app's lifespan so its job workers start
+            from app import app
+
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app),
+                base_url="http://webhook-simulator",
+                timeout=args.timeout,
+            )
+        await stack.enter_async_context(client)
+        simulation = Simulation(client, args)
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(simulation.edit_story(number) for number in range(1, args.issues + 1))
+        )
+        sent = time.perf_counter() - start
+
+        report = {
+            "issues": args.issues,
+            "events": len(simulation.latencies),
+            "send_seconds": sent,
+            "outcomes": simulation.outcomes,
+            "jobs": len(simulation.job_ids),
+            "webhook_latency_seconds": latency_summary(simulation.latencies),
+        }
+        if len(simulation.job_ids) > args.issues:
+            simulation.failures.append(
+                f"{len(simulation.job_ids)} jobs for {args.issues} stories"
+            )
+        if args.wait:
+            before = (await client.get("/cache/stats")).json()["test_cases"]
+            report["job_statuses"] = await simulation.wait_for_jobs()
+            warm = await simulation.check_warm()
+            after = (await client.get("/cache/stats")).json()["test_cases"]
+            report["warm_latency_seconds"] = latency_summary(warm)
+            report["warm_cache_hits"] = after["hits"] - before["hits"]
+            if report["warm_cache_hits"] < args.issues:
+                simulation.failures.append(
+                    f"only {report['warm_cache_hits']} of {args.issues} "
+                    "stories were cached"
+                )
+
+    report["failures"] = len(simulation.failures)
+    report["failure_samples"] = simulation.failures[:10]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate Jira issue webhooks")
+    parser.add_argument("--url", help="API under test, defaults to app.app in-process")
+    parser.add_argument("--issues", type=int, default=10)
+    parser.add_argument("--edits", type=int, default=5)
+    parser.add_argument("--edit-interval", type=float, default=0.2)
+    parser.add_argument("--site", default="https://simulated.atlassian.net")
+    parser.add_argument("--secret", help="JIRA_WEBHOOK_SECRET the API expects")
+    parser.add_argument(
+        "--no-wait",
+        dest="wait",
+        action="store_false",
+        help="only send the events, do not wait for the generations",
+    )
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    if not args.url:
+        os.environ.setdefault("LLM_PROVIDER", "fake")
+        os.environ.setdefault("WEBHOOK_DEBOUNCE_SECONDS", "2")
+        os.environ.setdefault("JOB_DB_PATH", ".cache/webhook_simulator_jobs.sqlite3")
+        # The API rejects unsigned events
+        args.secret = args.secret or "simulator"
+        os.environ.setdefault("JIRA_WEBHOOK_SECRET", args.secret)
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if report["failures"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import hashlib
+import hmac
+from urllib.parse import urlsplit
+
+from scripts.metrics import Counter
+
+# Jira issue webhooks. Stories are generated in the background when they
+# are created or their prompt inputs change, so the result cache is warm
+# by the time somebody asks for the test cases.
+
+ISSUE_EVENTS = ("jira:issue_created", "jira:issue_updated")
+
+# Fields the generation prompt is built from; other edits (status,
+# assignee, ...) do not change the test cases
+PROMPT_FIELDS = {"summary", "description"}
+
+webhook_events = Counter(
+    "jira_webhook_events_total",
+    "Jira webhook events received, by outcome",
+    labels=("outcome",),
+)
+
+
+def valid_signature(secret, body, header):
+    # Jira signs the raw body with the webhook secret:
+    # X-Hub-Signature: sha256=<hex HMAC>
+    if not header or not header.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, header[len("sha256=") :])
+
+
+def issue_tenant(issue):
+    # Jira site the event came from, the scheduler's tenant
+    parts = urlsplit(issue.get("self") or "")
+    return f"{parts.scheme}://{parts.netloc}" if parts.netloc else None
+
+
+def ignore_reason(event, issue_types):
+    # Why an event does not need a generation, None if it does
+    if event.get("webhookEvent") not in ISSUE_EVENTS:
+        return "event"
+
+    issue = event.get("issue") or {}
+    if not issue.get("key"):
+        return "event"
+    issue_type = ((issue.get("fields") or {}).get("issuetype") or {}).get("name")
+    if issue_type and issue_type.lower() not in issue_types:
+        return "issue_type"
+
+    if event["webhookEvent"] == "jira:issue_updated":
+        items = (event.get("changelog") or {}).get("items")
+        # Without a changelog the edit could have touched anything
+        if items is not None and not any(
+            (item.get("field") or "").lower() in PROMPT_FIELDS for item in items
+        ):
+            return "fields"
+    return None